@@ -9,14 +9,17 @@ Actions that perform cleaning
 """
 
 # standard imports
+import contextlib
 import glob
 import logging
 import os
 import re
+import threading
+from collections import OrderedDict
 from itertools import product
 
 # first party imports
-from bleachbit import Command, FileUtilities, General, Special, DeepScan, Cookie as CookieMod  # mod=module
+from bleachbit import Command, FileUtilities, General, DeepScan, Cookie as CookieMod  # mod=module
 from bleachbit import FS_SCAN_RE_FLAGS, IS_POSIX, IS_WINDOWS
 from bleachbit.Constant import CLEAN_FILE_LABEL
 from bleachbit.Cookie import load_keep_list
@@ -38,6 +41,148 @@ def has_glob(s):
     return _GLOB_CHARS_RE.search(s) is not None
 
 
+def static_root(path):
+    """Return the part of an action path before the first glob component"""
+    parts = path.split(os.sep)
+    for i, part in enumerate(parts):
+        if has_glob(part):
+            return os.sep.join(parts[:i]) or os.sep
+    return path
+
+
+def _cache_key_path(path):
+    return os.path.normcase(os.path.normpath(path))
+
+
+class WalkCache:
+
+    """Least-recently-used cache of the paths found by file searches
+
+    Many cleaners search the same directories under several options, such
+    as a browser profile. The cache keeps the unfiltered results of each
+    (search, path), so each option applies its own filters to one walk.
+
+    Results are cached only inside session(), which Worker holds for one
+    preview or clean, because outside of that nothing tells the cache when
+    files change. Within a session, Command calls invalidate() for each
+    path it deletes, which drops the results of searches under any of its
+    ancestors. A walk during which anything was invalidated is not cached.
+    """
+
+    def __init__(self, max_paths=100000):
+        self.max_paths = max_paths
+        self._entries = OrderedDict()  # key -> (root, paths)
+        self._by_root = {}  # root -> set of keys
+        self._n_paths = 0
+        self._sessions = 0
+        self._generation = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @contextlib.contextmanager
+    def session(self):
+        """Enable the cache for the duration of a with block"""
+        with self._lock:
+            self._sessions += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._sessions -= 1
+                if not self._sessions:
+                    logger.debug('walk cache: %d hits, %d misses',
+                                 self.hits, self.misses)
+                    self.clear()
+
+    def clear(self):
+        """Forget all results and reset the counters"""
+        with self._lock:
+            self._entries.clear()
+            self._by_root.clear()
+            self._n_paths = 0
+            self.hits = 0
+            self.misses = 0
+
+    def get(self, search, path):
+        """Return the cached list of paths, or None"""
+        key = (search, path)
+        with self._lock:
+            if not self._sessions:
+                return None
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def record(self, search, path, results):
+        """Yield from results and cache their paths if the walk completes"""
+        with self._lock:
+            generation = self._generation
+            enabled = self._sessions > 0
+        if not enabled:
+            yield from results
+            return
+        paths = []
+        for result in results:
+            if paths is not None:
+                if len(paths) < self.max_paths:
+                    # Cache only the path: a cached stat would be stale
+                    # by the time the cache is replayed.
+                    paths.append(os.fspath(result))
+                else:
+                    paths = None
+            yield result
+        if paths is not None:
+            self._put((search, path), static_root(path), paths, generation)
+
+    def _put(self, key, root, paths, generation):
+        root = _cache_key_path(root)
+        with self._lock:
+            if generation != self._generation or not self._sessions:
+                return
+            self._discard(key)
+            self._entries[key] = (root, paths)
+            self._by_root.setdefault(root, set()).add(key)
+            self._n_paths += len(paths)
+            while self._n_paths > self.max_paths:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        (root, paths) = entry
+        self._n_paths -= len(paths)
+        keys = self._by_root[root]
+        keys.discard(key)
+        if not keys:
+            del self._by_root[root]
+
+    def invalidate(self, path):
+        """Forget the results of searches that may include path"""
+        path = _cache_key_path(path)
+        with self._lock:
+            self._generation += 1
+            if not self._by_root:
+                return
+            # A search may list the path itself or anything below its root.
+            while True:
+                for key in list(self._by_root.get(path, ())):
+                    self._discard(key)
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
+
+
+walk_cache = WalkCache()
+Command.invalidation_hooks.append(walk_cache.invalidate)
+
+
 def expand_multi_var(s, variables):
     """Expand strings with potentially-multiple values.
 
@@ -74,6 +219,20 @@ def expand_multi_var(s, variables):
     # The string has $$, but it did not match anything
     return (s,)
 
+
+def _is_file(entry):
+    """Like os.path.isfile(), but a scan entry needs no stat"""
+    if isinstance(entry, FileUtilities.ScanEntry):
+        return entry.is_file()
+    return os.path.isfile(entry)
+
+
+def _is_dir(entry):
+    """Like os.path.isdir(), but a scan entry needs no stat"""
+    if isinstance(entry, FileUtilities.ScanEntry):
+        return entry.is_dir()
+    return os.path.isdir(entry)
+
 #
 # Plugin framework
 # http://martyalchin.com/2008/jan/10/simple-plugin-framework/
@@ -113,9 +272,7 @@ class FileActionProvider(ActionProvider):
 
     """Base class for providers which work on individual files"""
     action_key = '_file'
-    CACHEABLE_SEARCHERS = ('walk.files',)
-    # global cache <search_type, path, list_of_entries, complete>
-    cache = ('nothing', '', tuple(), False)
+    CACHEABLE_SEARCHERS = ('glob', 'walk.all', 'walk.files', 'walk.top')
 
     def __init__(self, action_element, path_vars=None):
         """Initialize file search"""
@@ -150,8 +307,28 @@ class FileActionProvider(ActionProvider):
                                        self.wholeregex, self.nwholeregex])
 
     def _set_paths(self, raw_path, path_vars):
-        """Set the list of paths to work on"""
-        self.paths = []
+        """Set the path to work on, which is expanded on first use
+
+        A cleaner has many actions, and a run usually uses a few options,
+        so most paths are never expanded.
+        """
+        self._raw_path = raw_path
+        self._path_vars = path_vars
+        self._paths = None
+
+    @property
+    def paths(self):
+        """Return the list of expanded paths"""
+        if self._paths is None:
+            self._paths = self._expand_paths(self._raw_path, self._path_vars)
+            # Free the variables.
+            self._path_vars = None
+        return self._paths
+
+    @staticmethod
+    def _expand_paths(raw_path, path_vars):
+        """Return the list of paths from a path with variables"""
+        expanded = []
         # expand special $$foo$$ which may give multiple values
         for path2 in expand_multi_var(raw_path, path_vars):
             if IS_WINDOWS:
@@ -165,7 +342,8 @@ class FileActionProvider(ActionProvider):
                     # and for display.  Do not convert an empty path, or it will become
                     # the current directory (.).
                     path3 = os.path.normpath(path3)
-                self.paths.append(path3)
+                expanded.append(path3)
+        return expanded
 
     def get_deep_scan(self):
         if self.ds is None:
@@ -173,7 +351,17 @@ class FileActionProvider(ActionProvider):
         yield self.ds
 
     def get_paths(self):
-        """Dispatch to fast or filtered path retrieval based on filter configuration."""
+        """Yield each path as a string"""
+        for entry in self.get_entries():
+            yield os.fspath(entry)
+
+    def get_entries(self):
+        """Like get_paths(), but directory walks yield FileUtilities.ScanEntry
+
+        Other searches yield path strings, so use os.fspath() on the result.
+        This dispatches to fast or filtered path retrieval based on filter
+        configuration.
+        """
         if self._use_fast_path:
             yield from self._get_paths()
         else:
@@ -214,7 +402,8 @@ class FileActionProvider(ActionProvider):
         else:
             nwholeregex_c_search = None
 
-        for path in self._get_paths():
+        for entry in self._get_paths():
+            path = os.fspath(entry)
             if regex and not regex_c_search(basename(path)):
                 continue
 
@@ -228,15 +417,19 @@ class FileActionProvider(ActionProvider):
                 continue
 
             if object_type:
-                if 'f' == object_type and not os.path.isfile(path):
+                if 'f' == object_type and not _is_file(entry):
                     continue
-                if 'd' == object_type and not os.path.isdir(path):
+                if 'd' == object_type and not _is_dir(entry):
                     continue
 
-            yield path
+            yield entry
 
     def _get_paths(self):
-        """Return a filtered list of files"""
+        """Return a filtered list of files
+
+        Directory walks yield FileUtilities.ScanEntry, and the other
+        searches yield path strings.
+        """
 
         def get_file(path):
             if os.path.lexists(path):
@@ -246,7 +439,7 @@ class FileActionProvider(ActionProvider):
             """Delete files and directories inside a directory but not the top directory"""
             for expanded in glob.iglob(top):
                 path = None  # sentinel value
-                yield from FileUtilities.children_in_directory(expanded, True)
+                yield from FileUtilities.children_in_directory_entries(expanded, True)
                 # This condition executes when there are zero iterations
                 # in the loop above.
                 if path is None:
@@ -265,7 +458,7 @@ class FileActionProvider(ActionProvider):
         def get_walk_files(top):
             """Delete files inside a directory but not any directories"""
             for expanded in glob.iglob(top):
-                yield from FileUtilities.children_in_directory(expanded, False)
+                yield from FileUtilities.children_in_directory_entries(expanded, False)
 
         def get_top(top):
             """Delete directory contents and the directory itself"""
@@ -289,7 +482,6 @@ class FileActionProvider(ActionProvider):
 
         func = search_functions[self.search]
 
-        cache = self.__class__.cache
         for input_path in self.paths:
             if self.search == 'glob' and not has_glob(input_path):
                 # TRANSLATORS: This is a lint-style warning that the CleanerML file
@@ -299,28 +491,14 @@ class FileActionProvider(ActionProvider):
                 # expect or support wildcards in the path.
                 logger.debug(_('path="%s" is not a glob pattern'), input_path)
 
-            # use cache
-            if (self.search in self.CACHEABLE_SEARCHERS and cache[0] == self.search
-                    and cache[1] == input_path and cache[3]):
-                for x in cache[2]:
-                    yield x
-                return
-            self.__class__.cache = ('cleared by', input_path, tuple(), False)
-
-            # build new cache
-            if self.search in self.CACHEABLE_SEARCHERS:
-                entries = []
-                self.__class__.cache = (
-                    self.search, input_path, entries, False)
-                for path in func(input_path):
-                    entries.append(path)
-                    yield path
-                # Mark complete only once the walk finishes, so an
-                # early-abandoned generator doesn't poison the cache
-                self.__class__.cache = (self.search, input_path, entries, True)
-            else:
-                for path in func(input_path):
-                    yield path
+            if self.search not in self.CACHEABLE_SEARCHERS:
+                yield from func(input_path)
+                continue
+            cached = walk_cache.get(self.search, input_path)
+            if cached is not None:
+                yield from cached
+                continue
+            yield from walk_cache.record(self.search, input_path, func(input_path))
 
     def get_commands(self):
         raise NotImplementedError('not implemented')
@@ -389,6 +567,7 @@ class ChromeAutofill(FileActionProvider):
     action_key = 'chrome.autofill'
 
     def get_commands(self):
+        from bleachbit import Special  # pylint: disable=import-outside-toplevel
         for path in self.get_paths():
             yield Command.Function(
                 path,
@@ -402,6 +581,7 @@ class ChromeDatabases(FileActionProvider):
     action_key = 'chrome.databases_db'
 
     def get_commands(self):
+        from bleachbit import Special  # pylint: disable=import-outside-toplevel
         for path in self.get_paths():
             yield Command.Function(
                 path,
@@ -415,6 +595,7 @@ class ChromeFavicons(FileActionProvider):
     action_key = 'chrome.favicons'
 
     def get_commands(self):
+        from bleachbit import Special  # pylint: disable=import-outside-toplevel
         for path in self.get_paths():
             yield Command.Function(
                 path,
@@ -428,6 +609,7 @@ class ChromeHistory(FileActionProvider):
     action_key = 'chrome.history'
 
     def get_commands(self):
+        from bleachbit import Special  # pylint: disable=import-outside-toplevel
         for path in self.get_paths():
             yield Command.Function(
                 path,
@@ -441,6 +623,7 @@ class ChromeKeywords(FileActionProvider):
     action_key = 'chrome.keywords'
 
     def get_commands(self):
+        from bleachbit import Special  # pylint: disable=import-outside-toplevel
         for path in self.get_paths():
             yield Command.Function(
                 path,
@@ -465,7 +648,7 @@ class Cookie(FileActionProvider):
         # Otherwise, clean cookies using the keep list.
         for path in self.get_paths():
             def delete_func(p=path):
-                # perform deletion; return value is ignored by Command.Function for file paths
+                # perform deletion; Command.Function measures the file size
                 try:
                     CookieMod.delete_cookies(p, keep_list, really_delete=True)
                 except Exception as e:
@@ -508,14 +691,21 @@ class Cookie(FileActionProvider):
         return result.get('file_size_reduction', 0)
 
 
+def _lstat_of(entry):
+    """Return the lstat() result of a scan entry, or None for a path string"""
+    if isinstance(entry, FileUtilities.ScanEntry):
+        return entry.lstat()
+    return None
+
+
 class Delete(FileActionProvider):
 
     """Action to delete files"""
     action_key = 'delete'
 
     def get_commands(self):
-        for path in self.get_paths():
-            yield Command.Delete(path)
+        for entry in self.get_entries():
+            yield Command.Delete(os.fspath(entry), lstat_result=_lstat_of(entry))
 
 
 class Ini(FileActionProvider):
@@ -569,6 +759,7 @@ class MozillaUrlHistory(FileActionProvider):
     action_key = 'mozilla.url.history'
 
     def get_commands(self):
+        from bleachbit import Special  # pylint: disable=import-outside-toplevel
         for path in self.get_paths():
             yield Command.Function(path,
                                    Special.delete_mozilla_url_history,
@@ -581,6 +772,7 @@ class MozillaFavicons(FileActionProvider):
     action_key = 'mozilla.favicons'
 
     def get_commands(self):
+        from bleachbit import Special  # pylint: disable=import-outside-toplevel
         for path in self.get_paths():
             yield Command.Function(path,
                                    Special.delete_mozilla_favicons,
@@ -593,6 +785,7 @@ class OfficeRegistryModifications(FileActionProvider):
     action_key = 'office_registrymodifications'
 
     def get_commands(self):
+        from bleachbit import Special  # pylint: disable=import-outside-toplevel
         for path in self.get_paths():
             yield Command.Function(
                 path,
@@ -650,6 +843,8 @@ class SqliteVacuum(FileActionProvider):
 
     def get_commands(self):
         for path in self.get_paths():
+            # Whether the vacuum is worth it is decided when it runs,
+            # because an earlier action may free pages in the database.
             yield Command.Function(
                 path,
                 FileUtilities.vacuum_sqlite3,
@@ -657,7 +852,8 @@ class SqliteVacuum(FileActionProvider):
                 # from the SQLite database.  Microsoft Access uses
                 # the term 'Compact Database' (which you may translate
                 # instead).  Another synonym is 'defragment.'
-                _('Vacuum'))
+                _('Vacuum'),
+                preview_func=lambda path=path: FileUtilities.sqlite_vacuum_size(path))
 
 
 class Truncate(FileActionProvider):
@@ -15,7 +15,7 @@ import sys
 
 from bleachbit.Cleaner import backends, create_simple_cleaner, register_cleaners
 from bleachbit import APP_VERSION, stdout_encoding, IS_WINDOWS
-from bleachbit import SystemInformation, Options, Worker
+from bleachbit import SystemInformation, Options
 from bleachbit.Bootstrap import bootstrap
 from bleachbit.Language import get_text as _
 from bleachbit.Log import set_root_log_level
@@ -89,14 +89,17 @@ def list_cleaners():
         print(cleaner)
 
 
-def preview_or_clean(operations, really_clean, quiet=False):
-    """Preview deletes and other changes"""
+def preview_or_clean(operations, really_clean, quiet=False, plan=None):
+    """Preview deletes and other changes
+
+    plan is an optional Plan.Plan for a preview to record or a clean
+    to replay.
+    """
     cb = CliCallback(quiet)
-    worker = Worker.Worker(cb, really_clean, operations).run()
+    from bleachbit import Worker  # pylint: disable=import-outside-toplevel
+    worker = Worker.BackgroundWorker(cb, really_clean, operations, plan=plan)
     try:
-        for ret in worker:
-            if not ret:
-                break
+        worker.run_to_end()
     except BrokenPipeError:
         # Propagate to the top-level handler (e.g., when the downstream
         # pipe consumer like `less` or `head` closes early).
@@ -271,6 +274,23 @@ def parse_cmd_line(argv=None):
                       # TRANSLATORS: Help for the --except option on the CLI,
                       # and 'exclude' is a verb.
                       help=_("exclude cleaner options (can be repeated, comma-separated)"))
+    parser.add_option("--worker-threads", type="int", metavar="N",
+                      # TRANSLATORS: Help for the --worker-threads option on the CLI.
+                      # Do not translate N.
+                      help=_("clean up to N independent cleaners at the same time"))
+    parser.add_option("--scan-threads", type="int", metavar="N",
+                      # TRANSLATORS: Help for the --scan-threads option on the CLI.
+                      # Do not translate N.
+                      help=_("list directories using N threads"))
+    parser.add_option("--save-plan", metavar="FILE",
+                      # TRANSLATORS: Help for the --save-plan option on the CLI.
+                      # Do not translate --preview or FILE.
+                      help=_("with --preview, save the list of changes to FILE"))
+    parser.add_option("--apply-plan", metavar="FILE",
+                      # TRANSLATORS: Help for the --apply-plan option on the CLI.
+                      # Do not translate --clean or FILE.
+                      help=_("with --clean, make only the changes listed in FILE, "
+                             "skipping files changed since the preview"))
 
     parser.add_option('--debug',
                       # TRANSLATORS: Help for the --debug option on the CLI,
@@ -339,6 +359,17 @@ def process_cmd_line():
                 'check_online_updates', 'first_start'):
         if hasattr(options, opt) and getattr(options, opt) is not None:
             Options.options.set_override(opt, getattr(options, opt))
+    for opt in ('worker_threads', 'scan_threads'):
+        value = getattr(options, opt)
+        if value is None:
+            continue
+        if value < 1:
+            # TRANSLATORS: Error message shown on CLI. %s is the name of
+            # an option such as --worker-threads.
+            logger.error(_("%s must be at least 1"),
+                         '--' + opt.replace('_', '-'))
+            sys.exit(1)
+        Options.options.set_override(opt, value)
 
     cmd_list = (options.list_cleaners,
                 options.clean,
@@ -401,10 +432,32 @@ There is NO WARRANTY, to the extent permitted by law.
         for wipe_path in args:
             # TRANSLATORS: Shows activity in the CLI, and %s is the path to the directory.
             logger.info(_("Wipe empty space in %s"), wipe_path)
-            import bleachbit.Wipe
-            for _ret in bleachbit.Wipe.wipe_path(wipe_path):
-                pass
+        import bleachbit.Wipe
+        # Paths on different devices are wiped at the same time.
+        for _ret in bleachbit.Wipe.wipe_paths(args):
+            pass
         sys.exit(0)
+    plan = None
+    if options.save_plan and not options.preview:
+        # TRANSLATORS: Error message on the CLI. Do not translate the options.
+        logger.error(_("--save-plan is only for use with --preview"))
+        sys.exit(1)
+    if options.apply_plan:
+        if not options.clean:
+            # TRANSLATORS: Error message on the CLI. Do not translate the options.
+            logger.error(_("--apply-plan is only for use with --clean"))
+            sys.exit(1)
+        from bleachbit.Plan import Plan
+        try:
+            plan = Plan.load(options.apply_plan)
+        except (OSError, ValueError, KeyError) as e:
+            # TRANSLATORS: Error message on the CLI. %s is the error.
+            logger.error(_("Cannot read the plan: %s"), e)
+            sys.exit(1)
+        if not (args or options.preset or options.all_but_warning):
+            args = ['.'.join((cleaner_id, option_id))
+                    for (cleaner_id, option_ids) in plan.operations.items()
+                    for option_id in option_ids]
     operations = {}
     if options.preview or options.clean:
         operations = args_to_operations(
@@ -419,8 +472,23 @@ There is NO WARRANTY, to the extent permitted by law.
                 # TRANSLATORS: '--overwrite' and '--clean' are command line options
                 _("--overwrite is intended only for use with --clean"))
         Options.options.set_override('shred', True)
+    if options.save_plan:
+        from bleachbit.Plan import Plan
+        plan = Plan(operations, Options.options.get('shred'))
+    elif plan is not None and not plan.matches(operations, Options.options.get('shred')):
+        logger.error(
+            # TRANSLATORS: Error message on the CLI.
+            _("The plan was made for other cleaner options or another overwrite setting."))
+        sys.exit(1)
     if options.clean or options.preview:
-        preview_or_clean(operations, options.clean)
+        preview_or_clean(operations, options.clean, plan=plan)
+        if options.save_plan:
+            try:
+                plan.save(options.save_plan)
+            except OSError as e:
+                # TRANSLATORS: Error message on the CLI. %s is the error.
+                logger.error(_("Cannot save the plan: %s"), e)
+                sys.exit(1)
         sys.exit(0)
     if options.gui:
         from bleachbit.Bootstrap import check_wayland_and_root
@@ -18,14 +18,13 @@ import time
 
 from bleachbit.Constant import EMPTY_SPACE_WARNING
 from bleachbit.Language import get_text as _
-from bleachbit.FileUtilities import children_in_directory
+from bleachbit.FileUtilities import children_in_directory, children_in_directory_entries
 from bleachbit.Options import options
 from bleachbit.PathUtils import path_equal
-from bleachbit.Process import is_process_running
-from bleachbit import Action, CleanerML, Command, FileUtilities, General, Memory
+from bleachbit import Action, CleanerML, Command, FileUtilities, General
 from bleachbit import IS_LINUX, IS_MAC, IS_POSIX, IS_WINDOWS
 from bleachbit.GtkShim import gtk_may_be_available
-from bleachbit.Wipe import wipe_path
+from bleachbit.Wipe import wipe_path, wipe_paths
 
 if IS_POSIX:
     from bleachbit import Unix
@@ -160,6 +159,8 @@ class Cleaner:
 
     def is_process_running(self):
         """Return whether the process is currently running"""
+        # psutil is slow to import, and listing cleaners does not need it.
+        from bleachbit.Process import is_process_running  # pylint: disable=import-outside-toplevel
         logger = logging.getLogger(__name__)
         for (test, pathname, same_user) in self.running:
             if 'exe' == test:
@@ -359,9 +360,9 @@ class System(Cleaner):
             if IS_MAC:
                 dirnames.insert(0, os.path.expanduser("~/Library/Caches/"))
             for dirname in dirnames:
-                for filename in children_in_directory(dirname, True):
-                    if not self.whitelisted(filename):
-                        yield Command.Delete(filename)
+                for entry in children_in_directory_entries(dirname, True):
+                    if not self.whitelisted(entry.path):
+                        yield Command.Delete(entry.path, lstat_result=entry.lstat())
 
         # custom
         if 'custom' == option_id:
@@ -456,6 +457,7 @@ class System(Cleaner):
 
         # memory
         if IS_LINUX and 'memory' == option_id:
+            from bleachbit import Memory  # pylint: disable=import-outside-toplevel
             yield Command.Function(None, Memory.wipe_memory, _('Memory'))
 
         # memory dump
@@ -488,7 +490,8 @@ class System(Cleaner):
                 from bleachbit.GtkShim import require_gtk  # pylint: disable=import-outside-toplevel
                 require_gtk()
                 from bleachbit.GtkShim import Gtk  # pylint: disable=import-outside-toplevel
-                Gtk.RecentManager().get_default().purge_items()
+                General.call_in_main_thread(
+                    lambda: Gtk.RecentManager().get_default().purge_items())
                 yield 0
 
             xbel_pathnames = [
@@ -510,15 +513,20 @@ class System(Cleaner):
         # temporary files
         if IS_POSIX and 'tmp' == option_id:
             dirnames = ['/tmp', '/var/tmp']
+            uid = os.getuid()
+            # Running processes may have opened files since the last run.
+            FileUtilities.openfiles.scan()
             for dirname in dirnames:
-                for path in children_in_directory(dirname, True):
-                    is_open = FileUtilities.openfiles.is_open(path)
-                    ok = not is_open and os.path.isfile(path) and \
-                        not os.path.islink(path) and \
-                        FileUtilities.ego_owner(path) and \
-                        not self.whitelisted(path)
+                for entry in children_in_directory_entries(dirname, True):
+                    # The cheap checks come first and reuse the scan's
+                    # metadata. A regular file's lstat() identifies it
+                    # in the index of open files.
+                    ok = entry.is_file(follow_symlinks=False) and \
+                        entry.uid == uid and \
+                        not self.whitelisted(entry.path) and \
+                        not FileUtilities.openfiles.is_open(entry.path, entry.lstat())
                     if ok:
-                        yield Command.Delete(path)
+                        yield Command.Delete(entry.path, lstat_result=entry.lstat())
 
         # temporary files
         if IS_WINDOWS and 'tmp' == option_id:
@@ -565,24 +573,24 @@ class System(Cleaner):
                     from bleachbit.GtkShim import require_gtk  # pylint: disable=import-outside-toplevel
                     require_gtk()
                     import bleachbit.GuiUtil
-                    bleachbit.GuiUtil.clear_clipboard()
+                    General.call_in_main_thread(bleachbit.GuiUtil.clear_clipboard)
                     return 0
             yield Command.Function(None, func_clear_clipboard, _('Clipboard'))
 
         # wipe empty space
         shred_drives = options.get_list('shred_drives')
         if 'empty_space' == option_id and shred_drives:
-            for pathname in shred_drives:
-                # TRANSLATORS: 'Empty' means 'unallocated.'
-                # %s expands to a path such as C:\ or /tmp/
-                display = _("Wipe empty space in %s") % pathname
-
-                def wipe_path_func(path=pathname):
-                    # Yield control to GTK idle because this process
-                    # is very slow.  Also display progress.
-                    yield from wipe_path(path, idle=True)
-                    yield 0
-                yield Command.Function(None, wipe_path_func, display)
+            # TRANSLATORS: 'Empty' means 'unallocated.'
+            # %s expands to a path such as C:\ or /tmp/
+            display = _("Wipe empty space in %s") % ', '.join(shred_drives)
+
+            def wipe_paths_func(paths=tuple(shred_drives)):
+                # Yield control to GTK idle because this process
+                # is very slow.  Also display progress.
+                # Paths on different devices are wiped at the same time.
+                yield from wipe_paths(paths, idle=True)
+                yield 0
+            yield Command.Function(None, wipe_paths_func, display)
 
         # MUICache
         if IS_WINDOWS and 'muicache' == option_id:
@@ -699,7 +707,8 @@ class System(Cleaner):
         for regex in self.regexes_compiled:
             if regex.match(pathname) is not None:
                 return True
-        return False
+        # The user's keep list, so a kept file costs no further checks
+        return options.get_whitelist_index().match(pathname)
 
 
 def register_cleaners(cb_progress=lambda x: None, cb_done=lambda: None, allow_local=True):
@@ -27,11 +27,13 @@ import logging
 import os
 import sys
 import xml.etree.ElementTree
+from concurrent.futures import ThreadPoolExecutor
 
 # local import
 import bleachbit
 from bleachbit import IS_POSIX, IS_WINDOWS
 from bleachbit.Action import ActionProvider
+from bleachbit.CleanerMLCache import cleanerml_cache
 from bleachbit.FileUtilities import expand_glob_join, listdir
 from bleachbit.General import boolstr_to_bool
 from bleachbit.General import os_match as general_os_match
@@ -50,6 +52,9 @@ Deletion stays allowed, so blocking registry deletion too would buy nothing.
 """
 UNTRUSTED_BLOCKED_COMMANDS = ('process',)
 
+# Threads reading and parsing CleanerML files in load_cleaners()
+LOAD_THREADS = 4
+
 
 class _ETSimpleTextNode:
 
@@ -141,11 +146,24 @@ def _parse_cleaner_xml(pathname):
     return xml.etree.ElementTree.fromstring(data)
 
 
+def _read_cleaner_xml(pathname, trusted=True, cache=None):
+    """Return the root element of a CleanerML file, using cache if set
+
+    This is safe to call in a thread.
+    """
+    if cache is None:
+        return _parse_cleaner_xml(pathname)
+    # Actions ignored in untrusted cleaners need not be checked.
+    blocked = UNTRUSTED_BLOCKED_COMMANDS if trusted else ()
+    return cache.parse(pathname, blocked)
+
+
 class CleanerML:
 
     """Create a cleaner from CleanerML"""
 
-    def __init__(self, pathname, xlate_cb=None, trusted=True):
+    def __init__(self, pathname, xlate_cb=None, trusted=True, cache=None,
+                 parsed=None):
         """Create cleaner from XML in pathname.
 
         If xlate_cb is set, use it as a callback for each
@@ -153,6 +171,11 @@ class CleanerML:
 
         trusted is False for cleaners from user-writable directories;
         their command-execution actions are ignored.
+
+        cache is an optional CleanerMLCache to parse the file with.
+
+        parsed is an optional concurrent.futures.Future of the root
+        element, such as from a thread started by load_cleaners().
         """
 
         self.action = None
@@ -172,7 +195,10 @@ class CleanerML:
             self.xlate_mode = True
 
         try:
-            root_element = _parse_cleaner_xml(pathname)
+            if parsed is None:
+                root_element = _read_cleaner_xml(pathname, trusted, cache)
+            else:
+                root_element = parsed.result()
         except Exception as e:
             logger.error(
                 "Error parsing CleanerML file %s with error %s", pathname, e)
@@ -460,29 +486,43 @@ def load_cleaners(cb_progress=lambda x: None, allow_local=True):
     cb_progress(0.0)
     files_done = 0
     not_usable = []
-    for pathname in cleanerml_files:
-        try:
-            xmlcleaner = CleanerML(
-                pathname, trusted=is_trusted_cleaner(pathname))
-        except Exception:
-            # TRANSLATORS: Error message printed to the log.
-            # %s expands to the path of the XML cleaner file
-            logger.exception(_("Error reading cleaner: %s"), pathname)
+    trusted = [is_trusted_cleaner(pathname) for pathname in cleanerml_files]
+    # Reading and parsing the files runs in threads, which overlaps the
+    # waits on a slow disk. The cleaners are created and registered here,
+    # in order, because they share state such as Unix.locales.
+    executor = ThreadPoolExecutor(max_workers=min(LOAD_THREADS, total_files),
+                                  thread_name_prefix='bleachbit-cleanerml')
+    try:
+        futures = [executor.submit(_read_cleaner_xml, pathname, is_trusted, cleanerml_cache)
+                   for (pathname, is_trusted) in zip(cleanerml_files, trusted)]
+        for (pathname, is_trusted, future) in zip(cleanerml_files, trusted, futures):
+            try:
+                xmlcleaner = CleanerML(
+                    pathname, trusted=is_trusted, cache=cleanerml_cache,
+                    parsed=future)
+            except Exception:
+                # TRANSLATORS: Error message printed to the log.
+                # %s expands to the path of the XML cleaner file
+                logger.exception(_("Error reading cleaner: %s"), pathname)
+                files_done += 1
+                cb_progress(1.0 * files_done / total_files)
+                yield True
+                continue
+            cleaner = xmlcleaner.get_cleaner()
+            if cleaner.is_usable():
+                Cleaner.backends[cleaner.id] = cleaner
+            else:
+                if cleaner.id:
+                    not_usable.append(cleaner.id)
+                else:
+                    not_usable.append(os.path.basename(pathname))
             files_done += 1
             cb_progress(1.0 * files_done / total_files)
             yield True
-            continue
-        cleaner = xmlcleaner.get_cleaner()
-        if cleaner.is_usable():
-            Cleaner.backends[cleaner.id] = cleaner
-        else:
-            if cleaner.id:
-                not_usable.append(cleaner.id)
-            else:
-                not_usable.append(os.path.basename(pathname))
-        files_done += 1
-        cb_progress(1.0 * files_done / total_files)
-        yield True
+    finally:
+        # The caller may stop early.
+        executor.shutdown(wait=True, cancel_futures=True)
+    cleanerml_cache.save()
     if not_usable:
         logger.debug(
             "%d cleaners are not usable on this OS because they have no actions: %s", len(not_usable), ', '.join(not_usable))
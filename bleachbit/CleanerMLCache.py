@@ -0,0 +1,234 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright (c) 2008-2026 Andrew Ziem.
+#
+# This work is licensed under the terms of the GNU GPL, version 3 or
+# later.  See the COPYING file in the top-level directory.
+
+"""
+Persistent cache of parsed CleanerML files
+
+Each start reads and parses about a hundred CleanerML files, and it
+checks each one for a DTD. The cache records the element tree of each
+file in one JSON file, keyed by the modification time, change time, and
+size of the file and by a hash of its contents. A file whose times and
+size are unchanged is not read again. A file that was only touched is
+read and hashed, but it is not parsed again.
+
+Only the XML is cached. Everything that depends on the system, such as
+os attributes, variables with search="glob", and translations, is
+evaluated each time from the cached tree.
+
+The cache file is in the user's cache directory, which is writable by
+the same processes as the personal cleaners. The actions not allowed in
+untrusted cleaners are therefore never taken from the cache for a
+trusted cleaner.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import xml.etree.ElementTree
+
+import bleachbit
+from bleachbit.General import reject_xml_dtd
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+CACHE_FILENAME = 'cleanerml_cache.json'
+
+# A file modified this recently may change again within the resolution
+# of its timestamp, so its timestamp is not trusted.
+RACY_SECS = 2
+
+
+def _encode_element(element):
+    """Return a JSON-friendly record of an element and its children"""
+    return [element.tag, element.attrib, element.text, element.tail,
+            [_encode_element(child) for child in element]]
+
+
+def _valid_element(record):
+    """Return whether an encoded element has the expected shape"""
+    if not isinstance(record, list) or len(record) != 5:
+        return False
+    (tag, attrib, text, tail, children) = record
+    return isinstance(tag, str) and isinstance(attrib, dict) \
+        and all(isinstance(k, str) and isinstance(v, str)
+                for (k, v) in attrib.items()) \
+        and isinstance(text, (str, type(None))) \
+        and isinstance(tail, (str, type(None))) \
+        and isinstance(children, list) \
+        and all(_valid_element(child) for child in children)
+
+
+def _valid_record(record):
+    """Return whether a cached file has the expected shape"""
+    if not isinstance(record, dict) or 'key' not in record:
+        return False
+    key = record['key']
+    return (key is None or (isinstance(key, list) and len(key) == 3)) \
+        and isinstance(record.get('sha256'), str) \
+        and _valid_element(record.get('root'))
+
+
+def _decode_element(record):
+    (tag, attrib, text, tail, children) = record
+    element = xml.etree.ElementTree.Element(tag, attrib)
+    element.text = text
+    element.tail = tail
+    element.extend(_decode_element(child) for child in children)
+    return element
+
+
+def _has_command(record, commands):
+    """Return whether an encoded tree has an action with one of commands"""
+    (tag, attrib, _text, _tail, children) = record
+    if tag == 'action' and attrib.get('command') in commands:
+        return True
+    return any(_has_command(child, commands) for child in children)
+
+
+class CleanerMLCache:
+
+    """Element trees of CleanerML files saved between runs
+
+    parse() may be called from several threads.
+    """
+
+    def __init__(self, path=None):
+        # None means the file in the cache directory
+        self._path = path
+        self._files = None
+        self._used = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def path(self):
+        """Return the path of the cache file"""
+        return self._path or os.path.join(bleachbit.cache_dir, CACHE_FILENAME)
+
+    def _load(self):
+        """Read the cache file on first use"""
+        if self._files is not None:
+            return
+        self._files = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.debug('Ignoring CleanerML cache %s: %s', self.path, e)
+            return
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION \
+                or data.get('app_version') != bleachbit.APP_VERSION \
+                or not isinstance(data.get('files'), dict):
+            return
+        # Drop malformed records, so their files are parsed again.
+        self._files = {pathname: record
+                       for (pathname, record) in data['files'].items()
+                       if _valid_record(record)}
+        if len(self._files) != len(data['files']):
+            logger.debug('Ignoring %d malformed records in CleanerML cache %s',
+                         len(data['files']) - len(self._files), self.path)
+            self._dirty = True
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def parse(self, pathname, blocked_commands=()):
+        """Return the root element of a CleanerML file
+
+        Raises ValueError if the file declares a DTD, like parsing it.
+
+        blocked_commands are actions that must not come from the cache,
+        such as those not allowed in untrusted cleaners when the cleaner
+        is trusted. A cached tree with any of them is parsed again.
+        """
+        st = os.stat(pathname)
+        key = [st.st_mtime_ns, st.st_ctime_ns, st.st_size]
+        with self._lock:
+            self._load()
+            self._used.add(pathname)
+            record = self._files.get(pathname)
+        if record is not None and blocked_commands \
+                and _has_command(record['root'], blocked_commands):
+            record = None
+        if record is not None and record['key'] == key:
+            self._count(hit=True)
+            return _decode_element(record['root'])
+        with open(pathname, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+        if record is not None and record['sha256'] == digest:
+            # Touched but not changed
+            self._count(hit=True)
+            encoded = record['root']
+            root = _decode_element(encoded)
+        else:
+            self._count(hit=False)
+            reject_xml_dtd(data, 'CleanerML')
+            root = xml.etree.ElementTree.fromstring(data)
+            encoded = _encode_element(root)
+        if blocked_commands and _has_command(encoded, blocked_commands):
+            # It would be parsed again next time anyway.
+            with self._lock:
+                if self._files.pop(pathname, None) is not None:
+                    self._dirty = True
+            return root
+        if st.st_mtime > time.time() - RACY_SECS:
+            # Check the contents next time.
+            key = None
+        with self._lock:
+            self._files[pathname] = {'key': key, 'sha256': digest,
+                                     'root': encoded}
+            self._dirty = True
+        return root
+
+    def save(self):
+        """Write the cache file if it changed
+
+        Files not parsed since the cache was loaded are dropped, such as
+        deleted cleaners. The cache is then released from memory, and the
+        next parse() reads the file again.
+        """
+        with self._lock:
+            if self._files is None:
+                return
+            files = {pathname: record for (pathname, record) in self._files.items()
+                     if pathname in self._used}
+            changed = self._dirty or len(files) != len(self._files)
+            self._files = None
+            self._used = set()
+            self._dirty = False
+            if not changed:
+                return
+            data = {'version': CACHE_VERSION,
+                    'app_version': bleachbit.APP_VERSION,
+                    'files': files}
+        logger.debug('Saving CleanerML cache: %d files, %d hits, %d misses',
+                     len(files), self.hits, self.misses)
+        tmp_path = self.path + '.tmp'
+        try:
+            # json.dumps() uses the C encoder, unlike json.dump().
+            encoded = json.dumps(data, separators=(',', ':'))
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(encoded)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.debug('Failed to save CleanerML cache %s: %s', self.path, e)
+
+
+cleanerml_cache = CleanerMLCache()
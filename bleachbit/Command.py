@@ -32,8 +32,9 @@ import os
 import types
 import warnings
 
-from bleachbit import FileUtilities, IS_WINDOWS
+from bleachbit import FileUtilities, IS_POSIX, IS_WINDOWS
 from bleachbit.Constant import CLEAN_FILE_LABEL
+from bleachbit.ScanCache import scan_cache
 from bleachbit.Language import get_text as _
 
 if IS_WINDOWS:
@@ -43,6 +44,16 @@ else:
 
 logger = logging.getLogger(__name__)
 
+# Functions called with each path that a command deleted or truncated,
+# so that caches of directory contents can forget it
+invalidation_hooks = [scan_cache.invalidate]
+
+
+def notify_path_changed(path):
+    """Call each invalidation hook for a path that changed"""
+    for hook in invalidation_hooks:
+        hook(path)
+
 
 def ret_keep_list(path):
     """Return information that this file matched by keep list"""
@@ -62,10 +73,15 @@ class Delete:
     """Delete a single file or directory.  Obey the user
     preference regarding shredding."""
 
-    def __init__(self, path, shred=False):
-        """Create a Delete instance to delete 'path'"""
+    def __init__(self, path, shred=False, lstat_result=None):
+        """Create a Delete instance to delete 'path'
+
+        lstat_result is an optional os.lstat() of path from the producer
+        (such as a directory scan), so the command need not stat again.
+        """
         self.path = path
         self.shred = shred
+        self.lstat_result = lstat_result
 
     def __str__(self):
         return f'Command to {"shred" if self.shred else "delete"} {self.path}'
@@ -75,8 +91,16 @@ class Delete:
         if FileUtilities.whitelisted(self.path):
             yield ret_keep_list(self.path)
             return
+        lstat_result = self.lstat_result
+        if IS_POSIX and lstat_result is None:
+            # Stat once and share the result with getsize() and delete().
+            # Errors are left for getsize() to report.
+            try:
+                lstat_result = os.lstat(self.path)
+            except OSError:
+                pass
         try:
-            size = FileUtilities.getsize(self.path)
+            size = FileUtilities.getsize(self.path, lstat_result)
         except PermissionError:
             size = None
         except Exception as e:
@@ -98,7 +122,8 @@ class Delete:
             'size': size}
         if really_delete:
             try:
-                deleted = FileUtilities.delete(self.path, self.shred)
+                deleted = FileUtilities.delete(
+                    self.path, self.shred, lstat_result=lstat_result)
             except WindowsError as e:
                 # WindowsError: [Error 32] The process cannot access the file because it is being
                 # used by another process: 'C:\\Documents and
@@ -121,6 +146,7 @@ class Delete:
                 if not deleted:
                     ret['n_deleted'] = 0
                     ret['size'] = 0
+            notify_path_changed(self.path)
         yield ret
 
 
@@ -206,7 +232,7 @@ class Function:
                 oldsize = FileUtilities.getsize(self.path)
 
                 try:
-                    self.func(self.path)
+                    func_ret = self.func(self.path)
                 except sqlite3.DatabaseError as e:
                     # Firefox version 140 added a collation sequence that
                     # cannot be vacuumed.
@@ -224,6 +250,11 @@ class Function:
                     else:
                         raise
                 ret['size'] = oldsize - newsize
+                if isinstance(func_ret, int):
+                    # Database cleaners return the number of rows deleted.
+                    ret['n_rows'] = func_ret
+                    logger.debug('%s deleted %d rows from %s', self.label,
+                                 func_ret, self.path)
         yield ret
 
 
@@ -329,6 +360,7 @@ class Truncate(Delete):
             'size': FileUtilities.getsize(self.path)}
         if really_delete:
             FileUtilities.truncate_file(self.path)
+            notify_path_changed(self.path)
         yield ret
 
 
@@ -8,55 +8,79 @@
 Cookie module for selective deletion of cookies
 """
 
-import contextlib
 import json
 import logging
 import os
 
 import bleachbit
 from bleachbit import FileUtilities
-from bleachbit.Special import sqlite_table_exists, _sqlite_uri
+from bleachbit.SqliteSession import sqlite_session
 
 logger = logging.getLogger(__name__)
 
 COOKIE_KEEP_LIST_FILENAME = "cookie_keep_list.json"
 
 
-def _estimate_in_memory_size(conn, table_name, delete_query, params):
-    """Return estimated database size (bytes) after deleting rows in-memory.
+def _estimate_size_reduction(conn, table_name, deleted_count, total_count):
+    """Return (bytes, method) a clean is expected to recover from a database
+
+    The clean deletes rows and then vacuums, which also releases the free
+    pages. The bytes of the table and its indexes come from the dbstat
+    virtual table, and the deleted rows are assumed to be of average
+    size. Without dbstat, every used page is counted as the table, which
+    is cheap but overestimates a database with other tables.
 
     Args:
         conn: SQLite database connection
         table_name (str): Name of the table being modified
-        delete_query (str): SQL DELETE query to execute
-        params (tuple): Parameters for the DELETE query
+        deleted_count (int): Number of rows the clean deletes
+        total_count (int): Number of rows in the table
 
     Returns:
-        int or None: Estimated size in bytes after deletion, or None if estimation fails
+        tuple: (bytes, method) where method is 'dbstat' or 'pages'
     """
-    mem_conn = None
+    # In FreeBSD, sqlite3 is a separate package
+    # pylint: disable=import-outside-toplevel
+    import sqlite3
+    (page_size, page_count, freelist_count) = (
+        conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+        for pragma in ('page_size', 'page_count', 'freelist_count'))
     try:
-        # In FreeBSD, sqlite3 is a separate package
-        # pylint: disable=import-outside-toplevel
-        import sqlite3
-        mem_conn = sqlite3.connect(':memory:')
-        conn.backup(mem_conn)
-        mem_cursor = mem_conn.cursor()
-        mem_cursor.execute(delete_query, params)
-        mem_conn.commit()
-
-        mem_conn.isolation_level = None
-        mem_cursor.execute('VACUUM')
-        page_count = mem_cursor.execute('PRAGMA page_count').fetchone()[0]
-        page_size = mem_cursor.execute('PRAGMA page_size').fetchone()[0]
-        return page_count * page_size
-    except sqlite3.Error as exc:
-        logger.debug(
-            'In-memory size estimation failed for %s: %s', table_name, exc)
-        return None
-    finally:
-        if mem_conn:
-            mem_conn.close()
+        table_bytes = conn.execute(
+            'SELECT sum(pgsize) FROM dbstat WHERE name IN '
+            '(SELECT name FROM sqlite_master WHERE tbl_name = ?)',
+            (table_name,)).fetchone()[0] or 0
+        method = 'dbstat'
+    except sqlite3.OperationalError as exc:
+        # SQLite was built without SQLITE_ENABLE_DBSTAT_VTAB.
+        logger.debug('dbstat is not available: %s', exc)
+        table_bytes = (page_count - freelist_count) * page_size
+        method = 'pages'
+    reduction = freelist_count * page_size
+    if total_count > 0:
+        reduction += int(table_bytes * deleted_count / total_count)
+    return (min(reduction, page_count * page_size), method)
+
+
+def _make_keep_host(domains):
+    """Return a function telling whether to keep a cookie of a host
+
+    The host is kept if it or one of its parent domains is in domains,
+    so a host is checked with one set lookup per label.
+    """
+    def keep_host(host):
+        if not host:
+            return 0
+        host = host.lower()
+        if host in domains:
+            return 1
+        dot = host.find('.')
+        while dot >= 0:
+            if host[dot + 1:] in domains:
+                return 1
+            dot = host.find('.', dot + 1)
+        return 0
+    return keep_host
 
 
 def _get_db_disk_size(path):
@@ -115,6 +139,8 @@ def detect_browser(path):
     """Detect the browser type based on the cookies database file"""
     if not os.path.exists(path):
         raise ValueError(f"cookies file not found: {path}")
+    # Special is imported here to keep it out of startup.
+    from bleachbit.Special import sqlite_table_exists  # pylint: disable=import-outside-toplevel
     for table_config in SQLITE_TABLES.values():
         if sqlite_table_exists(path, table_config['table_name']):
             return table_config['table_name'], table_config['host_column']
@@ -123,11 +149,9 @@ def detect_browser(path):
 
 def list_cookies(path):
     """List cookies in the database"""
-    import sqlite3  # pylint: disable=import-outside-toplevel
-    (table_name, host_column) = detect_browser(path)
-    uri = _sqlite_uri(path)
-    with contextlib.closing(sqlite3.connect(uri, uri=True)) as conn:
-        cursor = conn.cursor()
+    with sqlite_session() as session:
+        (table_name, host_column) = detect_browser(path)
+        cursor = session.connection(path).cursor()
         cursor.execute(f"SELECT distinct {host_column} FROM {table_name}")
         return cursor.fetchall()
 
@@ -172,6 +196,12 @@ def delete_cookies(path, keep_list, really_delete=False):
         raise ValueError("keep_list must not be empty")
     assert isinstance(keep_list, set)
 
+    with sqlite_session() as session:
+        return _delete_cookies(session, path, keep_list, really_delete)
+
+
+def _delete_cookies(session, path, keep_list, really_delete):
+    """Implement delete_cookies() with connections from session"""
     import sqlite3  # pylint: disable=import-outside-toplevel
     # Find the first matching table configuration
     (table_name, host_column) = detect_browser(path)
@@ -180,132 +210,116 @@ def delete_cookies(path, keep_list, really_delete=False):
     if original_size <= 0:
         raise RuntimeError(f"cookies database is empty: {path}")
 
-    # Set up connection. Preview opens read-only; the percent-encoded URI
-    # keeps a '?' in the path from defeating the mode.
-    uri = _sqlite_uri(path, None if really_delete else 'ro')
-
     from bleachbit.Options import options
     shred_enabled = options.get('shred')
 
     try:
-        with contextlib.closing(sqlite3.connect(uri, uri=True)) as conn:
-            cursor = conn.cursor()
-            if shred_enabled:
-                cursor.execute('PRAGMA secure_delete = ON;')
-
-            # Get total count
-            total_before = cursor.execute(
-                f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
-
-            # Build predicate for domain-level keep semantics
-            # Match exact domain and any subdomain (both Firefox and Chromium)
-            domains = [str(d).lstrip('.').lower() for d in keep_list]
-            or_clauses = []
-            params = []
-            for d in domains:
-                or_clauses.append(f"{host_column} = ?")
-                params.append(d)
-                or_clauses.append(f"{host_column} LIKE ?")
-                params.append(f"%.{d}")
-            keep_predicate = '(' + ' OR '.join(or_clauses) + ')'
-
-            # Count cookies that will be kept
-            kept_count = cursor.execute(
-                f"SELECT COUNT(*) FROM {table_name} WHERE {keep_predicate}",
-                tuple(params)
-            ).fetchone()[0]
-
-            deleted_count = total_before - kept_count
-            delete_query = f"DELETE FROM {table_name} WHERE NOT {keep_predicate}"
-
-            ratio_estimate = 0
-
-            if really_delete and deleted_count > 0:
-                if kept_count == 0:
-                    # No cookies are being kept: delete the whole database file
-                    conn.close()
-                    if shred_enabled:
-                        _delete_auxiliary_journal_files(path, True)
-                    try:
-                        FileUtilities.delete(path, shred_enabled)
-                        return {
-                            "total_deleted": deleted_count,
-                            "total_kept": 0,
-                            "skipped": False,
-                            "whole_file_deleted": True,
-                            "file_size_reduction": original_size,
-                        }
-                    except OSError as e:
-                        logger.error(
-                            "Failed to delete cookie database %s: %s", path, e)
-                        return {
-                            "total_deleted": 0,
-                            "total_kept": 0,
-                            "skipped": True,
-                            "whole_file_deleted": False,
-                            "file_size_reduction": 0,
-                        }
-
-                # Perform actual deletion: delete anything NOT matching keep predicate
-                cursor.execute(delete_query, tuple(params))
-                # Commit deletion before VACUUM
-                conn.commit()
-                # Run VACUUM in autocommit mode to avoid 'cannot VACUUM from within a transaction'
-                prev_isolation = conn.isolation_level
-                try:
-                    conn.isolation_level = None
-                    cursor.execute('VACUUM')
-                except sqlite3.Error as e:
-                    logger.warning("VACUUM failed on %s: %s", path, e)
-                finally:
-                    conn.isolation_level = prev_isolation
+        # Preview opens read-only.
+        conn = session.connection(path, readonly=not really_delete)
+        cursor = conn.cursor()
+        if shred_enabled:
+            cursor.execute('PRAGMA secure_delete = ON;')
+
+        # Get total count
+        total_before = cursor.execute(
+            f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+
+        # Build predicate for domain-level keep semantics
+        # Match exact domain and any subdomain (both Firefox and Chromium)
+        domains = {str(d).lstrip('.').lower() for d in keep_list}
+        conn.create_function('bleachbit_keep_host', 1,
+                             _make_keep_host(domains), deterministic=True)
+        keep_predicate = f"bleachbit_keep_host({host_column})"
+
+        # Count cookies that will be kept
+        kept_count = cursor.execute(
+            f"SELECT COUNT(*) FROM {table_name} WHERE {keep_predicate}"
+        ).fetchone()[0]
+
+        deleted_count = total_before - kept_count
+        delete_query = f"DELETE FROM {table_name} WHERE NOT {keep_predicate}"
+
+        ratio_estimate = 0
+
+        if really_delete and deleted_count > 0:
+            if kept_count == 0:
+                # No cookies are being kept: delete the whole database file
+                session.close_database(path)
                 if shred_enabled:
-                    _checkpoint_wal(conn, path)
-                    conn.close()
                     _delete_auxiliary_journal_files(path, True)
-                new_size = _get_db_disk_size(path)
-                size_reduction = original_size - new_size
-                estimation_method = 'actual'
+                try:
+                    FileUtilities.delete(path, shred_enabled)
+                    return {
+                        "total_deleted": deleted_count,
+                        "total_kept": 0,
+                        "skipped": False,
+                        "whole_file_deleted": True,
+                        "file_size_reduction": original_size,
+                    }
+                except OSError as e:
+                    logger.error(
+                        "Failed to delete cookie database %s: %s", path, e)
+                    return {
+                        "total_deleted": 0,
+                        "total_kept": 0,
+                        "skipped": True,
+                        "whole_file_deleted": False,
+                        "file_size_reduction": 0,
+                    }
+
+            # Perform actual deletion: delete anything NOT matching keep predicate
+            cursor.execute(delete_query)
+            # Commit deletion before VACUUM
+            conn.commit()
+            # Run VACUUM in autocommit mode to avoid 'cannot VACUUM from within a transaction'
+            prev_isolation = conn.isolation_level
+            try:
+                conn.isolation_level = None
+                cursor.execute('VACUUM')
+            except sqlite3.Error as e:
+                logger.warning("VACUUM failed on %s: %s", path, e)
+            finally:
+                conn.isolation_level = prev_isolation
+            if shred_enabled:
+                _checkpoint_wal(conn, path)
+                session.close_database(path)
+                _delete_auxiliary_journal_files(path, True)
+            new_size = _get_db_disk_size(path)
+            size_reduction = original_size - new_size
+            estimation_method = 'actual'
+            ratio_estimate = None
+            pages_estimate = None
+        else:
+            # Preview mode or nothing to delete
+            if kept_count == 0:
+                # No cookies being kept: entire file would be deleted
+                size_reduction = original_size
+                estimation_method = 'whole_file'
                 ratio_estimate = None
-                memory_estimate = None
+                pages_estimate = None
             else:
-                # Preview mode or nothing to delete
-                if kept_count == 0:
-                    # No cookies being kept: entire file would be deleted
-                    size_reduction = original_size
-                    estimation_method = 'whole_file'
-                    ratio_estimate = None
-                    memory_estimate = None
+                if total_before > 0:
+                    ratio_estimate = int(
+                        (deleted_count / total_before) * original_size)
+                pages_estimate = None
+                if deleted_count > 0:
+                    (pages_estimate, estimation_method) = _estimate_size_reduction(
+                        conn, table_name, deleted_count, total_before)
+                    size_reduction = pages_estimate
                 else:
-                    if total_before > 0:
-                        ratio_estimate = int(
-                            (deleted_count / total_before) * original_size)
-                    memory_estimate = None
-                    if deleted_count > 0 and shred_enabled:
-                        # In-memory method is accurate when shredding is enabled
-                        memory_size = _estimate_in_memory_size(
-                            conn, table_name, delete_query, tuple(params))
-                        if memory_size is not None:
-                            memory_estimate = max(
-                                0, original_size - memory_size)
-
-                    if memory_estimate is not None:
-                        size_reduction = memory_estimate
-                        estimation_method = 'in_memory'
-                    else:
-                        size_reduction = ratio_estimate
-                        estimation_method = 'ratio'
-
-            return {
-                "total_deleted": deleted_count,
-                "total_kept": kept_count,
-                "skipped": False,
-                "whole_file_deleted": False,
-                "file_size_reduction": size_reduction,
-                "file_size_estimation_method": estimation_method,
-                "file_size_reduction_ratio": ratio_estimate,
-                "file_size_reduction_in_memory": memory_estimate,
-            }
+                    size_reduction = ratio_estimate
+                    estimation_method = 'ratio'
+
+        return {
+            "total_deleted": deleted_count,
+            "total_kept": kept_count,
+            "skipped": False,
+            "whole_file_deleted": False,
+            "file_size_reduction": size_reduction,
+            "file_size_estimation_method": estimation_method,
+            "file_size_reduction_ratio": ratio_estimate,
+            "file_size_reduction_pages": pages_estimate,
+        }
 
     except sqlite3.Error as e:
         logger.error("SQLite error processing %s: %s", path, e)
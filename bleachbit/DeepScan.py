@@ -28,9 +28,11 @@ import re
 import time
 import unicodedata
 from collections import namedtuple
-from bleachbit import FS_SCAN_RE_FLAGS, IS_MAC
+from bleachbit import FS_SCAN_RE_FLAGS, IS_MAC, IS_WINDOWS
 from . import Command
-from .FileUtilities import is_normal_directory, whitelisted
+from .FileUtilities import (
+    _windows_preserved_temp_dir, get_scan_threads, parallel_walk, serial_walk,
+    whitelisted)
 
 
 def normalized_walk(top, **kwargs):
@@ -54,6 +56,112 @@ def normalized_walk(top, **kwargs):
         yield from walk(top, **kwargs)
 
 
+def _is_normal_dir_entry(entry):
+    """Like is_normal_directory() but using the cached DirEntry type"""
+    try:
+        if not entry.is_dir(follow_symlinks=False):
+            return False
+        if IS_WINDOWS:
+            # On Windows the stat of a DirEntry comes with the directory
+            # listing, so this does not touch the disk.
+            st = entry.stat(follow_symlinks=False)
+            return getattr(st, 'st_reparse_tag', 0) == 0
+        return True
+    except OSError:
+        return False
+
+
+def _list_dir(dirpath, skip_dir):
+    """List one directory for scandir_walk()"""
+    filenames = []
+    subdirs = []
+    try:
+        with os.scandir(dirpath) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                if not is_dir:
+                    filenames.append(entry.name)
+                elif _is_normal_dir_entry(entry) and \
+                        not (skip_dir and skip_dir(entry.path)):
+                    subdirs.append(entry.path)
+    except OSError:
+        # Like os.walk, ignore directories that cannot be listed.
+        return (None, ())
+    if IS_MAC:
+        filenames = [unicodedata.normalize('NFC', fn) for fn in filenames]
+    return ((dirpath, filenames), subdirs)
+
+
+def scandir_walk(top, skip_dir=None, threads=1):
+    """Walk a directory tree top-down with os.scandir
+
+    Yields (dirpath, filenames) where filenames, like in os.walk, excludes
+    directories and links to directories. Only normal directories are
+    entered: not symlinks and not reparse points. If skip_dir(path)
+    returns True, that subdirectory is not entered.
+
+    With more than one thread, directories are listed in parallel and
+    yielded in no particular order, and skip_dir is called from the
+    walker threads.
+
+    On macOS, filenames are recomposed as in normalized_walk().
+    """
+    def list_dir(dirpath):
+        return _list_dir(dirpath, skip_dir)
+
+    if threads > 1:
+        listings = parallel_walk(top, list_dir, threads)
+    else:
+        listings = serial_walk(top, list_dir)
+    for listing in listings:
+        if listing is not None:
+            yield listing
+
+
+# Regex constructs that look past the end of the match. A pattern
+# without them that matches a directory path matches every path below it.
+_PREFIX_UNSTABLE_RE = re.compile(r'\$|\\[bBZ]|\(\?[=!<]')
+_REGEX_META = frozenset('.^$*+?{}[]|()\\')
+
+
+def _literal_prefix(pattern):
+    """Return the literal text that every match of an anchored pattern begins with
+
+    Returns None if the pattern is not anchored with ^ or has no literal
+    prefix. This is conservative: alternation anywhere gives None.
+    """
+    if not pattern or not pattern.startswith('^') or '|' in pattern:
+        return None
+    prefix = []
+    i = 1
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            following = pattern[i + 1:i + 2]
+            if not following or following.isalnum() or following == '_':
+                # \d, \w, \1 and so on
+                break
+            char = following
+            step = 2
+        elif c in _REGEX_META:
+            break
+        else:
+            char = c
+            step = 1
+        quantifier = pattern[i + step:i + step + 1]
+        if quantifier and quantifier in '*?{':
+            # The character is optional or repeated.
+            break
+        prefix.append(char)
+        if quantifier == '+':
+            break
+        i += step
+    return ''.join(prefix) or None
+
+
 Search = namedtuple(
     'Search', ['command', 'regex', 'nregex', 'wholeregex', 'nwholeregex'])
 Search.__new__.__defaults__ = (None,) * len(Search._fields)
@@ -73,6 +181,35 @@ class CompiledSearch:
         self.wholeregex = re_compile(search.wholeregex)
         self.nwholeregex = re_compile(search.nwholeregex)
 
+        # Used to tell when no file below a directory can match.
+        self.ignore_case = bool(FS_SCAN_RE_FLAGS & re.IGNORECASE)
+        self.wholeregex_prefix = _literal_prefix(search.wholeregex)
+        if self.wholeregex_prefix and self.ignore_case:
+            self.wholeregex_prefix = self.wholeregex_prefix.lower()
+        self.nwholeregex_stable = bool(search.nwholeregex) and \
+            not _PREFIX_UNSTABLE_RE.search(search.nwholeregex)
+        self.prunable = bool(
+            self.wholeregex_prefix or self.nwholeregex_stable)
+
+    def can_match_below(self, dirpath):
+        """Return whether any file below dirpath could match
+
+        A False return is certain, while True means it may match.
+        """
+        if not self.prunable:
+            return True
+        path = os.path.join(dirpath, '')
+        if self.nwholeregex_stable and self.nwholeregex.search(path):
+            return False
+        if self.wholeregex_prefix:
+            prefix = self.wholeregex_prefix
+            if self.ignore_case:
+                path = path.lower()
+            length = min(len(path), len(prefix))
+            if path[:length] != prefix[:length]:
+                return False
+        return True
+
     def match(self, dirpath, filename):
         if self.regex and not self.regex.search(filename):
             return None
@@ -91,6 +228,103 @@ class CompiledSearch:
         return full_path
 
 
+# Combining patterns into one alternation adds groups, which would shift
+# numbered backreferences, and inline global flags are only valid at the
+# start of a pattern. Such patterns are matched one at a time instead.
+_UNCOMBINABLE_RE = re.compile(r'\\[1-9]|\(\?P=|^\(\?[aiLmsux]+\)')
+
+
+def _combine(patterns):
+    """Compile {index: pattern} into one alternation with a group per index
+
+    Returns None if the patterns cannot be combined safely.
+    """
+    if not patterns:
+        return None
+    for pattern in patterns.values():
+        if _UNCOMBINABLE_RE.search(pattern):
+            return None
+    alternation = '|'.join(f'(?P<s{index}>{pattern})'
+                           for (index, pattern) in patterns.items())
+    try:
+        return re.compile(alternation, FS_SCAN_RE_FLAGS)
+    except re.error:
+        return None
+
+
+class MultiSearch:
+    """All searches for one root, matched in a single pass
+
+    The basename regexes of all searches are compiled into one
+    alternation, and so are the whole-path regexes of searches without a
+    basename regex. Most files match nothing, and for them the cost is one
+    or two regex evaluations instead of several per search. A file that
+    may match is then checked against each search in order.
+    """
+
+    def __init__(self, searches):
+        self.searches = [CompiledSearch(s) for s in searches]
+        regexes = {}
+        wholeregexes = {}
+        # Searches without a basename regex must see every full path.
+        self.need_full_path = False
+        self.match_any = False
+        for (index, search) in enumerate(searches):
+            if search.regex:
+                regexes[index] = search.regex
+            elif search.wholeregex:
+                self.need_full_path = True
+                wholeregexes[index] = search.wholeregex
+            else:
+                self.match_any = True
+        self.regex = _combine(regexes)
+        self.wholeregex = _combine(wholeregexes)
+        if (regexes and self.regex is None) or \
+                (wholeregexes and self.wholeregex is None):
+            # Could not prefilter, so try every search.
+            self.match_any = True
+        self.prunable = all(search.prunable for search in self.searches)
+        self.has_shred = any(search.command == 'shred'
+                             for search in self.searches)
+
+    def can_match_below(self, dirpath):
+        """Return whether any search could match a file below dirpath"""
+        if not self.prunable:
+            return True
+        return any(search.can_match_below(dirpath) for search in self.searches)
+
+    def _may_match(self, dirpath, filename):
+        """Return whether any search may match the file"""
+        if self.match_any:
+            return True
+        if self.regex is not None and self.regex.search(filename):
+            return True
+        if self.need_full_path:
+            return self.wholeregex.search(
+                os.path.join(dirpath, filename)) is not None
+        return False
+
+    def match(self, dirpath, filename):
+        """Return (command, full_path) for the first matching search, or None
+
+        A file is reported at most once even if several searches match it.
+        A matching shred search wins over the first search, so a file is
+        not merely deleted when it should be shredded.
+        """
+        if not self._may_match(dirpath, filename):
+            return None
+        first = None
+        for search in self.searches:
+            full_path = search.match(dirpath, filename)
+            if full_path is None:
+                continue
+            if search.command == 'shred' or not self.has_shred:
+                return (search.command, full_path)
+            if first is None:
+                first = (search.command, full_path)
+        return first
+
+
 class DeepScan:
 
     """Advanced directory tree scan"""
@@ -104,34 +338,38 @@ class DeepScan:
         logging.getLogger(__name__).debug(
             'DeepScan.scan: searches=%s', str(self.searches))
         yield_time = time.time()
+        from bleachbit.Options import options
+        keep_index = options.get_whitelist_index()
+        threads = get_scan_threads()
 
         for (top, searches) in self.searches.items():
             # This skips top-level directories that are in the keep list
             # to reduce unnecessary work.
             if whitelisted(top):
                 continue
-            compiled_searches = [CompiledSearch(s) for s in searches]
-            for (dirpath, dirnames, filenames) in normalized_walk(top):
-                # Prune keep-list dirs, symlinks, and reparse points:
-                # os.walk's followlinks=False skips POSIX links but not
-                # junctions, which would otherwise redirect the scan.
-                dirnames[:] = [
-                    dirname
-                    for dirname in dirnames
-                    if not whitelisted(os.path.join(dirpath, dirname))
-                    and is_normal_directory(os.path.join(dirpath, dirname))
-                ]
-                for c in compiled_searches:
-                    # fixme, don't match filename twice
-                    for filename in filenames:
-                        full_name = c.match(dirpath, filename)
-                        if full_name is None:
-                            continue
-                        # fixme: support other commands
-                        if c.command == 'delete':
-                            yield Command.Delete(full_name)
-                        elif c.command == 'shred':
-                            yield Command.Shred(full_name)
+            multi_search = MultiSearch(searches)
+            if not multi_search.can_match_below(top):
+                continue
+
+            def skip_dir(path):
+                # Prune keep-list directories and subtrees that no
+                # search can match.
+                if IS_WINDOWS and _windows_preserved_temp_dir(path):
+                    return True
+                return keep_index.match(path) or \
+                    not multi_search.can_match_below(path)
+
+            for (dirpath, filenames) in scandir_walk(top, skip_dir, threads):
+                for filename in filenames:
+                    match = multi_search.match(dirpath, filename)
+                    if match is None:
+                        continue
+                    (command, full_name) = match
+                    # fixme: support other commands
+                    if command == 'delete':
+                        yield Command.Delete(full_name)
+                    elif command == 'shred':
+                        yield Command.Shred(full_name)
 
                 if time.time() - yield_time > 0.25:
                     # allow GTK+ to process the idle loop
@@ -17,19 +17,21 @@ import locale
 import logging
 import os
 import os.path
+import queue
 import re
 import stat
 import subprocess
+import threading
 import time
 import urllib.parse
-import urllib.request
 from pathlib import Path
 
 # local imports
 import bleachbit
 from bleachbit import IS_FREEBSD, IS_LINUX, IS_MAC, IS_POSIX, IS_WINDOWS
 from bleachbit.Language import get_text as _
-from bleachbit.PathUtils import path_equal, path_startswith
+from bleachbit.ScanCache import get_scan_cache
+from bleachbit.SqliteSession import current_session
 from bleachbit.Wipe import wipe_contents, wipe_name
 
 
@@ -60,6 +62,12 @@ if IS_POSIX:
 # TODO: drop this fallback once the minimum Python version is 3.12+
 _DIRENTRY_HAS_IS_JUNCTION = hasattr(os.DirEntry, 'is_junction')
 
+# vacuum_sqlite3() skips databases with a smaller percentage of free pages,
+# unless the vacuum_min_free_percent option says otherwise.
+VACUUM_MIN_FREE_PERCENT = 5
+# PRAGMA auto_vacuum value of a database in incremental mode
+SQLITE_AUTO_VACUUM_INCREMENTAL = 2
+
 
 def _remove_windows_readonly(path):
     """Clear Windows read-only attribute so deletion/wiping succeeds
@@ -209,13 +217,59 @@ def open_files():
             yield target
 
 
+def _proc_start_time(pid):
+    """Return the start time of a process in clock ticks, or None"""
+    try:
+        with open(f'/proc/{pid}/stat', 'rb') as f:
+            data = f.read()
+    except OSError:
+        return None
+    # The name in parentheses may contain spaces, so skip past it.
+    fields = data[data.rfind(b')') + 2:].split()
+    try:
+        return int(fields[19])
+    except (IndexError, ValueError):
+        return None
+
+
+def _proc_open_files(pid):
+    """Return the set of (st_dev, st_ino) of files a process has open on Linux"""
+    keys = set()
+    fd_dir = f'/proc/{pid}/fd'
+    try:
+        fds = os.listdir(fd_dir)
+    except OSError:
+        # The process ended, or it belongs to another user.
+        return keys
+    for fd in fds:
+        try:
+            # os.stat() follows the link to the open file, even a deleted one.
+            st = os.stat(os.path.join(fd_dir, fd))
+        except (OSError, ValueError):
+            continue
+        if OpenFiles.stat_qualifies(st):
+            keys.add((st.st_dev, st.st_ino))
+    return keys
+
+
 class OpenFiles:
 
-    """Cached way to determine whether a file is open by active process"""
+    """Cached way to determine whether a file is open by active process
+
+    Files are identified by (st_dev, st_ino), so a path found by a
+    directory scan can be checked with its stat result and without
+    resolving it. On Linux, a refresh reads /proc/<pid>/fd only for
+    processes that started since the last scan, so call scan() at the
+    start of each cleaning to see the files opened since by the others.
+    """
 
     def __init__(self):
         self.last_scan_time = None
+        # (st_dev, st_ino) of open files
         self.files = set()
+        # On Linux, (process ID, start time) -> set of (st_dev, st_ino)
+        # open by it. The start time tells apart a reused process ID.
+        self.pids = {}
 
     def file_qualifies(self, filename):
         """Return boolean whether filename qualifies to enter cache (check \
@@ -223,19 +277,65 @@ class OpenFiles:
         return not filename.startswith("/dev") and \
             not filename.startswith("/proc")
 
+    @staticmethod
+    def stat_qualifies(stat_result):
+        """Return boolean whether an open file qualifies to enter cache
+
+        Pipes, sockets, and devices cannot be in a directory to clean.
+        """
+        return stat.S_ISREG(stat_result.st_mode) or stat.S_ISDIR(stat_result.st_mode)
+
     def scan(self):
-        """Update cache"""
+        """Update cache from scratch"""
+        self.pids = {}
+        self.refresh()
+
+    def refresh(self):
+        """Update cache with the processes started since the last scan"""
         self.last_scan_time = time.time()
-        self.files = set()
+        if IS_LINUX:
+            pids = set()
+            for name in os.listdir('/proc'):
+                if name.isdigit():
+                    start_time = _proc_start_time(name)
+                    if start_time is not None:
+                        pids.add((name, start_time))
+            for key in list(self.pids):
+                if key not in pids:
+                    del self.pids[key]
+            for key in pids.difference(self.pids):
+                self.pids[key] = _proc_open_files(key[0])
+            self.files = set().union(*self.pids.values())
+            return
+        # lsof lists paths, and it has no cheaper way to list a few processes.
+        files = set()
         for filename in open_files():
-            if self.file_qualifies(filename):
-                self.files.add(filename)
+            if not self.file_qualifies(filename):
+                continue
+            try:
+                st = os.stat(filename)
+            except (OSError, ValueError):
+                continue
+            if self.stat_qualifies(st):
+                files.add((st.st_dev, st.st_ino))
+        self.files = files
+
+    def is_open(self, filename, stat_result=None):
+        """Return boolean whether filename is open by running process
 
-    def is_open(self, filename):
-        """Return boolean whether filename is open by running process"""
-        if self.last_scan_time is None or (time.time() - self.last_scan_time) > 10:
+        stat_result is an optional os.stat() of filename, such as from a
+        directory scan, to save a system call.
+        """
+        if self.last_scan_time is None:
             self.scan()
-        return os.path.realpath(filename) in self.files
+        elif (time.time() - self.last_scan_time) > 10:
+            self.refresh()
+        if stat_result is None:
+            try:
+                stat_result = os.stat(filename)
+            except (OSError, ValueError):
+                return False
+        return (stat_result.st_dev, stat_result.st_ino) in self.files
 
 
 _SI_PREFIXES = ('', 'k', 'M', 'G', 'T', 'P')
@@ -285,76 +385,322 @@ def _is_junction_entry(entry):
     return bleachbit.Windows.is_junction(entry.path)
 
 
-def _scan_children(top, list_directories, pending_dirs):
-    """Yield files under `top`, descending into real subdirectories.
+class ScanEntry:
+
+    """A path found by a directory scan, with metadata from os.scandir
+
+    The file type comes from the directory listing, so checking it makes no
+    system call on most platforms. The lstat() result is fetched on first
+    use and then reused, so a consumer such as Command.Delete need not stat
+    the path again. Like os.DirEntry, it works with os.fspath().
+    """
+
+    __slots__ = ('path', '_entry')
+
+    def __init__(self, entry):
+        self.path = entry.path
+        self._entry = entry
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f'<ScanEntry {self.path!r}>'
+
+    def is_dir(self, follow_symlinks=True):
+        """Return whether this is a directory, like os.DirEntry.is_dir()"""
+        try:
+            return self._entry.is_dir(follow_symlinks=follow_symlinks)
+        except OSError:
+            return False
+
+    def is_file(self, follow_symlinks=True):
+        """Return whether this is a file, like os.DirEntry.is_file()"""
+        try:
+            return self._entry.is_file(follow_symlinks=follow_symlinks)
+        except OSError:
+            return False
+
+    def is_symlink(self):
+        """Return whether this is a symbolic link"""
+        try:
+            return self._entry.is_symlink()
+        except OSError:
+            return False
+
+    def lstat(self):
+        """Return the os.lstat() result, or None if the path is gone or unreadable
+
+        os.DirEntry caches the result, so the system call happens at most once.
+        """
+        try:
+            return self._entry.stat(follow_symlinks=False)
+        except OSError:
+            return None
+
+    @property
+    def type(self):
+        """Return 'l' for a link, 'd' for a directory, 'f' for a regular file, or 'o'"""
+        if self.is_symlink():
+            return 'l'
+        if self.is_dir(follow_symlinks=False):
+            return 'd'
+        if self.is_file(follow_symlinks=False):
+            return 'f'
+        return 'o'
+
+    @property
+    def size(self):
+        """Return the size like getsize(), or None if the path cannot be stat'd"""
+        lstat_result = self.lstat()
+        if lstat_result is None:
+            return None
+        if IS_POSIX:
+            return lstat_result.st_blocks * 512
+        return lstat_result.st_size
+
+    @property
+    def uid(self):
+        """Return the owner's user ID, or None if the path cannot be stat'd"""
+        lstat_result = self.lstat()
+        return None if lstat_result is None else lstat_result.st_uid
+
+    @property
+    def mtime(self):
+        """Return the modification time, or None if the path cannot be stat'd"""
+        lstat_result = self.lstat()
+        return None if lstat_result is None else lstat_result.st_mtime
+
+
+def _split_entries(entries, files, dirs, subdirs):
+    """Sort os.DirEntry objects for _scan_directory()"""
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            # e.g. permission denied; os.walk also treats this as a file
+            is_dir = False
+        if not is_dir:
+            # regular file, symlink to a file, or broken link
+            files.append(entry)
+            continue
+        try:
+            # is_junction_entry() is Windows-only and never reached on
+            # POSIX thanks to short-circuit evaluation.
+            is_link = entry.is_symlink() or (
+                IS_WINDOWS and _is_junction_entry(entry))
+        except OSError:
+            is_link = False
+        dirs.append(entry)
+        if not is_link:
+            subdirs.append(entry.path)
+
+
+def _scan_directory(path, cache=None):
+    """List one directory for _scan_children()
+
+    Returns (files, dirs, subdirs): os.DirEntry objects for everything
+    that is not a directory, os.DirEntry objects for the directories
+    (including links to directories), and the paths of the real
+    subdirectories to descend into.
+
+    Symlinks and, on Windows, junctions are not descended into.
+
+    cache is an optional ScanCache.ScanCache to reuse and record listings.
+    """
+    files = []
+    dirs = []
+    subdirs = []
+    if cache is not None:
+        try:
+            # Stat before listing, so a change during the listing
+            # invalidates the record.
+            dir_stat = os.stat(path)
+        except OSError:
+            return (files, dirs, subdirs)
+        cached = cache.lookup(path, dir_stat)
+        if cached is not None:
+            _split_entries(cached, files, dirs, subdirs)
+            return (files, dirs, subdirs)
+    try:
+        scandir_it = os.scandir(path)
+    except OSError:
+        return (files, dirs, subdirs)
+    try:
+        with scandir_it:
+            _split_entries(scandir_it, files, dirs, subdirs)
+    except OSError:
+        # The directory may disappear or become unreadable mid-iteration.
+        # os.walk silently skips such directories, so do the same instead of
+        # propagating PermissionError and aborting the whole cleanup.
+        return (files, dirs, subdirs)
+    if cache is not None:
+        cache.store(path, dir_stat, files + dirs)
+    return (files, dirs, subdirs)
+
+
+def _scan_children(top, list_directories, pending_dirs, threads=1, cache=None):
+    """Yield os.DirEntry objects under `top`, descending into real subdirectories.
 
-    Symlinks and, on Windows, junctions are not descended into. When
-    list_directories is set, every directory found (including those links)
+    When list_directories is set, every directory found (including links)
     is collected into pending_dirs to be emitted after its contents.
 
     Using os.scandir directly lets us reuse each entry's cached type instead
     of re-stat'ing every subdirectory to test for links, as os.walk required.
     The stack is explicit rather than recursive so that a deeply nested tree
     cannot exhaust the interpreter's recursion limit.
+
+    With more than one thread, directories are listed in parallel, and the
+    order of entries between directories is not defined.
+    """
+    def list_dir(path):
+        (files, dirs, subdirs) = _scan_directory(path, cache)
+        return ((files, dirs), subdirs)
+
+    if threads > 1:
+        listings = parallel_walk(top, list_dir, threads)
+    else:
+        listings = serial_walk(top, list_dir)
+    for (files, dirs) in listings:
+        yield from files
+        if list_directories:
+            pending_dirs.extend(dirs)
+
+
+def serial_walk(top, list_dir):
+    """Call list_dir() on each directory in a tree, depth first
+
+    list_dir(path) returns (result, subdirs), where subdirs are the
+    paths to visit next. Yields each result in order.
     """
     stack = [top]
     while stack:
-        try:
-            scandir_it = os.scandir(stack.pop())
-        except OSError:
-            continue
-        subdirs = []
-        try:
-            with scandir_it:
-                for entry in scandir_it:
-                    try:
-                        is_dir = entry.is_dir()
-                    except OSError:
-                        # e.g. permission denied; os.walk also treats this as a file
-                        is_dir = False
-                    if not is_dir:
-                        # regular file, symlink to a file, or broken link
-                        yield entry.path
-                        continue
-                    try:
-                        # is_junction_entry() is Windows-only and never reached on
-                        # POSIX thanks to short-circuit evaluation.
-                        is_link = entry.is_symlink() or (
-                            IS_WINDOWS and _is_junction_entry(entry))
-                    except OSError:
-                        is_link = False
-                    if list_directories:
-                        pending_dirs.append(entry.path)
-                    if not is_link:
-                        subdirs.append(entry.path)
-        except OSError:
-            # The directory may disappear or become unreadable mid-iteration.
-            # os.walk silently skips such directories, so do the same instead of
-            # propagating PermissionError and aborting the whole cleanup.
-            continue
+        (result, subdirs) = list_dir(stack.pop())
+        yield result
         # Reversed so siblings are visited in the order scandir returned them
         stack.extend(reversed(subdirs))
 
 
-def children_in_directory(top, list_directories=False):
-    """Iterate files and, optionally, subdirectories in directory
+class _WalkError:
+    """Exception from list_dir() passed from a walker thread"""
 
-    Directories are returned after children to avoid trying to delete
-    a non-empty directory. Symlinks and Windows junctions are never
-    traversed.
+    def __init__(self, exception):
+        self.exception = exception
+
+
+def parallel_walk(top, list_dir, threads):
+    """Like serial_walk(), but list directories in several threads
+
+    Idle threads take the most recently found directory from a shared
+    stack, so a thread that finds a big subtree shares it with the
+    others. On network file systems and fast SSDs, the time spent
+    waiting on one listing overlaps with others.
+
+    Results are yielded in the calling thread as they become ready, and
+    the order between directories is not defined. An exception from
+    list_dir() is raised in the calling thread. If the caller stops
+    early, the threads stop after their current directory.
+    """
+    pending = [top]
+    busy = 0
+    done = object()
+    cond = threading.Condition()
+    results = queue.Queue()
+    stopping = threading.Event()
+
+    def work():
+        nonlocal busy
+        while True:
+            with cond:
+                while not pending and busy and not stopping.is_set():
+                    cond.wait()
+                if stopping.is_set() or not pending:
+                    # Nothing left to do: no pending and no busy thread.
+                    cond.notify_all()
+                    break
+                path = pending.pop()
+                busy += 1
+            subdirs = ()
+            try:
+                (result, subdirs) = list_dir(path)
+            except Exception as e:  # pylint: disable=broad-except
+                result = _WalkError(e)
+            with cond:
+                pending.extend(reversed(subdirs))
+                busy -= 1
+                cond.notify_all()
+            results.put(result)
+        results.put(done)
+
+    workers = [threading.Thread(target=work, daemon=True,
+                                name=f'parallel_walk-{i}')
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    try:
+        running = len(workers)
+        while running:
+            result = results.get()
+            if result is done:
+                running -= 1
+            elif isinstance(result, _WalkError):
+                raise result.exception
+            else:
+                yield result
+    finally:
+        stopping.set()
+        with cond:
+            cond.notify_all()
+
+
+def get_scan_threads():
+    """Return the number of threads for listing directories"""
+    from bleachbit.Options import options
+    return options.get('scan_threads') or 1
+
+
+def children_in_directory_entries(top, list_directories=False, threads=None):
+    """Iterate ScanEntry records for files and, optionally, subdirectories
+
+    This is like children_in_directory(), but each record carries the
+    metadata from the directory scan, so consumers can check the type,
+    size, owner, and modification time without stat'ing the path again.
+
+    threads is the number of threads listing directories. The default
+    comes from the scan_threads option.
+
+    If the scan_cache option is set, unchanged directories are not read
+    again: see ScanCache.
     """
     if isinstance(top, tuple):
         for top_ in top:
-            yield from children_in_directory(top_, list_directories)
+            yield from children_in_directory_entries(top_, list_directories, threads)
         return
 
+    if threads is None:
+        threads = get_scan_threads()
     pending_dirs = [] if list_directories else None
-    yield from _scan_children(top, list_directories, pending_dirs)
+    cache = get_scan_cache()
+    for entry in _scan_children(top, list_directories, pending_dirs, threads, cache):
+        yield ScanEntry(entry)
 
     if list_directories:
-        pending_dirs.sort(key=len)
+        # Longest paths first, so directories come after their children
+        # whatever order the threads found them in.
+        pending_dirs.sort(key=lambda entry: len(entry.path))
         while pending_dirs:
-            yield pending_dirs.pop()
+            yield ScanEntry(pending_dirs.pop())
+
+
+def children_in_directory(top, list_directories=False):
+    """Iterate files and, optionally, subdirectories in directory
+
+    Directories are returned after children to avoid trying to delete
+    a non-empty directory. Symlinks and Windows junctions are never
+    traversed.
+    """
+    for entry in children_in_directory_entries(top, list_directories):
+        yield entry.path
 
 
 def _open_nofollow_fd(path, flags, mode=0o600):
@@ -570,12 +916,16 @@ def truncate_file(path):
     _run_with_delete_lock(path, _truncate)
 
 
-def delete(path, shred=False, ignore_missing=False, allow_shred=True):
+def delete(path, shred=False, ignore_missing=False, allow_shred=True,
+           lstat_result=None):
     """Delete path that is either file, directory, link or FIFO.
 
        If shred is enabled as a function parameter or the BleachBit global
        parameter, the path will be shredded unless allow_shred = False.
 
+       On POSIX, lstat_result may be a fresh os.lstat() of the path, which
+       saves the stat calls otherwise made to determine the file type.
+
        All links are removed without following the link. This includes:
        * Linux symlink
        * Windows symlink (soft link)
@@ -589,16 +939,29 @@ def delete(path, shred=False, ignore_missing=False, allow_shred=True):
     is_special = False
     path = extended_path(path)
     do_shred = allow_shred and (shred or options.get('shred'))
-    if not os.path.lexists(path):
+    mode = None
+    if IS_POSIX:
+        # One lstat() answers every question below: whether the path
+        # exists and whether it is a link, FIFO, directory, or file.
+        if lstat_result is None:
+            try:
+                lstat_result = os.lstat(path)
+            except (OSError, ValueError):
+                # same as os.path.lexists()
+                lstat_result = None
+        exists = lstat_result is not None
+    else:
+        exists = os.path.lexists(path)
+    if not exists:
         if ignore_missing:
             return False
         raise OSError(2, 'No such file or directory', path)
     if IS_POSIX:
-        # With certain (relatively rare) files on Windows os.lstat()
-        # may return Access Denied
-        mode = os.lstat(path)[stat.ST_MODE]
+        mode = lstat_result.st_mode
         is_special = stat.S_ISFIFO(mode) or stat.S_ISLNK(mode)
     elif IS_WINDOWS:
+        # With certain (relatively rare) files on Windows os.lstat()
+        # may return Access Denied
         try:
             # A junction/symlink's contents belong to the target, not
             # this path; isdir() would follow it and judge the target's
@@ -611,7 +974,11 @@ def delete(path, shred=False, ignore_missing=False, allow_shred=True):
     if is_special:
         _delete_path(path, os.remove)
         return True
-    if os.path.isdir(path):
+    if mode is None:
+        is_dir = os.path.isdir(path)
+    else:
+        is_dir = stat.S_ISDIR(mode)
+    if is_dir:
         delpath = path
         # TRANSLATORS: Log message where %s is the pathname.
         not_empty_msg = _("Directory is not empty: %s")
@@ -657,10 +1024,10 @@ def delete(path, shred=False, ignore_missing=False, allow_shred=True):
             else:
                 raise
         return True
-    elif os.path.isfile(path):
+    elif os.path.isfile(path) if mode is None else stat.S_ISREG(mode):
         delete_file(path, do_shred)
         return True
-    elif os.path.islink(path):
+    elif mode is None and os.path.islink(path):
         _delete_path(path, os.remove)
         return True
     else:
@@ -708,28 +1075,78 @@ def exe_exists(pathname):
         return exists_in_path(pathname)
 
 
+def _split_sqlite_statements(cmds):
+    """Split a string of SQL statements into a batch
+
+    Statements end where sqlite3 says they are complete, so a semicolon
+    inside a string literal does not end a statement.
+    """
+    # pylint: disable=import-outside-toplevel
+    import sqlite3
+    batch = []
+    statement = ''
+    for part in cmds.split(';'):
+        statement += part + ';'
+        if sqlite3.complete_statement(statement):
+            if statement.strip(' \t\r\n;'):
+                batch.append((statement.strip(), ()))
+            statement = ''
+    if statement.strip(' \t\r\n;'):
+        # Let SQLite report the unterminated statement.
+        batch.append((statement.strip(), ()))
+    return batch
+
+
+def _sqlite_outside_transaction(sql):
+    """Return whether sql runs before the transaction
+
+    SQLite refuses to run ATTACH, DETACH, and VACUUM inside a transaction.
+    PRAGMA incremental_vacuum is allowed there, but it frees one page per
+    step, so it runs as a script, which steps it to completion.
+    """
+    words = ' '.join(sql.rstrip().rstrip(';').split()).lower()
+    return words.split(' ', 1)[0] in ('attach', 'detach', 'vacuum') or \
+        words == 'pragma incremental_vacuum'
+
+
 def execute_sqlite3(path, cmds):
     """Execute SQL commands on SQLite database
 
     Args:
         path (str): Path to the SQLite database file
-        cmds (str): SQL commands to execute, separated by semicolons
+        cmds (str or list): Either SQL commands separated by semicolons,
+            or a batch of (sql, parameters) tuples
+
+    The statements run in one BEGIN IMMEDIATE transaction, so either all
+    of them take effect or none do. SQLite refuses to run ATTACH, DETACH,
+    and VACUUM in a transaction, so those must lead the batch and run
+    before it begins.
 
     Raises:
         sqlite3.OperationalError: If there's an error executing the SQL commands
         sqlite3.DatabaseError: If there's a database-related error
 
     Returns:
-        None
+        list: the number of rows each statement changed, in order, or -1
+        for statements other than INSERT, UPDATE, and DELETE
     """
     from bleachbit.Options import options
     # In FreeBSD, sqlite3 is a separate package
     # pylint: disable=import-outside-toplevel
     import sqlite3
     assert isinstance(path, str)
-    assert isinstance(cmds, str)
+    if isinstance(cmds, str):
+        batch = _split_sqlite_statements(cmds)
+    else:
+        assert isinstance(cmds, (list, tuple))
+        batch = list(cmds)
+    # Inside a SQLite session, share its connection.
+    session = current_session()
     try:
-        conn = sqlite3.connect(path)
+        if session is None:
+            conn = sqlite3.connect(path)
+        else:
+            conn = session.connection(path, readonly=False)
     except sqlite3.OperationalError as exc:
         # sqlite3 raises a cryptic "unable to open database file" for a
         # variety of causes (permission denied, read-only parent directory,
@@ -744,7 +1161,12 @@ def execute_sqlite3(path, cmds):
         raise OSError(
             errno.EACCES,
             "Access denied when opening SQLite database", path) from exc
-    with contextlib.closing(conn) as conn:
+    if session is None:
+        conn_context = contextlib.closing(conn)
+    else:
+        conn_context = contextlib.nullcontext(conn)
+    rowcounts = []
+    with conn_context as conn:
         # overwrites deleted content with zeros
         # https://www.sqlite.org/pragma.html#pragma_secure_delete
         if options.get('shred'):
@@ -753,22 +1175,55 @@ def execute_sqlite3(path, cmds):
             if conn.execute('PRAGMA secure_delete').fetchone()[0] != 1:
                 raise RuntimeError(f'could not enable secure_delete on {path}')
 
-        for cmd in cmds.split(';'):
-            try:
-                conn.execute(cmd)
-            except sqlite3.OperationalError as exc:
-                if str(exc).find('no such function: ') >= 0:
-                    # fixme: determine why randomblob and zeroblob are not
-                    # available
-                    logger.exception(str(exc))
-                else:
-                    raise sqlite3.OperationalError(f'{exc}: {path}')
-            except sqlite3.DatabaseError as exc:
-                raise sqlite3.DatabaseError(f'{exc}: {path}')
-
-        conn.commit()
-
-    bleachbit.General.gc_collect()
+        # Manage the transaction here instead of in the sqlite3 module.
+        old_isolation_level = conn.isolation_level
+        conn.isolation_level = None
+        in_transaction = False
+        try:
+            for (sql, params) in batch:
+                outside_transaction = _sqlite_outside_transaction(sql)
+                if not in_transaction and not outside_transaction:
+                    conn.execute('BEGIN IMMEDIATE')
+                    in_transaction = True
+                start = time.time()
+                try:
+                    if outside_transaction and not params:
+                        conn.executescript(sql)
+                        rowcount = -1
+                    else:
+                        rowcount = conn.execute(sql, params).rowcount
+                except sqlite3.OperationalError as exc:
+                    if str(exc).find('no such function: ') >= 0:
+                        # fixme: determine why randomblob and zeroblob are not
+                        # available
+                        logger.exception(str(exc))
+                        rowcount = -1
+                    else:
+                        raise sqlite3.OperationalError(f'{exc}: {path}')
+                except sqlite3.DatabaseError as exc:
+                    raise sqlite3.DatabaseError(f'{exc}: {path}')
+                logger.debug('%d rows in %.3f seconds: %s', rowcount,
+                             time.time() - start, sql)
+                rowcounts.append(rowcount)
+            if in_transaction:
+                conn.execute('COMMIT')
+                in_transaction = False
+        finally:
+            if in_transaction:
+                conn.execute('ROLLBACK')
+            conn.isolation_level = old_isolation_level
+
+        if session is not None:
+            # Leave the shared connection as it was opened.
+            for (_seq, name, _file) in conn.execute('PRAGMA database_list').fetchall():
+                if name not in ('main', 'temp'):
+                    conn.execute('detach database "%s"' % name.replace('"', '""'))
+            session.schema_changed(path)
+
+    if session is None:
+        # The session collects garbage when it closes.
+        bleachbit.General.gc_collect()
+    return rowcounts
 
 
 def expand_glob_join(pathname1, pathname2):
@@ -837,10 +1292,15 @@ def free_space(pathname):
     return mystat.f_bavail * mystat.f_bsize
 
 
-def getsize(path):
+def getsize(path, lstat_result=None):
     """Return the actual file size considering spare files
-       and symlinks"""
+       and symlinks
+
+       On POSIX, lstat_result may be an os.lstat() of the path that the
+       caller already has, and then no system call is made."""
     if IS_POSIX:
+        if lstat_result is not None:
+            return lstat_result.st_blocks * 512
         try:
             __stat = os.lstat(path)
         except OSError as e:
@@ -1047,7 +1507,9 @@ def uris_to_paths(file_uris):
             continue
         parsed_uri = urllib.parse.urlparse(file_uri)
         if parsed_uri.scheme == 'file':
-            file_path = urllib.request.url2pathname(parsed_uri.path)
+            # urllib.request imports http.client and ssl, so it is slow.
+            from urllib.request import url2pathname  # pylint: disable=import-outside-toplevel
+            file_path = url2pathname(parsed_uri.path)
             if len(file_path) > 2 and file_path[2] == ':':
                 # remove front slash for Windows-style path
                 file_path = file_path[1:]
@@ -1066,31 +1528,16 @@ def uris_to_paths(file_uris):
 def whitelisted_posix(path, check_realpath=True, _followed_link=False):
     """Check whether this POSIX path is whitelisted"""
     from bleachbit.Options import options
-    keep_paths = options.get_whitelist_paths()
-    if not keep_paths:
+    keep_index = options.get_whitelist_index()
+    if not keep_index:
         return False
     if check_realpath and os.path.islink(path):
         # also check the link name
-        if whitelisted_posix(path, False):
+        if keep_index.match(path):
             return True
         # resolve symlink
-        return whitelisted_posix(os.path.realpath(path), False, _followed_link=True)
-    for (keep_type, keep_path) in keep_paths:
-        if keep_type == 'file':
-            if path_equal(path, keep_path):
-                return True
-            if _followed_link and path_equal(path, os.path.realpath(keep_path)):
-                return True
-        if keep_type == 'folder':
-            if path_equal(path, keep_path):
-                return True
-            if path_startswith(path, keep_path):
-                return True
-            if _followed_link:
-                real_pathname = os.path.realpath(keep_path)
-                if path_equal(path, real_pathname) or path_startswith(path, real_pathname):
-                    return True
-    return False
+        return keep_index.match(os.path.realpath(path), resolved=True)
+    return keep_index.match(path, resolved=_followed_link)
 
 
 _WINDIR_TEMP = os.path.expandvars(r'%windir%\temp').lower()
@@ -1120,21 +1567,8 @@ def whitelisted_windows(path):
     if _windows_preserved_temp_dir(path):
         return True
     from bleachbit.Options import options
-    for pathname in options.get_whitelist_paths():
-        # Windows is case insensitive
-        if (pathname[0] == 'file'
-                and path_equal(path, pathname[1], case_sensitive=False)):
-            return True
-        if pathname[0] == 'folder':
-            if path_equal(path, pathname[1], case_sensitive=False):
-                return True
-            if path_startswith(path, pathname[1], case_sensitive=False):
-                return True
-            # Simple drive letter like C:\ matches everything below
-            if (len(pathname[1]) == 3
-                    and path.lower().startswith(pathname[1].lower())):
-                return True
-    return False
+    # Windows is case insensitive
+    return options.get_whitelist_index(windows=True).match(path)
 
 
 if IS_WINDOWS:
@@ -1143,8 +1577,57 @@ else:
     whitelisted = whitelisted_posix
 
 
+def _sqlite_free_pages(path):
+    """Return (free pages, total pages, page size, auto-vacuum mode) of a database"""
+    # pylint: disable=import-outside-toplevel
+    import sqlite3
+    from bleachbit.SqliteSession import sqlite_uri
+    uri = sqlite_uri(path, 'ro')
+    with contextlib.closing(sqlite3.connect(uri, uri=True)) as conn:
+        return tuple(conn.execute(f'PRAGMA {pragma}').fetchone()[0]
+                     for pragma in ('freelist_count', 'page_count',
+                                    'page_size', 'auto_vacuum'))
+
+
+def _sqlite_vacuum_worthwhile(free_pages, total_pages):
+    """Return whether enough of a database is free to vacuum it"""
+    from bleachbit.Options import options
+    min_percent = options.get('vacuum_min_free_percent')
+    if min_percent is None:
+        min_percent = VACUUM_MIN_FREE_PERCENT
+    return free_pages > 0 and free_pages * 100 >= min_percent * total_pages
+
+
+def sqlite_vacuum_size(path):
+    """Return the bytes vacuum_sqlite3() is expected to reclaim"""
+    (free_pages, total_pages, page_size, _auto_vacuum) = _sqlite_free_pages(path)
+    if not _sqlite_vacuum_worthwhile(free_pages, total_pages):
+        return 0
+    return free_pages * page_size
+
+
 def vacuum_sqlite3(path):
-    """Vacuum SQLite database"""
+    """Vacuum SQLite database
+
+    A database with few free pages is skipped, because vacuuming rewrites
+    the whole file. A database in incremental auto-vacuum mode releases
+    its free pages without the rewrite.
+    """
+    # pylint: disable=import-outside-toplevel
+    import sqlite3
+    try:
+        (free_pages, total_pages, _page_size, auto_vacuum) = _sqlite_free_pages(path)
+    except sqlite3.Error as exc:
+        # Let execute_sqlite3() report the error.
+        logger.debug('Cannot count free pages in %s: %s', path, exc)
+    else:
+        if not _sqlite_vacuum_worthwhile(free_pages, total_pages):
+            logger.debug('Skipping vacuum of %s with %d of %d pages free',
+                         path, free_pages, total_pages)
+            return
+        if auto_vacuum == SQLITE_AUTO_VACUUM_INCREMENTAL:
+            execute_sqlite3(path, 'PRAGMA incremental_vacuum')
+            return
     execute_sqlite3(path, 'vacuum')
 
 
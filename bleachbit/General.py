@@ -29,6 +29,7 @@ import shutil
 import stat
 import subprocess
 import sys
+import threading
 import xml.parsers.expat
 
 import bleachbit
@@ -37,6 +38,10 @@ from bleachbit.PathUtils import path_startswith
 
 logger = logging.getLogger(__name__)
 
+# Set while a worker runs in a background thread, to pass functions that
+# must run in the main thread back to it
+_main_thread_dispatcher = None
+
 
 def _path_dir_is_root_safe(dirpath):
     """Return True if dirpath is absolute, root-owned, and not writable by others."""
@@ -192,6 +197,28 @@ def gc_collect():
     gc.collect()
 
 
+def set_main_thread_dispatcher(dispatcher):
+    """Set the function that runs calls in the main thread, or None
+
+    dispatcher takes a function and a tuple of arguments, and returns the
+    result of the call in the main thread.
+    """
+    global _main_thread_dispatcher
+    _main_thread_dispatcher = dispatcher
+
+
+def call_in_main_thread(func, *args):
+    """Call func in the main thread and return its result
+
+    GTK is not thread safe, so cleaning functions that use it go through
+    here. Without a dispatcher, func is called directly.
+    """
+    dispatcher = _main_thread_dispatcher
+    if dispatcher is None or threading.current_thread() is threading.main_thread():
+        return func(*args)
+    return dispatcher(func, args)
+
+
 def get_executable():
     """Return the absolute path to the executable
 
@@ -88,10 +88,8 @@ import os
 import sys
 import tempfile
 import warnings
-import webbrowser
 from contextlib import contextmanager
 from pathlib import PureWindowsPath
-from html import escape as esc
 from traceback import format_exc
 
 from bleachbit import bleachbit_exe_path, IS_POSIX, IS_WINDOWS
@@ -174,6 +172,8 @@ def _build_error_html(error, traceback_text=None):
     It does not write to a file.
     """
 
+    # pylint: disable=import-outside-toplevel
+    from html import escape as esc
     try:
         # Import here to avoid a circular import.
         from bleachbit.SystemInformation import get_system_information
@@ -254,6 +254,7 @@ def _show_windows_error_dialog(title, html_content):
                 prefix='bleachbit_error_', suffix='.html')
             with os.fdopen(fd, 'w', encoding='utf-8') as f:
                 f.write(html_content)
+            import webbrowser  # pylint: disable=import-outside-toplevel
             webbrowser.open(f'file:///{html_path}')
     except Exception as e:
         logger.error('Failed to show Windows error dialog: %s', e)
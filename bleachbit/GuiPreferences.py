@@ -281,6 +281,10 @@ class PreferencesDialog:
         if 'debug' == path:
             from bleachbit.Log import set_root_log_level
             set_root_log_level(options.get('debug'))
+        if 'scan_cache' == path and not options.get('scan_cache'):
+            # The cache holds the names of files, so do not leave it behind.
+            from bleachbit.ScanCache import scan_cache
+            scan_cache.delete()
         if 'kde_shred_menu_option' == path:
             from bleachbit.DesktopMenuOptions import install_kde_service_menu_file
             install_kde_service_menu_file()
@@ -459,6 +463,16 @@ class PreferencesDialog:
             "units_iec",
             vbox=vbox)
 
+        if not IS_WINDOWS:
+            self._create_checkbox(
+                # TRANSLATORS: Checkbox label in the preferences.
+                _("Remember folder contents between preview and clean"),
+                'scan_cache',
+                vbox=vbox,
+                # TRANSLATORS: Tooltip for a checkbox in the preferences.
+                tooltip=_("Folders that did not change are not read again for up to an hour, so file sizes may be outdated. "
+                          "The names of the files are saved in the settings folder until they are cleaned or this option is turned off."))
+
     def __create_page_box(self):
         """Create a standard page container box with consistent spacing and padding."""
         vbox = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=18)
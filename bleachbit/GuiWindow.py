@@ -65,6 +65,8 @@ class GUI(Gtk.ApplicationWindow):
         self._auto_exit = auto_exit
         self._infobar_timeout_id = None
         self._gui_cleaner_cleanup_pending = None
+        # Plan recorded by the last preview, for the clean after it
+        self._preview_plan = None
 
         self.set_property('name', APP_NAME)
         self.set_property('role', APP_NAME)
@@ -703,6 +705,20 @@ class GUI(Gtk.ApplicationWindow):
                 filtered[cleaner_id] = safe_options
         return filtered
 
+    def _get_plan(self, really_delete, operations):
+        """Return a plan to record in a preview or to replay in a clean"""
+        from bleachbit.Plan import GUI_MAX_AGE_SECS, Plan
+        shred = options.get('shred')
+        if not really_delete:
+            self._preview_plan = None
+            return Plan(operations, shred)
+        plan = self._preview_plan
+        self._preview_plan = None
+        if plan is not None and plan.matches(operations, shred, GUI_MAX_AGE_SECS):
+            logger.debug('Cleaning the files listed by the preview')
+            return plan
+        return None
+
     def preview_or_run_operations(self, really_delete, operations=None):
         """Preview operations or run operations (delete files)"""
 
@@ -732,13 +748,17 @@ class GUI(Gtk.ApplicationWindow):
                 self.set_sensitive(True)
                 self.progressbar.hide()
                 return
-            self.worker = Worker.Worker(self, really_delete, operations)
+            self.worker = Worker.BackgroundWorker(
+                self, really_delete, operations,
+                plan=self._get_plan(really_delete, operations))
         except Exception:
             logger.exception('Error in Worker()')
         else:
             self.start_time = time.time()
-            worker = self.worker.run()
-            GLib.idle_add(worker.__next__)
+            # The worker runs in a thread, and its output is shown at a
+            # fixed frame rate.
+            self.worker.start()
+            GLib.timeout_add(Worker.UI_FRAME_MS, self.worker.drain)
 
     def worker_done(self, worker, really_delete):
         """Callback for when Worker is done"""
@@ -747,6 +767,8 @@ class GUI(Gtk.ApplicationWindow):
         # view on the next refresh. For confirmed deletes, keep it through
         # the preview so the real delete worker can use it. If confirmation
         # is canceled, remove it when that preview worker finishes.
+        if not really_delete and not worker.is_aborted:
+            self._preview_plan = worker.plan
         if really_delete or worker is self._gui_cleaner_cleanup_pending:
             backends.pop('_gui', None)
             self._gui_cleaner_cleanup_pending = None
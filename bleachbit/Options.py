@@ -35,6 +35,7 @@ import bleachbit
 from bleachbit import General, IS_WINDOWS
 from bleachbit.FileUtilities import open_for_overwrite
 from bleachbit.Language import get_text as _
+from bleachbit.PathUtils import KeepIndex
 
 # third-party imports
 if IS_WINDOWS:
@@ -61,6 +62,7 @@ OPTION_DEFAULTS = {
     'kde_shred_menu_option': {'value': False},
     'load_cleaners': {'value': True},
     'remember_geometry': {'value': True},
+    'scan_cache': {'value': False, 'platforms': ('posix',)},
     'shred': {'value': False},
     'units_iec': {'value': False},
     'window_maximized': {'value': False},
@@ -89,7 +91,8 @@ boolean_keys = frozenset(
     if _platform_allows(meta)
 )
 int_keys = frozenset(('window_x', 'window_y', 'window_width', 'window_height',
-                      'window_font_size'))
+                      'window_font_size', 'worker_threads', 'scan_threads',
+                      'vacuum_min_free_percent'))
 
 
 def _option_index(option_name):
@@ -168,6 +171,8 @@ class Options:
         # Cache of get_paths() results, keyed by section. The keep list is read
         # once per file during a scan, so recomputing it every time is costly.
         self._paths_cache = {}
+        # Compiled keep list, keyed by whether it uses Windows rules
+        self._keep_indexes = {}
         self.old_version = None  # Store previous version in memory
         self._dirty = False
         self._closed = False
@@ -439,6 +444,20 @@ class Options:
         """
         return self.get_paths("whitelist/paths")
 
+    def get_whitelist_index(self, windows=IS_WINDOWS):
+        """Return the keep list (formerly whitelist) as a KeepIndex
+
+        The index is compiled on first use and again only after the
+        keep list changes. windows selects Windows path rules.
+        """
+        if not self.config.has_section("whitelist/paths"):
+            return KeepIndex((), windows)
+        index = self._keep_indexes.get(windows)
+        if index is None:
+            index = KeepIndex(self.get_whitelist_paths(), windows)
+            self._keep_indexes[windows] = index
+        return index
+
     def get_custom_paths(self):
         """Return list of custom paths
 
@@ -530,6 +549,7 @@ class Options:
             self.__cancel_flush_timer()
             self._dirty = False
             self._paths_cache.clear()
+            self._keep_indexes.clear()
             # Reading configuration merges with existing data,
             # so clear it first.
             for section in self.config.sections():
@@ -637,6 +657,7 @@ class Options:
                 self.config.set(section, str(counter) + '_type', value[0])
                 self.config.set(section, str(counter) + '_path', value[1])
             self._paths_cache.pop(section, None)
+            self._keep_indexes.clear()
             self.__schedule_flush()
 
     def set_custom_paths(self, values):
@@ -118,6 +118,102 @@ def path_has_relative_suffix(path, suffix, case_sensitive=None):
     return any(path.endswith(sep + suffix) for sep in _PATH_SEPARATORS)
 
 
+# Marks the end of a keep list entry in a KeepIndex trie. It cannot be a
+# path component, which is always a string.
+_KEEP_END = None
+
+_WINDOWS_SEPARATORS_RE = re.compile(r'[\\/]')
+
+
+class KeepIndex:
+    """Keep list compiled into a trie of path components
+
+    Checking a path walks the trie once, so the cost does not grow with
+    the length of the keep list. A 'file' entry matches itself, and a
+    'folder' entry matches itself and every path below it, with the same
+    rules as path_equal() and path_startswith(). Paths are not normalized.
+
+    The real paths of the entries, used to check the target of a
+    symbolic link, are resolved once on first use.
+    """
+
+    def __init__(self, keep_paths, windows=IS_WINDOWS, case_sensitive=None):
+        """Compile keep_paths, a list of tuples (type, path)
+
+        windows selects Windows rules: both slashes are separators,
+        case is ignored, and a drive root such as C:\\ keeps the drive.
+        """
+        if case_sensitive is None:
+            case_sensitive = FS_CASE_SENSITIVE and not windows
+        self.windows = windows
+        self.case_sensitive = case_sensitive
+        self.keep_paths = tuple(keep_paths)
+        self._trie = self._build(self.keep_paths)
+        self._real_trie = None
+        self._drive_roots = frozenset(
+            self._key(keep_path) for (keep_type, keep_path) in self.keep_paths
+            if windows and 'folder' == keep_type and len(keep_path) == 3)
+
+    def __bool__(self):
+        return bool(self.keep_paths)
+
+    def __len__(self):
+        return len(self.keep_paths)
+
+    def _key(self, path):
+        return path if self.case_sensitive else path.lower()
+
+    def _split(self, path):
+        path = self._key(path)
+        if self.windows:
+            return _WINDOWS_SEPARATORS_RE.split(path)
+        return path.split(os.sep)
+
+    def _build(self, keep_paths):
+        trie = {}
+        for (keep_type, keep_path) in keep_paths:
+            node = trie
+            for part in self._split(keep_path):
+                node = node.setdefault(part, {})
+            ends = node.setdefault(_KEEP_END, set())
+            ends.add(keep_type)
+        return trie
+
+    @staticmethod
+    def _match(trie, parts):
+        node = trie
+        last = len(parts) - 1
+        for (i, part) in enumerate(parts):
+            node = node.get(part)
+            if node is None:
+                return False
+            ends = node.get(_KEEP_END)
+            if ends and (i == last or 'folder' in ends):
+                return True
+        return False
+
+    def match(self, path, resolved=False):
+        """Return whether the keep list matches path
+
+        resolved means that path is the target of a symbolic link, so it
+        is also compared with the real paths of the keep list.
+        """
+        if not self.keep_paths:
+            return False
+        parts = self._split(path)
+        if self._match(self._trie, parts):
+            return True
+        if self._drive_roots and self._key(path[:3]) in self._drive_roots:
+            return True
+        if resolved:
+            if self._real_trie is None:
+                self._real_trie = self._build(
+                    (keep_type, os.path.realpath(keep_path))
+                    for (keep_type, keep_path) in self.keep_paths)
+            return self._match(self._real_trie, parts)
+        return False
+
+
 def normalize_path(path, case_sensitive=None):
     """Normalize a path for comparison.
 
@@ -0,0 +1,173 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright (c) 2008-2026 Andrew Ziem.
+#
+# This work is licensed under the terms of the GNU GPL, version 3 or
+# later.  See the COPYING file in the top-level directory.
+
+"""
+Cleaning plans: clean what was previewed
+
+A preview records each delete, shred, and truncate command with its size
+and a fingerprint of the file. A clean given the plan replays those
+commands instead of searching the file system again, and it skips any
+path whose fingerprint changed since the preview.
+
+Options whose commands are not file commands, such as vacuuming a
+database, are marked in the plan as not replayable, and the clean runs
+them as usual.
+"""
+
+import json
+import logging
+import os
+import stat
+import threading
+import time
+
+from bleachbit import Command
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+
+# Key of the deep scan commands in a plan
+DEEP_SCAN_KEY = 'deepscan'
+
+# The GUI cleans from the plan of the last preview only if it is this
+# recent, so files created since then are not left behind unexpectedly.
+GUI_MAX_AGE_SECS = 600
+
+
+def fingerprint(path, lstat_result=None):
+    """Return (fingerprint, lstat_result) of path, or (None, None) if missing
+
+    lstat_result is an optional os.lstat() of path to use.
+
+    Deleting the children of a directory changes its size and
+    modification time, so those are left out for directories.
+    """
+    st = lstat_result
+    if st is None:
+        try:
+            st = os.lstat(path)
+        except (OSError, ValueError):
+            return (None, None)
+    if stat.S_ISDIR(st.st_mode):
+        return ([st.st_mode, st.st_ino, st.st_dev], st)
+    return ([st.st_mode, st.st_ino, st.st_dev, st.st_size, st.st_mtime_ns], st)
+
+
+def _command_kind(cmd):
+    """Return the kind of a replayable command, or None"""
+    cmd_type = type(cmd)
+    if cmd_type is Command.Truncate:
+        return 'truncate'
+    if cmd_type in (Command.Delete, Command.Shred):
+        return 'shred' if cmd.shred else 'delete'
+    return None
+
+
+def _normalize_operations(operations):
+    """Return operations with the option IDs sorted, for comparison"""
+    return {op: sorted(option_ids) for (op, option_ids) in operations.items()}
+
+
+class Plan:
+
+    """Commands recorded by a preview to replay in a clean"""
+
+    def __init__(self, operations, shred=False):
+        """Create an empty plan for a preview of operations
+
+        operations is a dictionary like the one given to Worker, and
+        shred is the value of the shred option during the preview.
+        """
+        self.operations = _normalize_operations(operations)
+        self.shred = shred
+        self.created = time.time()
+        # 'operation.option' -> list of [kind, path, size, fingerprint],
+        # or None if the commands cannot be replayed
+        self.items = {}
+        self.n_changed = 0
+        self._lock = threading.Lock()
+
+    def begin(self, key):
+        """Start recording the commands of key, such as 'system.tmp'"""
+        with self._lock:
+            self.items.setdefault(key, [])
+
+    def record(self, key, cmd):
+        """Record a command before it is previewed
+
+        Returns the record, whose size the caller may set from the result,
+        or None if the command cannot be replayed.
+        """
+        kind = _command_kind(cmd)
+        with self._lock:
+            items = self.items.get(key, [])
+            if kind is None or items is None:
+                self.items[key] = None
+                return None
+            (fp, _st) = fingerprint(cmd.path, cmd.lstat_result)
+            item = [kind, cmd.path, None, fp]
+            items.append(item)
+            self.items[key] = items
+            return item
+
+    def has(self, key):
+        """Return whether the commands of key can be replayed"""
+        with self._lock:
+            return self.items.get(key) is not None
+
+    def commands(self, key):
+        """Yield the recorded commands of key whose files did not change"""
+        with self._lock:
+            items = list(self.items.get(key) or ())
+        for (kind, path, _size, old_fp) in items:
+            (fp, st) = fingerprint(path)
+            if fp is None:
+                # Already gone
+                continue
+            if fp != old_fp:
+                logger.debug('Skipping path changed since the preview: %s', path)
+                with self._lock:
+                    self.n_changed += 1
+                continue
+            if kind == 'truncate':
+                yield Command.Truncate(path)
+            else:
+                yield Command.Delete(path, kind == 'shred', lstat_result=st)
+
+    def matches(self, operations, shred, max_age=None):
+        """Return whether this plan can clean operations"""
+        if max_age is not None and time.time() - self.created > max_age:
+            return False
+        if shred != self.shred:
+            return False
+        return self.operations == _normalize_operations(operations)
+
+    def save(self, path):
+        """Write the plan to a JSON file"""
+        with self._lock:
+            data = {'version': PLAN_VERSION,
+                    'created': self.created,
+                    'shred': self.shred,
+                    'operations': self.operations,
+                    'items': self.items}
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=1)
+
+    @classmethod
+    def load(cls, path):
+        """Read a plan from a JSON file
+
+        Raises ValueError if the file is not a plan of this version.
+        """
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, dict) or data.get('version') != PLAN_VERSION:
+            raise ValueError(f'Not a cleaning plan: {path}')
+        plan = cls(data['operations'], data['shred'])
+        plan.created = data['created']
+        plan.items = data['items']
+        return plan
@@ -38,7 +38,6 @@ from bleachbit.PathUtils import (
     expand_path_entries,
     normalize_path,
     path_equal,
-    path_has_relative_suffix,
     path_startswith,
 )
 
@@ -47,6 +46,12 @@ logger = logging.getLogger(__name__)
 # Cache for loaded protected paths
 _protected_paths_cache = None
 
+# (protected paths, _ProtectedIndex of them)
+_protected_index_cache = None
+
+# Paths under these are not protected, such as .git under ~/.cache/
+_EXEMPT_PATHS = ('~/.cache', '%temp%', '%tmp%', '/tmp')
+
 
 def _get_protected_path_xml():
     """Return the path to the protected_path.xml file."""
@@ -130,21 +135,28 @@ def load_protected_paths(force_reload=False):
     return _protected_paths_cache
 
 
-def _check_exempt(user_path):
+def _exempt_paths():
+    """Return the normalized exempt paths"""
+    exempt = []
+    for path in _EXEMPT_PATHS:
+        exempt_expanded = expand_path(path)
+        if exempt_expanded:
+            exempt.append(normalize_path(exempt_expanded))
+    return exempt
+
+
+def _check_exempt(user_path, exempt_paths=None):
     """Check if path is exempt from protection
 
     For ignoring paths like .git under ~/.cache/
+
+    exempt_paths is an optional result of _exempt_paths() to reuse.
     """
     assert isinstance(user_path, str)
-    exempt_paths = ('~/.cache', '%temp%', '%tmp%', '/tmp')
+    if exempt_paths is None:
+        exempt_paths = _exempt_paths()
     user_path_normalized = normalize_path(user_path)
-    for path in exempt_paths:
-        exempt_expanded = expand_path(path)
-        if not exempt_expanded:
-            continue
-
-        exempt_normalized = normalize_path(exempt_expanded)
-
+    for exempt_normalized in exempt_paths:
         if path_equal(user_path_normalized, exempt_normalized):
             return True
 
@@ -153,6 +165,127 @@ def _check_exempt(user_path):
     return False
 
 
+class _TrieNode:
+    """Node of a _ProtectedIndex trie, one per path component"""
+
+    __slots__ = ('children', 'entries', 'below')
+
+    def __init__(self):
+        self.children = {}
+        # Protected paths ending here
+        self.entries = []
+        # Indexes of the protected paths ending under this node
+        self.below = []
+
+    def child(self, part):
+        """Return the child for a path component, adding it if needed"""
+        node = self.children.get(part)
+        if node is None:
+            node = self.children[part] = _TrieNode()
+        return node
+
+
+class _ProtectedIndex:
+    """Protected paths compiled into tries of path components
+
+    Absolute paths go into a trie from the root, and relative paths go
+    into a trie of reversed components, which matches them as suffixes.
+    There is one pair of tries for case-sensitive paths and one for
+    case-insensitive paths, whose components are lowercase. The paths
+    are normalized once, so checking a path takes time proportional to
+    its depth instead of to the number of protected paths.
+
+    When several protected paths match, the first one in the XML wins.
+    """
+
+    def __init__(self, protected_paths):
+        self.protected_paths = protected_paths
+        # case_sensitive -> (absolute trie, relative suffix trie)
+        self._tries = {}
+        for (i, ppath) in enumerate(protected_paths):
+            case_sensitive = ppath['case_sensitive']
+            (absolute, relative) = self._tries.setdefault(
+                case_sensitive, (_TrieNode(), _TrieNode()))
+            protected_cmp = normalize_path(
+                ppath['path'], case_sensitive=case_sensitive)
+            if os.path.isabs(ppath['path']):
+                node = absolute
+                for part in protected_cmp.split(os.sep):
+                    node.below.append(i)
+                    node = node.child(part)
+                node.entries.append((i, ppath['depth']))
+            else:
+                suffix = protected_cmp.lstrip(os.sep)
+                node = relative
+                for part in reversed(suffix.split(os.sep)):
+                    node = node.child(part)
+                # A relative path with a leading separator cannot equal
+                # a whole user path.
+                node.entries.append((i, suffix == protected_cmp))
+
+    @staticmethod
+    def _match_absolute(trie, parts):
+        """Return the lowest index of a match in the absolute trie, or None"""
+        matches = []
+        node = trie
+        n_parts = len(parts)
+        for (n_walked, part) in enumerate(parts):
+            # The user path is a child of a protected path.
+            levels = n_parts - n_walked
+            matches.extend(i for (i, depth) in node.entries
+                           if depth is None or levels <= depth)
+            node = node.children.get(part)
+            if node is None:
+                return min(matches, default=None)
+        # An exact match
+        matches.extend(i for (i, _depth) in node.entries)
+        # The user path is a parent of protected paths.
+        matches.extend(node.below)
+        return min(matches, default=None)
+
+    @staticmethod
+    def _match_relative(trie, parts):
+        """Return the lowest index of a match in the suffix trie, or None"""
+        matches = []
+        node = trie
+        n_parts = len(parts)
+        for (n_walked, part) in enumerate(reversed(parts), 1):
+            node = node.children.get(part)
+            if node is None:
+                break
+            matches.extend(i for (i, may_equal) in node.entries
+                           if n_walked < n_parts or may_equal)
+        return min(matches, default=None)
+
+    def match(self, user_path):
+        """Return the first protected path matching user_path, or None"""
+        best = None
+        for (case_sensitive, (absolute, relative)) in self._tries.items():
+            user_cmp = normalize_path(user_path, case_sensitive=case_sensitive)
+            parts = user_cmp.split(os.sep)
+            for i in (self._match_absolute(absolute, parts),
+                      self._match_relative(relative, parts)):
+                if i is not None and (best is None or i < best):
+                    best = i
+        if best is None:
+            return None
+        return self.protected_paths[best]
+
+
+def _get_protected_index():
+    """Return the _ProtectedIndex of the loaded protected paths, or None"""
+    global _protected_index_cache
+    protected_paths = load_protected_paths()
+    if not protected_paths:
+        return None
+    cached = _protected_index_cache
+    if cached is not None and cached[0] is protected_paths:
+        return cached[1]
+    index = _ProtectedIndex(protected_paths)
+    _protected_index_cache = (protected_paths, index)
+    return index
+
+
 def check_protected_path(user_path):
     """Check if a user path matches a protected path.
 
@@ -165,52 +298,24 @@ def check_protected_path(user_path):
         - depth: The depth of the protection
         - case_sensitive: Whether the match was case-sensitive
     """
-    if _check_exempt(user_path):
-        return None
-    protected_paths = load_protected_paths()
-    if not protected_paths:
-        return None
-
-    for ppath in protected_paths:
-        protected = ppath['path']
-        depth = ppath['depth']
-        case_sensitive = ppath['case_sensitive']
-        user_cmp = normalize_path(user_path, case_sensitive=case_sensitive)
-        protected_cmp = normalize_path(
-            protected, case_sensitive=case_sensitive)
-
-        protected_is_absolute = os.path.isabs(ppath['path'])
-        if not protected_is_absolute:
-            # Relative protected paths should match when user path ends with them
-            if path_has_relative_suffix(user_cmp, protected_cmp,
-                                        case_sensitive=case_sensitive):
-                return ppath
-            continue
-
-        # Exact match
-        if path_equal(user_cmp, protected_cmp, case_sensitive=case_sensitive):
-            return ppath
+    return check_protected_paths([user_path])[0]
 
-        # Check if user path is a parent of protected path
-        # (user wants to delete a folder that contains protected items)
-        if path_startswith(protected_cmp, user_cmp,
-                           case_sensitive=case_sensitive):
-            return ppath
 
-        # Check if user path is a child of protected path (within depth)
-        if ((depth is None or depth > 0)
-                and path_startswith(user_cmp, protected_cmp,
-                                    case_sensitive=case_sensitive)):
-            if depth is None:
-                return ppath
-            # Calculate how many levels deep the user path is
-            protected_with_sep = protected_cmp + os.sep
-            relative = user_cmp[len(protected_with_sep):]
-            levels = relative.count(os.sep) + 1
-            if levels <= depth:
-                return ppath
+def check_protected_paths(user_paths):
+    """Check many user paths at once, such as paths dropped on the window.
 
-    return None
+    Returns a list with the result of check_protected_path() for each
+    path, in the same order.
+    """
+    exempt_paths = _exempt_paths()
+    index = _get_protected_index()
+    results = []
+    for user_path in user_paths:
+        if index is None or _check_exempt(user_path, exempt_paths):
+            results.append(None)
+        else:
+            results.append(index.match(user_path))
+    return results
 
 
 def calculate_impact(path):
@@ -296,5 +401,6 @@ def get_warning_message(user_path, impact):
 
 def clear_cache():
     """Clear the protected paths cache."""
-    global _protected_paths_cache
+    global _protected_paths_cache, _protected_index_cache
     _protected_paths_cache = None
+    _protected_index_cache = None
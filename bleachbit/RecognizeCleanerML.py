@@ -13,10 +13,11 @@ import hashlib
 import logging
 import os
 import sys
+from concurrent.futures import ThreadPoolExecutor
 
 # first party imports
 from bleachbit.Language import get_text as _, pget_text as _p
-from bleachbit.CleanerML import list_cleanerml_files
+from bleachbit.CleanerML import LOAD_THREADS, list_cleanerml_files
 from bleachbit.Options import options
 
 
@@ -131,8 +132,11 @@ class RecognizeCleanerML:
             options.set('hashsalt', self.salt)
         self.__scan()
 
-    def __recognized(self, pathname):
-        """Is pathname recognized?"""
+    def __hash_file(self, pathname):
+        """Return the salted hash of pathname, or None if it cannot be read
+
+        This is safe to call in a thread.
+        """
         # __init__ should set the salt.
         if not self.salt:
             raise RuntimeError('salt is not set')
@@ -140,8 +144,16 @@ class RecognizeCleanerML:
             with open(pathname, 'rb') as f:
                 body = f.read()
         except OSError:  # The file is locked, what to do next?
+            return None
+        return hashdigest(str.encode(self.salt, encoding='utf-8') + body)
+
+    def __recognized(self, pathname, new_hash):
+        """Is pathname recognized?
+
+        new_hash is from __hash_file().
+        """
+        if new_hash is None:
             return NEW, hashdigest(b"")
-        new_hash = hashdigest(str.encode(self.salt, encoding='utf-8') + body)
         known_hash = options.get_hashpath(pathname)
         if known_hash is None:
             return NEW, new_hash
@@ -152,9 +164,14 @@ class RecognizeCleanerML:
     def __scan(self):
         """Look for files and act accordingly"""
         changes = []
-        for pathname in sorted(list_cleanerml_files(local_only=True)):
-            pathname = os.path.abspath(pathname)
-            (status, myhash) = self.__recognized(pathname)
+        pathnames = [os.path.abspath(pathname)
+                     for pathname in sorted(list_cleanerml_files(local_only=True))]
+        # Reading and hashing the files runs in threads, and hashlib
+        # releases the GIL for large inputs.
+        with ThreadPoolExecutor(max_workers=LOAD_THREADS) as executor:
+            hashes = list(executor.map(self.__hash_file, pathnames))
+        for (pathname, new_hash) in zip(pathnames, hashes):
+            (status, myhash) = self.__recognized(pathname, new_hash)
             if NEW == status or CHANGED == status:
                 changes.append([pathname, status, myhash])
         if changes:
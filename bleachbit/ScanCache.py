@@ -0,0 +1,294 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright (c) 2008-2026 Andrew Ziem.
+#
+# This work is licensed under the terms of the GNU GPL, version 3 or
+# later.  See the COPYING file in the top-level directory.
+
+"""
+Persistent cache of directory listings
+
+A preview lists the same trees that the following clean lists again,
+such as browser caches with many thousands of files. The cache records
+each directory listing with the lstat() of every child, keyed by the
+modification time, change time, and inode of the directory. Creating,
+renaming, or deleting a child changes the modification time of the
+directory, so a listing whose directory is unchanged is reused without
+reading the directory or stat'ing its children. The modification time
+can be set back with utime(), but the change time cannot.
+
+Writing to an existing file does not change the directory, so the sizes
+in a cached listing may be stale. Listings older than MAX_AGE_SECS are
+therefore not reused.
+
+The cache holds the names of the files, so a clean drops the listings
+it used, and turning off the scan_cache option deletes the file.
+
+The cache is used on POSIX only, where the stat of a child is a system
+call; on Windows it comes with the directory listing.
+"""
+
+import json
+import logging
+import os
+import stat
+import threading
+import time
+
+import bleachbit
+
+logger = logging.getLogger(__name__)
+
+CACHE_VERSION = 2
+CACHE_FILENAME = 'scan_cache.json'
+MAX_AGE_SECS = 3600
+
+# A directory modified this recently may change again within the
+# resolution of its timestamp, so its listing is not cached.
+RACY_SECS = 2
+
+# Fields of os.stat_result that are not in its tuple form
+_STAT_EXTRA_FIELDS = ('st_blocks', 'st_atime', 'st_mtime', 'st_ctime')
+
+
+class CachedDirEntry:
+
+    """Stand-in for os.DirEntry rebuilt from a cached listing"""
+
+    __slots__ = ('name', 'path', '_is_dir', '_lstat')
+
+    def __init__(self, dirpath, name, is_dir, lstat_result):
+        self.name = name
+        self.path = os.path.join(dirpath, name)
+        self._is_dir = is_dir
+        self._lstat = lstat_result
+
+    def __fspath__(self):
+        return self.path
+
+    def __repr__(self):
+        return f'<CachedDirEntry {self.name!r}>'
+
+    def is_dir(self, follow_symlinks=True):
+        """Return whether this is a directory, like os.DirEntry.is_dir()"""
+        if follow_symlinks:
+            return self._is_dir
+        return stat.S_ISDIR(self._lstat.st_mode)
+
+    def is_file(self, follow_symlinks=True):
+        """Return whether this is a file, like os.DirEntry.is_file()"""
+        if follow_symlinks and self.is_symlink():
+            return os.path.isfile(self.path)
+        return stat.S_ISREG(self._lstat.st_mode)
+
+    def is_symlink(self):
+        """Return whether this is a symbolic link"""
+        return stat.S_ISLNK(self._lstat.st_mode)
+
+    def stat(self, follow_symlinks=True):
+        """Return the cached lstat(), or stat the target of a link"""
+        if follow_symlinks and self.is_symlink():
+            return os.stat(self.path)
+        return self._lstat
+
+
+def _encode_child(entry):
+    """Return a JSON-friendly record of an os.DirEntry, or None"""
+    try:
+        is_dir = entry.is_dir()
+    except OSError:
+        is_dir = False
+    try:
+        st = entry.stat(follow_symlinks=False)
+    except OSError:
+        return None
+    return [entry.name, is_dir, list(st), [getattr(st, f) for f in _STAT_EXTRA_FIELDS]]
+
+
+def _valid_record(record):
+    """Return whether a cached listing has the expected shape"""
+    if not isinstance(record, dict):
+        return False
+    key = record.get('key')
+    children = record.get('children')
+    if not isinstance(key, list) or len(key) != 4 \
+            or not isinstance(record.get('time'), (int, float)) \
+            or not isinstance(children, list):
+        return False
+    for child in children:
+        if not isinstance(child, list) or len(child) != 4:
+            return False
+        (name, _is_dir, st_tuple, st_extra) = child
+        if not isinstance(name, str) or not isinstance(st_tuple, list) \
+                or len(st_tuple) != 10 or not isinstance(st_extra, list) \
+                or len(st_extra) != len(_STAT_EXTRA_FIELDS):
+            return False
+    return True
+
+
+def _decode_child(dirpath, record):
+    (name, is_dir, st_tuple, st_extra) = record
+    lstat_result = os.stat_result(
+        st_tuple, dict(zip(_STAT_EXTRA_FIELDS, st_extra)))
+    return CachedDirEntry(dirpath, name, is_dir, lstat_result)
+
+
+class ScanCache:
+
+    """Directory listings saved between previews and cleans"""
+
+    def __init__(self, path=None):
+        # None means the file in the options directory
+        self._path = path
+        self._dirs = None
+        # Directories looked up or stored since the last save()
+        self._used = set()
+        self._dirty = False
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def path(self):
+        """Return the path of the cache file"""
+        return self._path or os.path.join(bleachbit.options_dir, CACHE_FILENAME)
+
+    def _load(self):
+        """Read the cache file on first use"""
+        if self._dirs is not None:
+            return
+        self._dirs = {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.debug('Ignoring scan cache %s: %s', self.path, e)
+            return
+        if not isinstance(data, dict) or data.get('version') != CACHE_VERSION:
+            return
+        dirs = data.get('dirs')
+        if not isinstance(dirs, dict) \
+                or not all(_valid_record(record) for record in dirs.values()):
+            logger.debug('Ignoring malformed scan cache %s', self.path)
+            return
+        oldest = time.time() - MAX_AGE_SECS
+        self._dirs = {dirpath: record
+                      for (dirpath, record) in dirs.items()
+                      if record['time'] >= oldest}
+
+    @staticmethod
+    def _key(dir_stat):
+        return [dir_stat.st_mtime_ns, dir_stat.st_ctime_ns, dir_stat.st_ino,
+                dir_stat.st_dev]
+
+    def lookup(self, dirpath, dir_stat):
+        """Return cached os.DirEntry stand-ins for dirpath, or None
+
+        dir_stat is a fresh os.stat() of dirpath.
+        """
+        with self._lock:
+            self._load()
+            record = self._dirs.get(dirpath)
+            self._used.add(dirpath)
+            if record is None or record['key'] != self._key(dir_stat) \
+                    or record['time'] < time.time() - MAX_AGE_SECS:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return [_decode_child(dirpath, child) for child in record['children']]
+
+    def store(self, dirpath, dir_stat, entries):
+        """Record the listing of dirpath
+
+        dir_stat must be taken before listing, so that a change during
+        the listing makes the record stale. Returns whether it was stored.
+        """
+        now = time.time()
+        if dir_stat.st_mtime > now - RACY_SECS:
+            return False
+        children = []
+        for entry in entries:
+            child = _encode_child(entry)
+            if child is None:
+                # Vanished during the listing
+                return False
+            children.append(child)
+        with self._lock:
+            self._load()
+            self._dirs[dirpath] = {'key': self._key(dir_stat), 'time': now,
+                                   'children': children}
+            self._used.add(dirpath)
+            self._dirty = True
+        return True
+
+    def invalidate(self, path):
+        """Forget the listings of path and of its parent directory"""
+        with self._lock:
+            if not self._dirs:
+                return
+            for dirpath in (path, os.path.dirname(path)):
+                if self._dirs.pop(dirpath, None) is not None:
+                    self._dirty = True
+
+    def clear(self):
+        """Forget all listings"""
+        with self._lock:
+            self._dirs = {}
+            self._dirty = True
+
+    def delete(self):
+        """Forget all listings and delete the cache file"""
+        with self._lock:
+            self._dirs = {}
+            self._used = set()
+            self._dirty = False
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning('Failed to delete scan cache %s: %s', self.path, e)
+
+    def save(self, cleaned=False):
+        """Write the cache file if it changed
+
+        cleaned is True after a clean. The listings used by it are then
+        dropped, so the cache does not keep the names of cleaned files.
+        """
+        with self._lock:
+            if cleaned and self._dirs:
+                for dirpath in self._used:
+                    if self._dirs.pop(dirpath, None) is not None:
+                        self._dirty = True
+            self._used = set()
+            if not self._dirty:
+                return
+            data = {'version': CACHE_VERSION, 'dirs': dict(self._dirs)}
+            self._dirty = False
+        logger.debug('Saving scan cache: %d directories, %d hits, %d misses',
+                     len(data['dirs']), self.hits, self.misses)
+        tmp_path = self.path + '.tmp'
+        try:
+            # The listings name other users' files, so only the owner
+            # may read them.
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            os.fchmod(fd, 0o600)
+            with open(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning('Failed to save scan cache %s: %s', self.path, e)
+
+
+scan_cache = ScanCache()
+
+
+def get_scan_cache():
+    """Return the scan cache if enabled by the scan_cache option, or None"""
+    if not bleachbit.IS_POSIX:
+        return None
+    from bleachbit.Options import options
+    if not options.get('scan_cache'):
+        return None
+    return scan_cache
@@ -24,17 +24,19 @@ Cross-platform, special cleaning operations
 
 # standard library imports
 import contextlib
+import functools
 import json
 import logging
 import os
-import xml.dom.minidom
-from urllib.parse import quote, urlparse, urlunparse
+from urllib.parse import urlparse, urlunparse
 
 
 # local application imports
-from bleachbit import FileUtilities, IS_WINDOWS
+from bleachbit import FileUtilities
 from bleachbit.General import reject_xml_dtd
 from bleachbit.Options import options
+from bleachbit.SqliteSession import current_session, sqlite_session
+from bleachbit.SqliteSession import sqlite_uri as _sqlite_uri
 
 logger = logging.getLogger(__name__)
 
@@ -51,22 +53,13 @@ def __get_chrome_history(path, fn='History'):
     return ver
 
 
-def _sqlite_uri(pathname, mode=None):
-    """Return a safe SQLite file: URI for pathname.
-
-    The path is percent-encoded so a character such as '?' cannot be
-    misparsed as the start of the URI query and defeat the mode. mode is
-    an optional open mode ('ro', 'rw', ...); None omits it (default rwc).
-    """
-    assert isinstance(pathname, str)
-    abs_path = os.path.abspath(pathname)
-    if IS_WINDOWS:
-        abs_path = abs_path.replace('\\', '/')
-    quoted = quote(abs_path, safe='/:')
-    uri = f'file:{quoted}'
-    if mode:
-        uri += f'?mode={mode}'
-    return uri
+def _in_sqlite_session(func):
+    """Decorate a cleaning function to share SQLite connections"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with sqlite_session():
+            return func(*args, **kwargs)
+    return wrapper
 
 
 def _sqlite_readonly_uri(pathname):
@@ -81,20 +74,17 @@ def _quote_sqlite_identifier(name):
     return '"' + name.replace('"', '""') + '"'
 
 
-def _escape_sqlite_str_literal(value):
-    """Escape a value for use in a single-quoted SQLite string literal.
-
-    Double quotes are an identifier in standard SQL; SQLite only accepts
-    them as a string when built with SQLITE_DQS enabled.
-    """
-    return value.replace("'", "''")
-
-
 def sqlite_table_exists(pathname, table):
     """Check whether a table exists in the SQLite database"""
     # In FreeBSD, sqlite3 is a separate package
     # pylint: disable=import-outside-toplevel
     import sqlite3
+    session = current_session()
+    if session is not None:
+        try:
+            return table in session.table_names(pathname)
+        except sqlite3.OperationalError:
+            return False
     cmd = "select name from sqlite_master where type='table' and name=?;"
     try:
         uri = _sqlite_readonly_uri(pathname)
@@ -111,6 +101,10 @@ def _sqlite_is_valid_database(pathname):
     """Return boolean indicating whether pathname points to a readable SQLite database."""
     import sqlite3  # pylint: disable=import-outside-toplevel
     try:
+        session = current_session()
+        if session is not None:
+            session.table_names(pathname)
+            return True
         uri = _sqlite_readonly_uri(pathname)
         with contextlib.closing(sqlite3.connect(uri, uri=True)) as conn:
             conn.execute('select 1 from sqlite_master limit 1;')
@@ -120,10 +114,10 @@ def _sqlite_is_valid_database(pathname):
 
 
 def __shred_sqlite_char_columns(table, cols=None, where="", path=None):
-    """Create an SQL command to shred character columns"""
+    """Create a batch of SQL statements to shred character columns"""
     if path and not sqlite_table_exists(path, table):
-        return ""
-    cmd = ""
+        return []
+    batch = []
     if not where:
         # If None, set to empty string.
         where = ""
@@ -133,9 +127,17 @@ def __shred_sqlite_char_columns(table, cols=None, where="", path=None):
             updates = [f'{_quote_sqlite_identifier(col)} = '
                        f'{blob_type}(length({_quote_sqlite_identifier(col)}))'
                        for col in cols]
-            cmd += f"update or ignore {quoted_table} set {', '.join(updates)} {where};"
-    cmd += f"delete from {quoted_table} {where};"
-    return cmd
+            batch.append(
+                (f"update or ignore {quoted_table} set {', '.join(updates)} {where}", ()))
+    batch.append((f"delete from {quoted_table} {where}", ()))
+    return batch
+
+
+def _execute_sqlite_batch(path, batch):
+    """Execute a batch of SQL statements and return the rows deleted"""
+    rowcounts = FileUtilities.execute_sqlite3(path, batch)
+    return sum(rowcount for ((sql, _params), rowcount) in zip(batch, rowcounts)
+               if rowcount > 0 and sql.startswith('delete '))
 
 
 def get_sqlite_int(path, sql, parameters=()):
@@ -149,6 +151,12 @@ def get_sqlite_int(path, sql, parameters=()):
 def _get_sqlite_values(path, sql, row_factory=None, parameters=()):
     """Run SQL on database in 'path' and return the integers"""
     import sqlite3  # pylint: disable=import-outside-toplevel
+    session = current_session()
+    if session is not None:
+        cursor = session.connection(path).cursor()
+        if row_factory is not None:
+            cursor.row_factory = row_factory
+        return cursor.execute(sql, parameters).fetchall()
     with contextlib.closing(sqlite3.connect(_sqlite_readonly_uri(path), uri=True)) as conn:
         if row_factory is not None:
             conn.row_factory = row_factory
@@ -156,6 +164,7 @@ def _get_sqlite_values(path, sql, row_factory=None, parameters=()):
         return cursor.fetchall()
 
 
+@_in_sqlite_session
 def delete_chrome_autofill(path):
     """Delete autofill table in Chromium/Google Chrome 'Web Data' database"""
     cols = ('name', 'value', 'value_lower')
@@ -186,17 +195,19 @@ def delete_chrome_autofill(path):
         'company_name', 'street_address', 'address_1', 'address_2', 'address_3', 'address_4',
         'postal_code', 'country_code', 'language_code', 'recipient_name', 'phone_number')
     cmds += __shred_sqlite_char_columns('server_addresses', cols, path=path)
-    FileUtilities.execute_sqlite3(path, cmds)
+    return _execute_sqlite_batch(path, cmds)
 
 
+@_in_sqlite_session
 def delete_chrome_databases_db(path):
     """Delete remote HTML5 cookies (avoiding extension data) from the Databases.db file"""
     cols = ('origin', 'name', 'description')
     where = "where origin not like 'chrome-%'"
     cmds = __shred_sqlite_char_columns('Databases', cols, where, path)
-    FileUtilities.execute_sqlite3(path, cmds)
+    return _execute_sqlite_batch(path, cmds)
 
 
+@_in_sqlite_session
 def delete_chrome_favicons(path):
     """Delete Google Chrome and Chromium favicons not use in in history for bookmarks"""
 
@@ -206,7 +217,7 @@ def delete_chrome_favicons(path):
     else:
         # assume it's the newer version
         ver = 38
-    cmds = ""
+    cmds = []
 
     if ver >= 4:
         # Version 4 includes Chromium 12
@@ -225,7 +236,7 @@ def delete_chrome_favicons(path):
         cols = ('page_url',)
         where = None
         if os.path.exists(path_history):
-            cmds += f"attach database '{_escape_sqlite_str_literal(path_history)}' as History;"
+            cmds.append(('attach database ? as History', (path_history,)))
             where = "where page_url not in (select distinct url from History.urls)"
         cmds += __shred_sqlite_char_columns('icon_mapping', cols, where, path)
 
@@ -250,15 +261,16 @@ def delete_chrome_favicons(path):
         cols = ('url', 'image_data')
         where = None
         if os.path.exists(path_history):
-            cmds += f"attach database '{_escape_sqlite_str_literal(path_history)}' as History;"
+            cmds.append(('attach database ? as History', (path_history,)))
             where = "where id not in(select distinct favicon_id from History.urls)"
         cmds += __shred_sqlite_char_columns('favicons', cols, where, path)
     else:
         raise RuntimeError(f'{path} is version {ver}')
 
-    FileUtilities.execute_sqlite3(path, cmds)
+    return _execute_sqlite_batch(path, cmds)
 
 
+@_in_sqlite_session
 def delete_chrome_history(path):
     """Clean history from History and Favicon files without affecting bookmarks"""
     if not os.path.exists(path):
@@ -293,16 +305,17 @@ def delete_chrome_history(path):
                 'downloads', ('full_path', 'url'), path=path)
         cmds += __shred_sqlite_char_columns('segments', ('name',), path=path)
         cmds += __shred_sqlite_char_columns('segment_usage', path=path)
-    FileUtilities.execute_sqlite3(path, cmds)
+    return _execute_sqlite_batch(path, cmds)
 
 
+@_in_sqlite_session
 def delete_chrome_keywords(path):
     """Delete keywords table in Chromium/Google Chrome 'Web Data' database"""
     cols = ('short_name', 'keyword', 'favicon_url',
             'originating_url', 'suggest_url')
     where = "where not date_created = 0"
     cmds = __shred_sqlite_char_columns('keywords', cols, where, path)
-    cmds += "update keywords set usage_count = 0;"
+    cmds.append(("update keywords set usage_count = 0", ()))
     ver = __get_chrome_history(path, 'Web Data')
     if 43 <= ver < 49:
         # keywords_backup table first seen in Google Chrome 17 / Chromium 17
@@ -310,9 +323,9 @@ def delete_chrome_keywords(path):
         # In Google Chrome 25, the table is gone.
         cmds += __shred_sqlite_char_columns('keywords_backup',
                                             cols, where, path)
-        cmds += "update keywords_backup set usage_count = 0;"
+        cmds.append(("update keywords_backup set usage_count = 0", ()))
 
-    FileUtilities.execute_sqlite3(path, cmds)
+    return _execute_sqlite_batch(path, cmds)
 
 
 def delete_office_registrymodifications(path):
@@ -320,6 +333,7 @@ def delete_office_registrymodifications(path):
     with open(path, 'rb') as f:
         data = f.read()
     reject_xml_dtd(data, 'registrymodifications.xcu')
+    import xml.dom.minidom  # pylint: disable=import-outside-toplevel
     dom1 = xml.dom.minidom.parseString(data)
     modified = False
     pathprefix = '/org.openoffice.Office.Histories/Histories/'
@@ -336,6 +350,7 @@ def delete_office_registrymodifications(path):
             dom1.writexml(xml_file)
 
 
+@_in_sqlite_session
 def delete_mozilla_url_history(path):
     """Delete URL history in Mozilla places.sqlite (Firefox 3 and family)"""
 
@@ -349,7 +364,7 @@ def delete_mozilla_url_history(path):
     if not _sqlite_is_valid_database(path):
         raise sqlite3.DatabaseError(f"{path} is not a valid SQLite database")
 
-    cmds = ""
+    cmds = []
 
     have_places = sqlite_table_exists(path, 'moz_places')
 
@@ -358,21 +373,22 @@ def delete_mozilla_url_history(path):
         places_suffix = "where id in (select " \
             "moz_places.id from moz_places " \
             "left join moz_bookmarks on moz_bookmarks.fk = moz_places.id " \
-            "where moz_bookmarks.id is null); "
+            "where moz_bookmarks.id is null)"
 
         cols = ('url', 'rev_host', 'title')
         cmds += __shred_sqlite_char_columns('moz_places',
                                             cols, places_suffix, path)
 
         # For any bookmarks that remain in moz_places, reset the non-character values.
-        cmds += "update moz_places set visit_count=0, frecency=-1, last_visit_date=null;"
+        cmds.append(("update moz_places set visit_count=0, frecency=-1, "
+                     "last_visit_date=null", ()))
 
         # delete any orphaned annotations in moz_annos
         annos_suffix = "where id in (select moz_annos.id " \
             "from moz_annos " \
             "left join moz_places " \
             "on moz_annos.place_id = moz_places.id " \
-            "where moz_places.id is null); "
+            "where moz_places.id is null)"
 
         cmds += __shred_sqlite_char_columns(
             'moz_annos', ('content', ), annos_suffix, path)
@@ -383,7 +399,7 @@ def delete_mozilla_url_history(path):
     # change probably happened before version 78.
     if have_places and sqlite_table_exists(path, 'moz_favicons'):
         fav_suffix = "where id not in (select favicon_id " \
-            "from moz_places where favicon_id is not null ); "
+            "from moz_places where favicon_id is not null)"
         cols = ('url', 'data')
         cmds += __shred_sqlite_char_columns('moz_favicons',
                                             cols, fav_suffix, path)
@@ -394,14 +410,14 @@ def delete_mozilla_url_history(path):
         cmds += __shred_sqlite_char_columns('moz_origins',
                                             ('host',), origins_where, path)
         # For any remaining origins, reset the statistic.
-        cmds += "update moz_origins set frecency=-1;"
+        cmds.append(("update moz_origins set frecency=-1", ()))
 
     if sqlite_table_exists(path, 'moz_meta'):
-        cmds += "delete from moz_meta where key like 'origin_frecency_%';"
+        cmds.append(("delete from moz_meta where key like 'origin_frecency_%'", ()))
 
     # Delete all history visits.
     if sqlite_table_exists(path, "moz_historyvisits"):
-        cmds += "delete from moz_historyvisits;"
+        cmds.append(("delete from moz_historyvisits", ()))
 
     # delete any orphaned input history
     if have_places:
@@ -416,10 +432,10 @@ def delete_mozilla_url_history(path):
     # https://support.mozilla.org/en-US/questions/937290#answer-400987
     if sqlite_table_exists(path, 'moz_hosts'):
         cmds += __shred_sqlite_char_columns('moz_hosts', ('host',), path=path)
-        cmds += "delete from moz_hosts;"
+        cmds.append(("delete from moz_hosts", ()))
 
     # execute the commands
-    FileUtilities.execute_sqlite3(path, cmds)
+    return _execute_sqlite_batch(path, cmds)
 
 
 def _remove_path_from_url(url):
@@ -433,15 +449,16 @@ def _remove_path_from_url(url):
     return urlunparse((url.scheme, url.netloc, '', '', '', ''))
 
 
+@_in_sqlite_session
 def delete_mozilla_favicons(path):
     """Delete favorites icons in Mozilla places.favicons
 
     Bookmarks are not deleted."""
 
-    cmds = ""
+    cmds = []
 
     places_path = os.path.join(os.path.dirname(path), 'places.sqlite')
-    cmds += f"attach database '{_escape_sqlite_str_literal(places_path)}' as places;"
+    cmds.append(('attach database ? as places', (places_path,)))
 
     bookmarked_urls_query = ("select url from {db}moz_places where id in "
                              "(select distinct fk from {db}moz_bookmarks "
@@ -460,8 +477,8 @@ def delete_mozilla_favicons(path):
     # This intermediate cleaning is needed for the next query to favicons
     # db which collects icon ids that don't have a bookmark or have domain
     # level bookmark.
-    FileUtilities.execute_sqlite3(path, cmds)
-    cmds = ""
+    n_rows = _execute_sqlite_batch(path, cmds)
+    cmds = []
 
     # Collect favicons that are not bookmarked with their full url,
     # which collects also domain level bookmarks.
@@ -473,12 +490,12 @@ def delete_mozilla_favicons(path):
     # duplication. This is because the first usage of bookmarks
     # is for refining further queries to favicons db and if we
     # first extract the bookmarks as a Python list and give them
-    # to the query we could cause an error in execute_sqlite3 since
-    # it splits the cmds string by ';' and bookmarked url could
-    # contain a ';'. Also if we have a Python list with urls we
-    # need to pay attention to escaping JavaScript strings in some
-    # bookmarks and probably other things. So the safer way for now
-    # is to not compose a query with Python list of extracted urls.
+    # to the query we would need to bind one parameter per url, and
+    # SQLite caps the number of parameters. Also if we have a Python
+    # list with urls we need to pay attention to escaping JavaScript
+    # strings in some bookmarks and probably other things. So the safer
+    # way for now is to not compose a query with Python list of
+    # extracted urls.
 
     def row_factory(_cursor, row):
         return row[0]
@@ -509,7 +526,8 @@ def delete_mozilla_favicons(path):
         cols = ('icon_url', 'data')
         cmds += __shred_sqlite_char_columns('moz_icons',
                                             cols, icons_where, path)
-        FileUtilities.execute_sqlite3(path, cmds)
+        n_rows += _execute_sqlite_batch(path, cmds)
+    return n_rows
 
 
 def get_chrome_bookmark_ids(history_path):
@@ -0,0 +1,143 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright (c) 2008-2026 Andrew Ziem.
+#
+# This work is licensed under the terms of the GNU GPL, version 3 or
+# later.  See the COPYING file in the top-level directory.
+
+"""
+Shared SQLite connections for one cleaning operation
+
+Cleaning a browser database checks which tables exist, reads a few
+values, and then runs the cleaning statements. Each helper used to open
+and close its own connection, so cleaning places.sqlite opened it about
+eight times. Inside sqlite_session(), the helpers share one connection
+per database and the list of tables, and the connections are closed
+together at the end.
+"""
+
+import contextlib
+import logging
+import os
+import threading
+from urllib.parse import quote
+
+from bleachbit import IS_WINDOWS
+from bleachbit.General import gc_collect
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def sqlite_uri(pathname, mode=None):
+    """Return a safe SQLite file: URI for pathname.
+
+    The path is percent-encoded so a character such as '?' cannot be
+    misparsed as the start of the URI query and defeat the mode. mode is
+    an optional open mode ('ro', 'rw', ...); None omits it (default rwc).
+    """
+    assert isinstance(pathname, str)
+    abs_path = os.path.abspath(pathname)
+    if IS_WINDOWS:
+        abs_path = abs_path.replace('\\', '/')
+    quoted = quote(abs_path, safe='/:')
+    uri = f'file:{quoted}'
+    if mode:
+        uri += f'?mode={mode}'
+    return uri
+
+
+class SqliteSession:
+
+    """One connection per SQLite database, closed together"""
+
+    def __init__(self):
+        # absolute path -> (connection, readonly)
+        self._connections = {}
+        # absolute path -> set of table names
+        self._tables = {}
+        self.n_opened = 0
+
+    def connection(self, path, readonly=True):
+        """Return the connection to the database at path
+
+        A read-only connection is opened with mode=ro, so it never
+        creates the file. A read-write connection is opened like
+        sqlite3.connect(path). A read-write connection also serves
+        reads, and asking for one replaces a read-only connection.
+        """
+        # In FreeBSD, sqlite3 is a separate package
+        import sqlite3  # pylint: disable=import-outside-toplevel
+        key = os.path.abspath(path)
+        existing = self._connections.get(key)
+        if existing is not None:
+            (conn, conn_readonly) = existing
+            if readonly or not conn_readonly:
+                return conn
+            self.close_database(path)
+        if readonly:
+            conn = sqlite3.connect(sqlite_uri(path, 'ro'), uri=True)
+        else:
+            conn = sqlite3.connect(path)
+        self.n_opened += 1
+        self._connections[key] = (conn, readonly)
+        return conn
+
+    def table_names(self, path):
+        """Return the set of table names in the database at path"""
+        key = os.path.abspath(path)
+        tables = self._tables.get(key)
+        if tables is None:
+            conn = self.connection(path)
+            rows = conn.execute(
+                "select name from sqlite_master where type='table'").fetchall()
+            tables = self._tables[key] = {row[0] for row in rows}
+        return tables
+
+    def schema_changed(self, path):
+        """Forget the cached table names of the database at path"""
+        self._tables.pop(os.path.abspath(path), None)
+
+    def close_database(self, path):
+        """Close the connection to one database, such as before deleting it"""
+        key = os.path.abspath(path)
+        existing = self._connections.pop(key, None)
+        self._tables.pop(key, None)
+        if existing is not None:
+            existing[0].close()
+
+    def close(self):
+        """Close all connections"""
+        for (conn, _readonly) in self._connections.values():
+            conn.close()
+        self._connections.clear()
+        self._tables.clear()
+        if self.n_opened:
+            logger.debug('SQLite session opened %d connections',
+                         self.n_opened)
+            # Release the files on Windows once, not after each statement.
+            gc_collect()
+
+
+def current_session():
+    """Return the SQLite session of the calling thread, or None"""
+    return getattr(_local, 'session', None)
+
+
+@contextlib.contextmanager
+def sqlite_session():
+    """Share SQLite connections in the calling thread
+
+    Nested sessions use the outermost one, which closes the connections
+    when it ends.
+    """
+    session = current_session()
+    if session is not None:
+        yield session
+        return
+    session = _local.session = SqliteSession()
+    try:
+        yield session
+    finally:
+        _local.session = None
+        session.close()
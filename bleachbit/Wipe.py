@@ -11,11 +11,14 @@ File wiping
 import atexit
 import ctypes
 import errno
+import mmap
 import os
+import queue
 import secrets
 import string
 import struct
 import tempfile
+import threading
 import time
 import warnings
 import logging
@@ -51,6 +54,22 @@ WINDOWS_RESERVED_FILENAMES.update(
 WINDOWS_RESERVED_FILENAMES.update(
     {'LPT%d' % number for number in range(1, 10)})
 
+# wipe_path() writes blocks of this many bytes from one reusable buffer.
+WIPE_BLOCK_SIZE = 4 * 1024 * 1024
+
+# O_DIRECT writes must start and end on this boundary.
+DIRECT_IO_ALIGNMENT = 4096
+
+# wipe_path() reserves this many bytes ahead of the writes with
+# fallocate() on file systems that support it natively. Elsewhere,
+# posix_fallocate() would emulate it by writing, which is slower.
+FALLOCATE_SIZE = 256 * 1024 * 1024
+FALLOCATE_FILESYSTEMS = ('btrfs', 'ext4', 'f2fs', 'tmpfs', 'xfs')
+
+# Because FAT32 has a maximum file size of 4,294,967,295 bytes,
+# wipe_path() creates multiple files there.
+VFAT_MAX_FILE_SIZE = 4 * 1024 * 1024 * 1024 - WIPE_BLOCK_SIZE
+
 
 def __random_string(length):
     """Return random alphanumeric characters of given length"""
@@ -192,6 +211,28 @@ def sync():
         ctypes.cdll.LoadLibrary('msvcrt.dll')._flushall()
 
 
+def _set_direct_io(f, enable):
+    """Turn O_DIRECT on or off for an open file, and return whether it is on
+
+    O_DIRECT writes bypass the page cache, so filling a disk does not
+    push everything else out of memory. It exists only on some systems,
+    and some file systems refuse it.
+    """
+    if not hasattr(os, 'O_DIRECT') or not IS_POSIX:
+        return False
+    try:
+        fd = f.fileno()
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        if enable:
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags | os.O_DIRECT)
+        else:
+            fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_DIRECT)
+    except (OSError, ValueError) as e:
+        logger.debug('Cannot set O_DIRECT=%s: %s', enable, e)
+        return False
+    return enable
+
+
 def wipe_write(path):
     """Overwrite a file's contents with zeros without truncating it.
 
@@ -328,7 +369,13 @@ def wipe_name(pathname1):
 
 def wipe_path(pathname, idle=False):
     """Wipe the free space in the path
-    This function uses an iterator to update the GUI."""
+    This function uses an iterator to update the GUI.
+
+    The files are filled with large blocks from one zeroed buffer that
+    is aligned to the page size, with O_DIRECT where the file system
+    allows it, and with space reserved ahead by fallocate() where the
+    file system supports it.
+    """
     # pylint: disable=import-outside-toplevel
     from bleachbit.FileUtilities import delete, free_space, get_filesystem_type, truncate_f
 
@@ -339,7 +386,9 @@ def wipe_path(pathname, idle=False):
         f = None
         while True:
             try:
+                # Unbuffered, so the blocks are written without copies
                 f = tempfile.NamedTemporaryFile(
+                    buffering=0,
                     dir=pathname,
                     suffix=__random_string(maxlen),
                     delete=False,
@@ -366,11 +415,9 @@ def wipe_path(pathname, idle=False):
 
     def estimate_completion():
         """Return (percent, seconds) to complete"""
-        remaining_bytes = free_space(pathname)
-        done_bytes = start_free_bytes - remaining_bytes
-        if done_bytes < 0:
-            # maybe user deleted large file after starting wipe
-            done_bytes = 0
+        # Count the bytes written instead of asking the file system.
+        done_bytes = min(total_bytes, start_free_bytes)
+        remaining_bytes = start_free_bytes - done_bytes
         if 0 == start_free_bytes:
             done_percent = 0
         else:
@@ -378,6 +425,8 @@ def wipe_path(pathname, idle=False):
         done_time = time.time() - start_time
         rate = done_bytes / (done_time + 0.0001)  # bytes per second
         remaining_seconds = int(remaining_bytes / (rate + 0.0001))
+        logger.debug('Wiping at %.2f MB/s, %d bytes remaining',
+                     rate / (1000 * 1000), remaining_bytes)
         return 1, done_percent, remaining_seconds
 
     # Get the file system type from the given path
@@ -402,10 +451,14 @@ def wipe_path(pathname, idle=False):
     start_time = time.time()
     done_wiping = False
     disk_full = False
+    max_file_bytes = VFAT_MAX_FILE_SIZE if fstype == 'vfat' else None
+    # An anonymous map is zeroed and aligned to the page size.
+    buffer = mmap.mmap(-1, WIPE_BLOCK_SIZE)
+    blanks = memoryview(buffer)
     try:
 
-        # Because FAT32 has a maximum file size of 4,294,967,295 bytes,
-        # this loop is sometimes necessary to create multiple files.
+        # Because FAT32 has a maximum file size, this loop is sometimes
+        # necessary to create multiple files.
         while True:
             try:
                 logger.debug(
@@ -425,33 +478,51 @@ def wipe_path(pathname, idle=False):
             files.append(f)
             last_idle = time.time()
             # Write large blocks to quickly fill the disk.
-            blanks = b'\0' * 65536
-            writtensize = 0
+            block_size = WIPE_BLOCK_SIZE
+            file_bytes = 0
+            direct = _set_direct_io(f, True)
+            reserved_bytes = 0
+            reserve_size = FALLOCATE_SIZE \
+                if fstype in FALLOCATE_FILESYSTEMS and hasattr(os, 'posix_fallocate') else 0
 
             while True:
-
-                try:
-                    if fstype != 'vfat':
-                        f.write(blanks)
-                    # On Ubuntu, the size of file should be less than
-                    # 4GB. If not, there should be EFBIG error, so the
-                    # maximum file size should be less than or equal to
-                    # "4GB - 65536byte".
-                    elif writtensize < 4 * 1024 * 1024 * 1024 - 65536:
-                        writtensize += f.write(blanks)
-                    else:
+                size = block_size
+                if max_file_bytes is not None:
+                    size = min(size, max_file_bytes - file_bytes)
+                    if size <= 0:
                         break
+                if direct and (size % DIRECT_IO_ALIGNMENT or file_bytes % DIRECT_IO_ALIGNMENT):
+                    direct = _set_direct_io(f, False)
+                if reserve_size and file_bytes + size > reserved_bytes:
+                    try:
+                        os.posix_fallocate(
+                            f.fileno(), reserved_bytes, reserve_size)
+                        reserved_bytes += reserve_size
+                    except OSError as e:
+                        if e.errno == errno.ENOSPC and reserve_size > WIPE_BLOCK_SIZE:
+                            # Reserve less next time.
+                            reserve_size //= 2
+                        else:
+                            # Write the rest without reserving.
+                            reserve_size = 0
 
+                try:
+                    written = f.write(blanks[:size])
+                    file_bytes += written
+                    total_bytes += written
                 except IOError as e:
                     if e.errno in (errno.ENOSPC, errno.EDQUOT):
-                        if len(blanks) > 1:
+                        if block_size > 1:
                             # Try writing smaller blocks
-                            blanks = blanks[0:len(blanks) // 2]
+                            block_size //= 2
                         else:
                             disk_full = True
                             break
                     elif e.errno == errno.EFBIG:
                         break
+                    elif e.errno == errno.EINVAL and direct:
+                        # The file system refused the O_DIRECT write.
+                        direct = _set_direct_io(f, False)
                     else:
                         raise
                 if idle and (time.time() - last_idle) > 2:
@@ -481,10 +552,6 @@ def wipe_path(pathname, idle=False):
                     disk_full = True
                 else:
                     raise
-            # For statistics
-            total_bytes += f.tell()
-            # sync to disk
-            sync()
             # statistics
             elapsed_sec = time.time() - start_time
             rate_mbs = (total_bytes / (1000 * 1000)) / \
@@ -528,6 +595,8 @@ def wipe_path(pathname, idle=False):
                 logger.debug(
                     'Estimated free space %s is less than 2 bytes, breaking', estimated_free_space)
                 break
+        # sync to disk once, after each file was synced
+        sync()
         done_wiping = True
     finally:
         # Ensure files are closed and deleted even if an exception
@@ -559,3 +628,111 @@ def wipe_path(pathname, idle=False):
             except Exception as e:
                 logger.error(
                     'After wiping, error deleting file %s: %s', f.name, e)
+
+
+def _wipe_device(events, stop, key, pathnames):
+    """Wipe paths on one device one after another in a thread
+
+    Progress of wipe_path() is put in events as (key, progress), and
+    (key, None) marks the end. Exceptions are put as (key, exception).
+    """
+    try:
+        for pathname in pathnames:
+            wiper = wipe_path(pathname, idle=True)
+            try:
+                for ret in wiper:
+                    events.put((key, ret))
+                    if stop.is_set():
+                        return
+            finally:
+                # Delete the temporary files now.
+                wiper.close()
+    except Exception as e:  # pylint: disable=broad-except
+        events.put((key, e))
+    finally:
+        events.put((key, None))
+
+
+def wipe_paths(pathnames, idle=False, writers_per_device=1):
+    """Wipe the free space in several paths
+
+    Paths on different devices are wiped at the same time, and paths on
+    one device are wiped one after another. With writers_per_device
+    above 1, each device is filled by that many threads at once, which
+    keeps a device with a deep queue busy.
+
+    With idle, this yields (1, percent, seconds) like wipe_path(). The
+    percent is averaged over the devices, and the seconds are of the
+    slowest device.
+    """
+    devices = {}
+    for pathname in pathnames:
+        try:
+            device = os.stat(pathname).st_dev
+        except OSError:
+            # Let wipe_path() report the error.
+            device = pathname
+        devices.setdefault(device, []).append(pathname)
+    if len(devices) < 2 and writers_per_device < 2:
+        for pathname in pathnames:
+            yield from wipe_path(pathname, idle)
+        return
+
+    logger.debug('Wiping %d devices with %d writers each',
+                 len(devices), writers_per_device)
+    events = queue.Queue()
+    stop = threading.Event()
+    threads = []
+    for (device, device_pathnames) in devices.items():
+        for writer in range(writers_per_device):
+            threads.append(threading.Thread(
+                target=_wipe_device,
+                args=(events, stop, (device, writer), device_pathnames),
+                name='bleachbit-wipe', daemon=True))
+    # (device, writer) -> (percent, seconds)
+    progress = {}
+    error = None
+    try:
+        for thread in threads:
+            thread.start()
+        n_running = len(threads)
+        while n_running:
+            try:
+                (key, ret) = events.get(timeout=0.5)
+            except queue.Empty:
+                if idle:
+                    # Allow the user to abort.
+                    yield True
+                continue
+            if ret is None:
+                n_running -= 1
+                progress[key] = (1.0, 0)
+            elif isinstance(ret, Exception):
+                error = error or ret
+                stop.set()
+            else:
+                progress[key] = (ret[1], ret[2])
+            if idle:
+                yield _merge_wipe_progress(devices, progress)
+    finally:
+        # The caller may have stopped early, such as when aborted.
+        stop.set()
+        for thread in threads:
+            thread.join()
+    if error is not None:
+        raise error
+
+
+def _merge_wipe_progress(devices, progress):
+    """Return (1, percent, seconds) of wiping several devices"""
+    percents = []
+    seconds = []
+    for device in devices:
+        writers = [value for (key, value) in progress.items() if key[0] == device]
+        # Writers on one device share its free space, so their parts add up.
+        percents.append(min(1.0, sum(percent for (percent, _eta) in writers)))
+        etas = [eta for (_percent, eta) in writers if isinstance(eta, int)]
+        if etas:
+            seconds.append(min(etas))
+    remaining_seconds = max(seconds) if seconds else None
+    return 1, sum(percents) / len(devices), remaining_seconds
@@ -26,23 +26,342 @@ Perform the preview or delete operations
 import logging
 import math
 import os
+import queue
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 # first party imports
-from bleachbit import DeepScan, FileUtilities, IS_WINDOWS
+from bleachbit import Command, DeepScan, FileUtilities, General, IS_WINDOWS
+from bleachbit.Action import FileActionProvider, static_root, walk_cache
 from bleachbit.Cleaner import backends
 from bleachbit.Constant import EMPTY_SPACE_WARNING
 from bleachbit.Language import get_text as _, nget_text as ngettext
 from bleachbit.FileUtilities import close_delete_parent_lock
+from bleachbit.Options import options
+from bleachbit.PathUtils import path_equal, path_startswith
+from bleachbit.Plan import DEEP_SCAN_KEY
+from bleachbit.ScanCache import get_scan_cache
 
 logger = logging.getLogger(__name__)
 
+# Milliseconds between updates of the GUI from a background worker
+UI_FRAME_MS = 50
+
+# Seconds the main thread spends replaying events in one frame
+UI_FRAME_BUDGET = 0.02
+
+# Databases vacuumed at the same time on one device
+VACUUM_THREADS_PER_DEVICE = 2
+
+
+def _is_vacuum(cmd):
+    """Return whether a command vacuums a SQLite database"""
+    return isinstance(cmd, Command.Function) \
+        and cmd.func is FileUtilities.vacuum_sqlite3
+
+
+def vacuum_lanes(vacuums, per_device=VACUUM_THREADS_PER_DEVICE):
+    """Split vacuum commands into lanes that can run concurrently
+
+    vacuums is a list of (command, operation_option). Databases on the
+    same device are spread over at most per_device lanes, so a disk is
+    not asked to rewrite more than that many files at once.
+
+    Returns a list of lists of (command, operation_option).
+    """
+    by_device = {}
+    for (cmd, operation_option) in vacuums:
+        try:
+            device = os.stat(cmd.path).st_dev
+        except OSError:
+            # Let the vacuum report the error.
+            device = None
+        by_device.setdefault(device, []).append((cmd, operation_option))
+    lanes = []
+    for device_vacuums in by_device.values():
+        n_lanes = min(per_device, len(device_vacuums))
+        lanes.extend(device_vacuums[i::n_lanes] for i in range(n_lanes))
+    return lanes
+
+
+def _operation_roots(operation, option_ids):
+    """Return the set of directory roots an operation can touch
+
+    Returns None when the roots are not known ahead of time, such as for
+    the System cleaner or for actions that run functions or processes.
+    """
+    roots = set()
+    cleaner = backends[operation]
+    for option_id in option_ids:
+        actions = cleaner._actions_for(option_id)
+        if not actions:
+            return None
+        for action in actions:
+            if not isinstance(action, FileActionProvider):
+                return None
+            for path in action.paths:
+                root = static_root(path)
+                if not root:
+                    return None
+                roots.add(root)
+    return roots
+
+
+def _roots_overlap(roots1, roots2):
+    """Return whether any root in one set contains or equals one in the other"""
+    for root1 in roots1:
+        for root2 in roots2:
+            if path_equal(root1, root2) or path_startswith(root1, root2) \
+                    or path_startswith(root2, root1):
+                return True
+    return False
+
+
+def independent_groups(operations):
+    """Partition operations into groups that can run concurrently
+
+    Operations whose paths overlap are placed in the same group, so they
+    still run one after another. Operations with unknown paths are
+    returned separately because they must not run beside anything else.
+
+    Returns a tuple (groups, serial) where groups is a list of lists of
+    operation IDs and serial is a list of operation IDs.
+    """
+    groups = []  # list of (roots, [operation, ...])
+    serial = []
+    for operation in operations:
+        roots = _operation_roots(operation, operations[operation])
+        if roots is None:
+            serial.append(operation)
+            continue
+        merged_roots = set(roots)
+        merged_ops = [operation]
+        remaining = []
+        for group_roots, group_ops in groups:
+            if _roots_overlap(group_roots, merged_roots):
+                merged_roots |= group_roots
+                merged_ops = group_ops + merged_ops
+            else:
+                remaining.append((group_roots, group_ops))
+        remaining.append((merged_roots, merged_ops))
+        groups = remaining
+    return [group_ops for (_roots, group_ops) in groups], serial
+
+
+class _QueuedCallback:
+
+    """Forward UI callbacks from a worker thread to the main thread
+
+    GTK is not thread safe, so threads record the calls in a queue, and
+    the main thread replays them in order.
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    def append_text(self, *args):
+        """Queue text for the log"""
+        self.events.put(('append_text', args))
+
+    def update_progress_bar(self, status):
+        """The main thread reports progress, so ignore this"""
+
+    def update_total_size(self, _size):
+        """Ask the main thread to show the merged total"""
+        self.events.put(('update_total_size', ()))
+
+    def update_item_size(self, *args):
+        """Queue the size of one option"""
+        self.events.put(('update_item_size', args))
+
+    def worker_done(self, worker, really_delete):
+        """Not used"""
+
+
+class _BackgroundCallback(_QueuedCallback):
+
+    """Forward every UI callback of a background worker to the main thread"""
+
+    def update_progress_bar(self, status):
+        """Queue the progress"""
+        self.events.put(('update_progress_bar', (status,)))
+
+    def update_total_size(self, size):
+        """Queue the total size"""
+        self.events.put(('update_total_size', (size,)))
+
+    def worker_done(self, worker, really_delete):
+        """Queue the end of the worker"""
+        self.events.put(('worker_done', (worker, really_delete)))
+
+
+def _coalesce(events):
+    """Merge consecutive events that the UI can apply as one
+
+    Text with the same tag is joined, and only the last of consecutive
+    progress and total size updates is kept.
+    """
+    merged = []
+    for (name, args) in events:
+        if merged and merged[-1][0] == name:
+            prev_args = merged[-1][1]
+            if 'append_text' == name and len(args) == 1 and len(prev_args) == 1:
+                merged[-1] = (name, (prev_args[0] + args[0],))
+                continue
+            if 'append_text' == name and len(args) == 2 and len(prev_args) == 2 \
+                    and args[1] == prev_args[1]:
+                merged[-1] = (name, (prev_args[0] + args[0], args[1]))
+                continue
+            if name in ('update_progress_bar', 'update_total_size'):
+                merged[-1] = (name, args)
+                continue
+        merged.append((name, args))
+    return merged
+
+
+class BackgroundWorker:
+
+    """Run a Worker in a background thread
+
+    The worker does not yield to the GTK idle loop. Instead, it queues
+    its UI callbacks, and the main thread replays them in batches by
+    calling drain() at a fixed frame rate, so the UI stays responsive
+    no matter how fast the worker produces output.
+
+    Functions that must run in the main thread, such as GTK calls, are
+    passed back through the same queue by General.call_in_main_thread().
+    """
+
+    def __init__(self, ui, really_delete, operations, **kwargs):
+        """Create the worker. The arguments are the same as for Worker."""
+        self.ui = ui
+        self._events = queue.Queue()
+        self.worker = Worker(_BackgroundCallback(self._events),
+                             really_delete, operations, **kwargs)
+        self._thread = None
+        self._error = None
+        self._done = False
+
+    @property
+    def is_aborted(self):
+        """Return whether the worker was aborted"""
+        return self.worker.is_aborted
+
+    @property
+    def plan(self):
+        """Return the plan of the worker"""
+        return self.worker.plan
+
+    @property
+    def done(self):
+        """Return whether the UI got every event of the finished worker"""
+        return self._done
+
+    def abort(self):
+        """Stop the preview/cleaning operation"""
+        self.worker.abort()
+
+    def start(self):
+        """Start the worker thread"""
+        General.set_main_thread_dispatcher(self._call_in_main_thread)
+        self._thread = threading.Thread(
+            target=self._run, name='bleachbit-worker', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """Run the worker to the end in the background thread"""
+        try:
+            for _ret in self.worker.run():
+                pass
+        except BaseException as e:  # pylint: disable=broad-except
+            self._error = e
+        finally:
+            self._events.put(('stop', ()))
+
+    def _call_in_main_thread(self, func, args):
+        """Run func in the main thread and wait for its result"""
+        result = {}
+        finished = threading.Event()
+        self._events.put(('call', (func, args, result, finished)))
+        finished.wait()
+        if 'error' in result:
+            raise result['error']
+        return result.get('value')
+
+    def _replay(self, name, args):
+        """Apply one queued event to the real UI"""
+        if 'call' == name:
+            (func, func_args, result, finished) = args
+            try:
+                result['value'] = func(*func_args)
+            except Exception as e:  # pylint: disable=broad-except
+                result['error'] = e
+            finished.set()
+        elif 'worker_done' == name:
+            # The UI knows this object, not the Worker inside.
+            self.ui.worker_done(self, args[1])
+        else:
+            getattr(self.ui, name)(*args)
+
+    def drain(self, timeout=0):
+        """Replay the queued UI callbacks in the calling thread
+
+        timeout is the number of seconds to wait for the first event.
+        Returns True while the worker is running, so it works as a
+        GLib timeout callback. If the worker raised an exception, it is
+        raised here after its events.
+        """
+        if self._done:
+            return False
+        batch = []
+        try:
+            batch.append(self._events.get(timeout=timeout) if timeout
+                         else self._events.get_nowait())
+        except queue.Empty:
+            return True
+        deadline = time.monotonic() + UI_FRAME_BUDGET
+        while True:
+            try:
+                batch.append(self._events.get_nowait())
+            except queue.Empty:
+                break
+            # Let a call or the end through promptly.
+            if batch[-1][0] in ('call', 'stop') or time.monotonic() > deadline:
+                break
+        for (name, args) in _coalesce(batch):
+            if 'stop' == name:
+                self._done = True
+                self._thread.join()
+                General.set_main_thread_dispatcher(None)
+                if self._error is not None:
+                    raise self._error
+                return False
+            self._replay(name, args)
+        return True
+
+    def run_to_end(self):
+        """Start the worker and replay its events until it finishes
+
+        This is for callers without a main loop, such as the command line.
+        """
+        self.start()
+        try:
+            while self.drain(timeout=0.1):
+                pass
+        except BaseException:
+            # For example, KeyboardInterrupt
+            self.abort()
+            General.set_main_thread_dispatcher(None)
+            raise
+
 
 class Worker:
 
     """Perform the preview or delete operations"""
 
-    def __init__(self, ui, really_delete, operations):
+    def __init__(self, ui, really_delete, operations, max_workers=None, plan=None):
         """Create a Worker
 
         ui: an instance with methods
@@ -54,6 +373,12 @@ class Worker:
         really_delete: (boolean) preview or make real changes?
         operations: dictionary where operation-id is the key and
             operation-id are values
+        max_workers: number of threads for cleaning independent
+            cleaners at the same time. The default comes from the
+            preference worker_threads, and 1 means serial.
+        plan: an optional Plan.Plan. A preview records its commands in
+            the plan, and a clean replays the commands of the plan
+            instead of searching again.
         """
         self.ui = ui
         self.really_delete = really_delete
@@ -66,12 +391,25 @@ class Worker:
         self.total_special = 0  # special operations
         self.yield_time = None
         self.is_aborted = False
+        if max_workers is None:
+            max_workers = options.get('worker_threads') or 1
+        self.max_workers = max(1, max_workers)
+        self._children = []
+        self.plan = plan
+        # Vacuum commands deferred to their own stage while cleaning,
+        # as a list of (command, operation_option)
+        self.vacuums = []
+        # (operation, option_id) -> size shown in the UI, where
+        # option_id -1 is the whole operation
+        self.item_sizes = {}
         if 0 == len(self.operations):
             raise RuntimeError("No work to do")
 
     def abort(self):
         """Stop the preview/cleaning operation"""
         self.is_aborted = True
+        for child in self._children:
+            child.abort()
 
     def print_exception(self, operation):
         """Display exception"""
@@ -88,6 +426,9 @@ class Worker:
     def execute(self, cmd, operation_option):
         """Execute or preview the command"""
         ret = None
+        plan_item = None
+        if self.plan is not None and not self.really_delete:
+            plan_item = self.plan.record(operation_option, cmd)
         try:
             for ret in cmd.execute(self.really_delete):
                 if True == ret or isinstance(ret, tuple):
@@ -142,6 +483,8 @@ class Worker:
         else:
             if ret is None:
                 return
+            if plan_item is not None:
+                plan_item[2] = ret['size']
             if isinstance(ret['size'], int):
                 size = FileUtilities.bytes_to_human(ret['size'])
                 self.size += ret['size']
@@ -162,6 +505,16 @@ class Worker:
                 # (e.g., win.shell.change.notify)
                 self.ui.append_text(line)
 
+    def _get_commands(self, operation, option_id, operation_option):
+        """Return the commands of an option, from the plan if possible"""
+        if self.plan is not None:
+            if self.really_delete:
+                if self.plan.has(operation_option):
+                    return self.plan.commands(operation_option)
+            else:
+                self.plan.begin(operation_option)
+        return backends[operation].get_commands(option_id)
+
     def clean_operation(self, operation):
         """Perform a single cleaning operation"""
         operation_options = self.operations[operation]
@@ -187,8 +540,13 @@ class Worker:
             self.size = 0
             assert isinstance(option_id, str)
             # normal scan
-            for cmd in backends[operation].get_commands(option_id):
-                for ret in self.execute(cmd, '%s.%s' % (operation, option_id)):
+            operation_option = '%s.%s' % (operation, option_id)
+            for cmd in self._get_commands(operation, option_id, operation_option):
+                if self.really_delete and _is_vacuum(cmd):
+                    # Vacuum after the other options, several at once.
+                    self.vacuums.append((cmd, operation_option))
+                    continue
+                for ret in self.execute(cmd, operation_option):
                     if True == ret:
                         # Return control to PyGTK idle loop to keep
                         # it responding allow the user to abort
@@ -203,6 +561,7 @@ class Worker:
                     self.yield_time = time.time()
 
             self.ui.update_item_size(operation, option_id, self.size)
+            self.item_sizes[(operation, option_id)] = self.size
             total_size += self.size
 
             # deep scan
@@ -216,6 +575,7 @@ class Worker:
                     self.deepscans[path] = []
                 self.deepscans[path].append(search)
         self.ui.update_item_size(operation, -1, total_size)
+        self.item_sizes[(operation, -1)] = total_size
 
     def run_delayed_op(self, operation, option_id):
         """Run one delayed operation"""
@@ -313,12 +673,22 @@ class Worker:
                     message=r".*asyncio\.AbstractEventLoopPolicy.*",
                     category=DeprecationWarning,
                 )
-            for _dummy in self.run_operations(self.operations):
-                # yield to GTK+ idle loop
-                yield True
+            if self.max_workers > 1:
+                run_ops = self.run_operations_parallel(self.operations)
+            else:
+                run_ops = self.run_operations(self.operations)
+            # Share walks of the same directories between options.
+            with walk_cache.session():
+                for _dummy in run_ops:
+                    # yield to GTK+ idle loop
+                    yield True
             for w in ws:
                 logger.warning(w.message)
 
+        # vacuum databases
+        if self.vacuums and not self.is_aborted:
+            yield from self.run_vacuums()
+
         # run deep scan
         if self.deepscans:
             yield from self.run_deep_scan()
@@ -335,6 +705,18 @@ class Worker:
                     # yield to GTK+ idle loop
                     yield True
 
+        if self.plan is not None and self.plan.n_changed:
+            logger.warning(
+                # TRANSLATORS: %d is a number of files or folders
+                ngettext('Skipped %d item that changed since the preview.',
+                         'Skipped %d items that changed since the preview.',
+                         self.plan.n_changed), self.plan.n_changed)
+
+        # Keep directory listings for the next preview or clean.
+        scan_cache = get_scan_cache()
+        if scan_cache is not None:
+            scan_cache.save(cleaned=self.really_delete)
+
         # print final stats
         bytes_delete = FileUtilities.bytes_to_human(self.total_bytes)
 
@@ -382,15 +764,105 @@ class Worker:
         # or all the system executables.
         self.ui.update_progress_bar(_("Please wait.  Running deep scan."))
         yield True  # allow GTK to update the screen
-        ds = DeepScan.DeepScan(self.deepscans)
+        if self.plan is not None and self.really_delete \
+                and self.plan.has(DEEP_SCAN_KEY):
+            commands = self.plan.commands(DEEP_SCAN_KEY)
+        else:
+            if self.plan is not None:
+                self.plan.begin(DEEP_SCAN_KEY)
+            commands = DeepScan.DeepScan(self.deepscans).scan()
 
-        for cmd in ds.scan():
+        for cmd in commands:
             if True == cmd:
                 yield True
                 continue
-            for _ret in self.execute(cmd, 'deepscan'):
+            for _ret in self.execute(cmd, DEEP_SCAN_KEY):
                 yield True
 
+    def _run_vacuum_lane(self, lane):
+        """Vacuum databases one after another in a worker thread
+
+        This is called on a child Worker whose ui is a _QueuedCallback.
+        Returns a dictionary of the bytes recovered by each option.
+        """
+        sizes = {}
+        for (cmd, operation_option) in lane:
+            if self.is_aborted:
+                break
+            old_size = self.size
+            for _dummy in self.execute(cmd, operation_option):
+                if self.is_aborted:
+                    break
+            sizes[operation_option] = \
+                sizes.get(operation_option, 0) + self.size - old_size
+            self.ui.events.put(('operation_done', (operation_option,)))
+        return sizes
+
+    def run_vacuums(self):
+        """Vacuum the databases deferred while cleaning
+
+        Each database is independent, so they are vacuumed concurrently,
+        at most VACUUM_THREADS_PER_DEVICE at a time on each device.
+        """
+        vacuums = self.vacuums
+        self.vacuums = []
+        # TRANSLATORS: %d is a number of SQLite databases
+        msg = ngettext('Please wait.  Vacuuming %d database.',
+                       'Please wait.  Vacuuming %d databases.',
+                       len(vacuums)) % len(vacuums)
+        self.ui.update_progress_bar(msg)
+        self.ui.update_progress_bar(0.0)
+        yield True
+        lanes = vacuum_lanes(vacuums)
+        logger.debug('vacuuming %d databases in %d lanes',
+                     len(vacuums), len(lanes))
+        events = queue.Queue()
+        self._children = [
+            Worker(_QueuedCallback(events), self.really_delete,
+                   self.operations, max_workers=1)
+            for _lane in lanes]
+        n_done = 0
+        with ThreadPoolExecutor(max_workers=len(lanes)) as executor:
+            futures = [executor.submit(child._run_vacuum_lane, lane)
+                       for (child, lane) in zip(self._children, lanes)]
+            while True:
+                # Check before draining so the final events are not missed.
+                finished = all(future.done() for future in futures)
+                try:
+                    event = events.get(timeout=0.05)
+                except queue.Empty:
+                    event = None
+                while event is not None:
+                    if self._replay_event(event):
+                        n_done += 1
+                        self.ui.update_progress_bar(1.0 * n_done / len(vacuums))
+                    try:
+                        event = events.get_nowait()
+                    except queue.Empty:
+                        event = None
+                if finished:
+                    break
+                yield True
+            lane_sizes = [future.result() for future in futures]
+        vacuum_sizes = {}
+        for (child, sizes) in zip(self._children, lane_sizes):
+            self.total_bytes += child.total_bytes
+            self.total_deleted += child.total_deleted
+            self.total_errors += child.total_errors
+            self.total_special += child.total_special
+            for (operation_option, size) in sizes.items():
+                vacuum_sizes[operation_option] = \
+                    vacuum_sizes.get(operation_option, 0) + size
+        self._children = []
+        # Add the space recovered by vacuuming to the sizes of the options.
+        for (operation_option, size) in vacuum_sizes.items():
+            (operation, option_id) = operation_option.split('.', 1)
+            for key in ((operation, option_id), (operation, -1)):
+                self.item_sizes[key] = self.item_sizes.get(key, 0) + size
+                self.ui.update_item_size(key[0], key[1], self.item_sizes[key])
+        if self.really_delete:
+            self.ui.update_total_size(self.total_bytes)
+
     def run_operations(self, my_operations):
         """Run a set of operations (general, memory, free disk space)"""
         for count, operation in enumerate(my_operations):
@@ -413,3 +885,106 @@ class Worker:
                 raise
             except Exception:
                 self.print_exception(operation)
+
+    def _run_operation_group(self, group):
+        """Run a group of operations in a worker thread
+
+        This is called on a child Worker whose ui is a _QueuedCallback.
+        """
+        self.deepscans = {}
+        for operation in group:
+            if self.is_aborted:
+                break
+            try:
+                for _dummy in self.clean_operation(operation):
+                    if self.is_aborted:
+                        break
+            except Exception:
+                self.print_exception(operation)
+            self.ui.events.put(('operation_done', (operation,)))
+
+    def _replay_event(self, event):
+        """Apply one event queued by a worker thread to the real UI"""
+        (name, args) = event
+        if 'operation_done' == name:
+            return True
+        if 'update_total_size' == name:
+            total_bytes = self.total_bytes + \
+                sum(child.total_bytes for child in self._children)
+            self.ui.update_total_size(total_bytes)
+        else:
+            getattr(self.ui, name)(*args)
+        return False
+
+    def run_operations_parallel(self, my_operations):
+        """Run independent operations concurrently in a thread pool
+
+        Operations with overlapping paths share a thread, so no two
+        threads delete in the same tree. Operations whose paths are not
+        known in advance run afterwards in the calling thread. The UI is
+        only touched from the calling thread.
+        """
+        (groups, serial) = independent_groups(my_operations)
+        if len(groups) < 2:
+            yield from self.run_operations(my_operations)
+            return
+        logger.debug('running %d groups of operations with %d threads',
+                     len(groups), self.max_workers)
+        events = queue.Queue()
+        self._children = [
+            Worker(_QueuedCallback(events), self.really_delete,
+                   {op: my_operations[op] for op in group}, max_workers=1,
+                   plan=self.plan)
+            for group in groups]
+        if self.is_aborted:
+            return
+        n_total = len(my_operations)
+        n_done = 0
+        self.ui.update_progress_bar(0.0)
+        if self.really_delete:
+            # TRANSLATORS: %s is replaced with Firefox, System, etc.
+            msg = _("Please wait.  Cleaning %s.")
+        else:
+            # TRANSLATORS: %s is replaced with Firefox, System, etc.
+            msg = _("Please wait.  Previewing %s.")
+        names = ', '.join(backends[op].get_name() or op
+                          for group in groups for op in group)
+        self.ui.update_progress_bar(msg % names)
+        yield True
+        n_threads = min(self.max_workers, len(groups))
+        with ThreadPoolExecutor(max_workers=n_threads) as executor:
+            futures = [executor.submit(child._run_operation_group, group)
+                       for (child, group) in zip(self._children, groups)]
+            while True:
+                # Check before draining so the final events are not missed.
+                finished = all(future.done() for future in futures)
+                try:
+                    event = events.get(timeout=0.05)
+                except queue.Empty:
+                    event = None
+                while event is not None:
+                    if self._replay_event(event):
+                        n_done += 1
+                        self.ui.update_progress_bar(1.0 * n_done / n_total)
+                    try:
+                        event = events.get_nowait()
+                    except queue.Empty:
+                        event = None
+                if finished:
+                    break
+                yield True
+            for future in futures:
+                future.result()
+        for child in self._children:
+            self.total_bytes += child.total_bytes
+            self.total_deleted += child.total_deleted
+            self.total_errors += child.total_errors
+            self.total_special += child.total_special
+            for (path, searches) in child.deepscans.items():
+                self.deepscans.setdefault(path, []).extend(searches)
+            self.vacuums.extend(child.vacuums)
+            self.item_sizes.update(child.item_sizes)
+        self._children = []
+        if serial and not self.is_aborted:
+            yield from self.run_operations(
+                {op: my_operations[op] for op in serial})
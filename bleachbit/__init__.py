@@ -166,6 +166,16 @@ if not portable_mode:
         for path in paths)
     portable_mode = all(existing)
 
+# caches that can be deleted at any time
+if portable_mode or 'BLEACHBIT_TEST_OPTIONS_DIR' in os.environ:
+    # Do not leave files on the host.
+    cache_dir = os.path.join(options_dir, 'cache')
+elif IS_WINDOWS:
+    cache_dir = os.path.expandvars(r"${LOCALAPPDATA}\BleachBit")
+else:
+    cache_dir = os.path.join(os.getenv('XDG_CACHE_HOME') or
+                             os.path.join(_home_dir(), '.cache'), 'bleachbit')
+
 # personal cleaners
 personal_cleaners_dir = os.path.join(options_dir, "cleaners")
 
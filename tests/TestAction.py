@@ -23,8 +23,10 @@ from xml.dom.minidom import parseString
 from xml.sax.saxutils import quoteattr
 
 # first party imports
+import bleachbit
 from bleachbit import IS_WINDOWS, IS_POSIX, IS_LINUX, FS_CASE_SENSITIVE, logger
-from bleachbit.Action import ActionProvider, Command, Delete, has_glob, expand_multi_var
+from bleachbit.Action import (
+    ActionProvider, Command, Delete, WalkCache, has_glob, expand_multi_var, walk_cache)
 from bleachbit.CleanerML import CleanerML
 from tests import common
 from tests.TestFileUtilities import ini_helper
@@ -228,7 +230,7 @@ class ActionTestCase(common.BleachbitTestCase):
                 mock.patch('bleachbit.Action.Windows', create=True) as mock_windows:
             mock_windows.expand_windows_system_vars.return_value = expanded
             action = Delete(action_node)
-        self.assertEqual(expanded, action.paths)
+            self.assertEqual(expanded, action.paths)
         mock_windows.expand_windows_system_vars.assert_called_once_with(
             r'%WindowsSystem%\foo.log')
 
@@ -342,7 +344,7 @@ class ActionTestCase(common.BleachbitTestCase):
     def test_regex(self):
         """Unit test for regex option"""
         with mock.patch('glob.iglob', lambda x: ['/tmp/foo1', '/tmp/foo2', '/tmp/bar1']), \
-                mock.patch('bleachbit.FileUtilities.getsize', lambda x: 1):
+                mock.patch('bleachbit.FileUtilities.getsize', lambda x, _lstat=None: 1):
             # should match three files using no regexes
             action_str = '<action command="delete" search="glob" path="/tmp/foo*" />'
             results = _action_str_to_results(action_str)
@@ -432,7 +434,7 @@ class ActionTestCase(common.BleachbitTestCase):
     def test_wholeregex(self):
         """Unit test for wholeregex filter"""
         with mock.patch('glob.iglob', lambda x: ['/tmp/foo1', '/tmp/foo2', '/tmp/bar1']), \
-                mock.patch('bleachbit.FileUtilities.getsize', lambda x: 1):
+                mock.patch('bleachbit.FileUtilities.getsize', lambda x, _lstat=None: 1):
             # should match three files using no regexes
             action_str = (
                 '<action command="delete" search="glob" '
@@ -553,6 +555,59 @@ class ActionTestCase(common.BleachbitTestCase):
                    for cmd in _action_str_to_commands(action_str)]
         self.assertEqual(sorted(results), sorted(filenames))
 
+    def test_walk_cache(self):
+        """Searches of the same path share one walk within a session"""
+        dirname = self.mkdtemp(prefix='bleachbit-walk-cache')
+        filenames = [os.path.join(dirname, f'file{i}.log') for i in range(3)]
+        for filename in filenames:
+            common.touch_file(filename)
+        all_str = f'<action command="delete" search="walk.all" path="{dirname}" />'
+        log_str = f'<action command="delete" search="walk.all" path="{dirname}" regex="1\\.log$" />'
+        real_walk = bleachbit.FileUtilities.children_in_directory_entries
+
+        with mock.patch('bleachbit.FileUtilities.children_in_directory_entries',
+                        side_effect=real_walk) as mock_walk:
+            # Outside of a session, nothing is cached.
+            _action_str_to_results(all_str)
+            _action_str_to_results(all_str)
+            self.assertEqual(mock_walk.call_count, 2)
+
+            with walk_cache.session():
+                paths = [r['path'] for r in _action_str_to_results(all_str)]
+                self.assertEqual(sorted(paths), filenames)
+                # Different filters reuse the same walk.
+                paths = [r['path'] for r in _action_str_to_results(log_str)]
+                self.assertEqual(paths, [filenames[1]])
+                self.assertEqual(mock_walk.call_count, 3)
+                self.assertEqual((walk_cache.hits, walk_cache.misses), (1, 1))
+
+                # Deleting a file invalidates the walk.
+                for cmd in _action_str_to_commands(log_str):
+                    list(cmd.execute(True))
+                self.assertEqual(mock_walk.call_count, 3)
+                paths = [r['path'] for r in _action_str_to_results(all_str)]
+                self.assertEqual(sorted(paths), [filenames[0], filenames[2]])
+                self.assertEqual(mock_walk.call_count, 4)
+            self.assertEqual((walk_cache.hits, walk_cache.misses), (0, 0))
+
+    def test_WalkCache_bounded(self):
+        """The least recently used results are evicted first"""
+        cache = WalkCache(max_paths=4)
+        with cache.session():
+            for name in ('a', 'b'):
+                list(cache.record('glob', f'/{name}/*', [f'/{name}/1', f'/{name}/2']))
+            cache.get('glob', '/a/*')
+            list(cache.record('glob', '/c/*', ['/c/1']))
+            self.assertEqual(cache.get('glob', '/a/*'), ['/a/1', '/a/2'])
+            self.assertIsNone(cache.get('glob', '/b/*'))
+            self.assertEqual(cache.get('glob', '/c/*'), ['/c/1'])
+            # Too many paths to cache at all
+            list(cache.record('glob', '/d/*', [f'/d/{i}' for i in range(5)]))
+            self.assertIsNone(cache.get('glob', '/d/*'))
+            # An abandoned walk is not cached.
+            next(cache.record('glob', '/e/*', iter(['/e/1', '/e/2'])))
+            self.assertIsNone(cache.get('glob', '/e/*'))
+
     def test_package_manager_missing(self):
         """Unit test for when package manager is not installed"""
         with mock.patch('bleachbit.Language.setup_translation', return_value=None), \
@@ -38,6 +38,9 @@ from bleachbit import FileUtilities, Options, IS_WINDOWS, IS_POSIX
 from tests import common
 
 RUN_EXTERNAL_TIMEOUT = 30
+# About four times the import time measured on a desktop. Slow machines
+# can raise it with BLEACHBIT_IMPORT_BUDGET_MS.
+IMPORT_TIME_BUDGET_MS = 250
 
 
 class CLITestCase(common.BleachbitTestCase):
@@ -216,6 +219,35 @@ class CLITestCase(common.BleachbitTestCase):
         self.assertEqual(common.get_env('LANG'), old_lang)
         self.assertEqual(locale.getlocale(locale.LC_NUMERIC), original_locale)
 
+    def test_import_time(self):
+        """Importing the CLI does not load modules needed only to clean"""
+        budget_ms = float(os.getenv('BLEACHBIT_IMPORT_BUDGET_MS',
+                                    IMPORT_TIME_BUDGET_MS))
+        args = [get_executable(), '-X', 'importtime',
+                '-c', 'import bleachbit.CLI']
+        best_us = None
+        # The first run may compile the bytecode.
+        for _run in range(3):
+            (rc, _stdout, stderr) = run_external(
+                args, timeout=RUN_EXTERNAL_TIMEOUT)
+            self.assertEqual(rc, 0, stderr)
+            # Each line is: import time: self [us] | cumulative | name
+            modules = {}
+            for line in stderr.splitlines():
+                fields = line.split('|')
+                if line.startswith('import time:') and len(fields) == 3 \
+                        and fields[1].strip().isdigit():
+                    modules[fields[2].strip()] = int(fields[1])
+            for name in ('psutil', 'urllib.request', 'xml.dom.minidom',
+                         'webbrowser', 'bleachbit.Memory', 'bleachbit.Plan',
+                         'bleachbit.Process', 'bleachbit.Special',
+                         'bleachbit.Worker'):
+                self.assertNotIn(name, modules)
+            cumulative_us = modules['bleachbit.CLI']
+            if best_us is None or cumulative_us < best_us:
+                best_us = cumulative_us
+        self.assertLess(best_us / 1000, budget_ms)
+
     def test_preview(self):
         """Unit test for --preview option"""
         env = copy.deepcopy(os.environ)
@@ -425,6 +457,33 @@ class CLITestCase(common.BleachbitTestCase):
                 process_cmd_line()
             self.assertEqual(cm.exception.code, 1)
 
+    def test_process_cmd_line_plan(self):
+        """Unit test for process_cmd_line() with --save-plan and --apply-plan"""
+        plan_path = os.path.join(self.tempdir, 'plan.json')
+        for argv in (['--clean', 'system.tmp', '--save-plan', plan_path],
+                     ['--preview', 'system.tmp', '--apply-plan', plan_path],
+                     ['--clean', '--apply-plan', plan_path]):
+            with patch('sys.argv', ['bleachbit'] + argv):
+                with self.assertRaises(SystemExit) as cm:
+                    process_cmd_line()
+                self.assertEqual(cm.exception.code, 1, argv)
+
+        with patch('bleachbit.CLI.preview_or_clean') as mock_preview_or_clean:
+            with patch('sys.argv', ['bleachbit', '--preview', 'system.tmp',
+                                    '--save-plan', plan_path]):
+                with self.assertRaises(SystemExit) as cm:
+                    process_cmd_line()
+                self.assertEqual(cm.exception.code, 0)
+            self.assertExists(plan_path)
+            with patch('sys.argv', ['bleachbit', '--clean', '--apply-plan', plan_path]):
+                with self.assertRaises(SystemExit) as cm:
+                    process_cmd_line()
+                self.assertEqual(cm.exception.code, 0)
+            (operations, really_clean) = mock_preview_or_clean.call_args.args
+            self.assertEqual(operations, {'system': ['tmp']})
+            self.assertTrue(really_clean)
+            self.assertIsNotNone(mock_preview_or_clean.call_args.kwargs['plan'])
+
     def test_process_cmd_line_overwrite_warning(self):
         """Unit test for process_cmd_line() --overwrite warning with --preview"""
         with patch('bleachbit.CLI.preview_or_clean'):
@@ -127,6 +127,33 @@ class CleanerMLTestCase(common.BleachbitTestCase):
         shutil.rmtree(bleachbit.personal_cleaners_dir)
         bleachbit.personal_cleaners_dir = pcd
 
+    def test_load_cleaners_parallel(self):
+        """Cleaners parsed in threads are registered in order"""
+        dirname = self.mkdtemp(prefix='bleachbit-cleanerml-parallel')
+        good = ('<cleaner id="{0}"><label>{0}</label>'
+                '<option id="opt"><label>Opt</label><description>Opt</description>'
+                '<action command="delete" search="file" path="{1}"/></option></cleaner>')
+        pathnames = []
+        for name in ('c_good', 'a_good', 'b_good'):
+            pathnames.append(self.write_file(os.path.join(dirname, name + '.xml'),
+                                             text=good.format(name, dirname)))
+        # One file does not parse, and one has no label.
+        pathnames.append(self.write_file(os.path.join(dirname, 'broken.xml'),
+                                         contents=b'<cleaner><broken>'))
+        pathnames.append(self.write_file(os.path.join(dirname, 'nolabel.xml'),
+                                         text='<cleaner id="nolabel"></cleaner>'))
+        progress = []
+        with mock.patch('bleachbit.CleanerML.list_cleanerml_files',
+                        return_value=pathnames), \
+                mock.patch.dict(Cleaner.backends, clear=True):
+            with self.assertLogs('bleachbit.CleanerML', level='ERROR'):
+                results = list(load_cleaners(progress.append))
+            registered = list(Cleaner.backends)
+        self.assertEqual(registered, ['a_good', 'b_good', 'c_good'])
+        self.assertEqual(results, [True] * len(pathnames))
+        self.assertEqual(progress, [0.0] + [
+            (i + 1) / len(pathnames) for i in range(len(pathnames))])
+
     def test_load_cleaners_invalid_utf8(self):
         """Unit test for load_cleaners() with invalid UTF-8 encoding"""
         pcd = bleachbit.personal_cleaners_dir
@@ -167,6 +194,58 @@ class CleanerMLTestCase(common.BleachbitTestCase):
         self.assertNotIn('Process', untrusted)
         self.assertIn('Delete', untrusted)
 
+    def test_lazy_paths(self):
+        """Action paths are expanded when their option is first used"""
+        dirname = self.mkdtemp(prefix='bleachbit-cleanerml-lazy')
+        filename = self.write_file(os.path.join(dirname, 'file'))
+        xml_str = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<cleaner id="test_lazy">\n'
+            '  <label>Test</label>\n'
+            '  <description>Test</description>\n'
+            '  <option id="used">\n'
+            '    <label>Used</label>\n'
+            '    <description>Used</description>\n'
+            f'    <action command="delete" search="file" path="{filename}"/>\n'
+            '  </option>\n'
+            '  <option id="unused">\n'
+            '    <label>Unused</label>\n'
+            '    <description>Unused</description>\n'
+            '    <action command="delete" search="file" path="$BB_LAZY/x"/>\n'
+            '  </option>\n'
+            '</cleaner>\n')
+        fn = os.path.join(dirname, 'lazy.xml')
+        self.write_file(fn, text=xml_str)
+        with mock.patch('bleachbit.Action.FileActionProvider._expand_paths',
+                        side_effect=AssertionError('expanded early')):
+            cleaner = CleanerML(fn).get_cleaner()
+        self.assertTrue(cleaner.is_usable())
+        self.assertEqual([cmd.path for cmd in cleaner.get_commands('used')],
+                         [filename])
+        self.assertIsNone(cleaner.actions[1][1]._paths)
+
+    def test_invalid_action(self):
+        """An action that cannot be created is logged and skipped while loading"""
+        xml_str = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<cleaner id="test_invalid_action">\n'
+            '  <label>Test</label>\n'
+            '  <description>Test</description>\n'
+            '  <option id="opt">\n'
+            '    <label>Opt</label>\n'
+            '    <description>Opt</description>\n'
+            '    <action command="delete" search="file" path="test-does-not-exist"/>\n'
+            '  </option>\n'
+            '</cleaner>\n')
+        fn = os.path.join(self.mkdtemp(prefix='bleachbit-cleanerml-invalid'),
+                          'invalid.xml')
+        self.write_file(fn, text=xml_str)
+        with mock.patch('bleachbit.Action.Delete.__init__',
+                        side_effect=RuntimeError('invalid')), \
+                self.assertLogs('bleachbit.CleanerML', level='ERROR'):
+            cleaner = CleanerML(fn).get_cleaner()
+        self.assertEqual(list(cleaner.get_options()), [])
+
     def test_untrusted_winreg_action_allowed(self):
         """A winreg action is kept even for an untrusted cleaner"""
         xml_str = (
@@ -0,0 +1,155 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright (c) 2008-2026 Andrew Ziem.
+#
+# This work is licensed under the terms of the GNU GPL, version 3 or
+# later.  See the COPYING file in the top-level directory.
+
+"""Unit tests for bleachbit.CleanerMLCache."""
+
+import json
+import os
+import time
+import xml.etree.ElementTree
+from unittest import mock
+
+import bleachbit
+from bleachbit.CleanerML import CleanerML
+from bleachbit.CleanerMLCache import CleanerMLCache
+from tests import common
+
+CLEANER_XML = '''<?xml version="1.0" encoding="UTF-8"?>
+<cleaner id="cache_test">
+  <label>Cache test</label>
+  <description>Test</description>
+  <option id="option1">
+    <label>Option</label>
+    <description>Option</description>
+    <action command="delete" search="file" path="%s"/>
+    %s
+  </option>
+</cleaner>
+'''
+
+
+class CleanerMLCacheTestCase(common.BleachbitTestCase):
+    """Tests for the persistent CleanerML cache"""
+
+    def setUp(self):
+        super().setUp()
+        base = self.mkdtemp(prefix='cleanermlcache')
+        # save() creates the directory.
+        self.cache_path = os.path.join(base, 'cache', 'cleanerml_cache.json')
+        self.target = os.path.join(base, 'target')
+        self.xml_path = os.path.join(base, 'cleaner.xml')
+        self._write_cleaner()
+
+    def _write_cleaner(self, extra='', age=60):
+        self.write_file(self.xml_path, text=CLEANER_XML % (self.target, extra))
+        past = time.time() - age
+        os.utime(self.xml_path, (past, past))
+
+    def _parse(self, blocked_commands=()):
+        """Parse the cleaner with a new cache, and save the cache"""
+        cache = CleanerMLCache(self.cache_path)
+        root = cache.parse(self.xml_path, blocked_commands)
+        cache.save()
+        return (cache, xml.etree.ElementTree.tostring(root))
+
+    def test_parse(self):
+        """Unit test for parse()"""
+        (cache, first) = self._parse()
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertExists(self.cache_path)
+
+        # Unchanged: the file is not read again.
+        with mock.patch('bleachbit.CleanerMLCache.reject_xml_dtd') as reject:
+            (cache, cached) = self._parse()
+        reject.assert_not_called()
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        self.assertEqual(cached, first)
+
+        # Touched: the contents are hashed but not parsed.
+        os.utime(self.xml_path, (time.time() - 30, time.time() - 30))
+        (cache, cached) = self._parse()
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        self.assertEqual(cached, first)
+
+        # Changed
+        self._write_cleaner('<action command="delete" search="file" path="/x"/>')
+        (cache, changed) = self._parse()
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertNotEqual(changed, first)
+
+        # Changed with the same size, and the modification time set back
+        st = os.stat(self.xml_path)
+        self._write_cleaner('<!-- b -->')
+        self._parse()
+        self._write_cleaner('<!-- c -->')
+        os.utime(self.xml_path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        (cache, _root) = self._parse()
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+        # A new version of the application does not use the cache.
+        with mock.patch('bleachbit.APP_VERSION', '0.0.0'):
+            (cache, _root) = self._parse()
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+
+    def test_malformed(self):
+        """Malformed records are parsed again and replaced"""
+        self.assertEqual(CleanerMLCache().path,
+                         os.path.join(bleachbit.cache_dir, 'cleanerml_cache.json'))
+        self._parse()
+        with open(self.cache_path, encoding='utf-8') as f:
+            data = json.load(f)
+        record = data['files'][self.xml_path]
+        for bad_record in ({'sha256': record['sha256'], 'root': record['root']},
+                           dict(record, key=1),
+                           dict(record, root=['cleaner', {}, None, None]),
+                           dict(record, root=['cleaner', {}, None, None, [[1]]])):
+            with self.subTest(record=bad_record):
+                data['files'][self.xml_path] = bad_record
+                with open(self.cache_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                (cache, _root) = self._parse()
+                self.assertEqual((cache.hits, cache.misses), (0, 1))
+                (cache, _root) = self._parse()
+                self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_blocked_commands(self):
+        """Blocked actions are not taken from the cache"""
+        self._write_cleaner('<action command="process" cmd="true"/>')
+        self._parse()
+        (cache, _root) = self._parse(('process',))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        # A tree with blocked actions is not saved, so the cache does
+        # not change on each load.
+        mtime = os.stat(self.cache_path).st_mtime_ns
+        (cache, _root) = self._parse(('process',))
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        self.assertEqual(os.stat(self.cache_path).st_mtime_ns, mtime)
+        (cache, _root) = self._parse()
+        self.assertEqual((cache.hits, cache.misses), (0, 1))
+        (cache, _root) = self._parse()
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+
+    def test_rejects_dtd(self):
+        """A file with a DTD raises ValueError"""
+        self.write_file(self.xml_path, text=(
+            '<?xml version="1.0"?>\n'
+            '<!DOCTYPE cleaner [ <!ENTITY x "y"> ]>\n'
+            '<cleaner id="dtd_test"><label>Test</label></cleaner>\n'))
+        with self.assertRaises(ValueError):
+            CleanerMLCache(self.cache_path).parse(self.xml_path)
+
+    def test_cleanerml(self):
+        """A cleaner from the cache matches one parsed from the file"""
+        self.write_file(self.target)
+        cache = CleanerMLCache(self.cache_path)
+        CleanerML(self.xml_path, cache=cache)
+        cache.save()
+        cache = CleanerMLCache(self.cache_path)
+        cleaner = CleanerML(self.xml_path, cache=cache).get_cleaner()
+        self.assertEqual(cache.hits, 1)
+        self.assertEqual(cleaner.id, 'cache_test')
+        self.assertEqual([cmd.path for cmd in cleaner.get_commands('option1')],
+                         [self.target])
@@ -67,6 +67,34 @@ class CommandTestCase(common.BleachbitTestCase):
             self.assertEqual(ret['path'], path)
             self.assertExists(path)
 
+    @common.skipIfWindows
+    def test_Delete_single_stat(self):
+        """Delete stats each path once and reuses the result"""
+        real_lstat = os.lstat
+        for kind in ('file', 'dir', 'link'):
+            path = os.path.join(self.tempdir, 'test_Delete_single_stat')
+            if 'file' == kind:
+                self.write_file(path, b'foo')
+            elif 'dir' == kind:
+                os.mkdir(path)
+            else:
+                os.symlink(self.tempdir, path)
+            with mock.patch('os.lstat', side_effect=real_lstat) as mock_lstat:
+                ret = next(Delete(path).execute(really_delete=True))
+            self.assertEqual(ret['n_deleted'], 1, kind)
+            self.assertFalse(os.path.lexists(path), kind)
+            self.assertEqual(mock_lstat.call_count, 1, kind)
+
+        # A stat passed by the producer avoids the call entirely.
+        path = self.write_file('test_Delete_single_stat', b'foo')
+        lstat_result = os.lstat(path)
+        with mock.patch('os.lstat', side_effect=real_lstat) as mock_lstat:
+            ret = next(Delete(path, lstat_result=lstat_result).execute(
+                really_delete=True))
+        self.assertEqual(ret['size'], lstat_result.st_blocks * 512)
+        self.assertNotExists(path)
+        mock_lstat.assert_not_called()
+
     def test_Function(self):
         """Unit test for Function"""
         path = self.write_file('test_Function', b'foo')
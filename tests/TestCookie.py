@@ -8,6 +8,7 @@
 Test case for module Cookie
 """
 
+import contextlib
 import hashlib
 import json
 import os
@@ -19,6 +20,8 @@ from unittest import mock
 import bleachbit
 from bleachbit import Cookie
 from bleachbit.Action import Cookie as CookieAction
+from bleachbit.Cleaner import backends
+from bleachbit.CleanerML import CleanerML
 from bleachbit.Cookie import COOKIE_KEEP_LIST_FILENAME, load_keep_list
 from bleachbit.Options import options
 from bleachbit.FileUtilities import execute_sqlite3
@@ -434,6 +437,36 @@ class CookieTestCase(common.BleachbitTestCase):
 
         self.assertEqual(len(all_cookies), 3)  # All cookies still there
 
+    def test_preview_size_estimate(self):
+        """The preview estimates the size the clean recovers"""
+        cookies = [(f'host{i}.example{i % 10}.com', 'x' * 200)
+                   for i in range(2000)]
+        path = self._create_chrome_cookies_db(cookies)
+        keep_list = {'example1.com', 'example2.com'}
+        preview = Cookie.delete_cookies(path, keep_list, really_delete=False)
+        self.assertEqual(preview['total_deleted'], 1600)
+        self.assertIn(preview['file_size_estimation_method'],
+                      ('dbstat', 'pages'))
+
+        # Without dbstat, the estimate counts every used page.
+        with contextlib.closing(sqlite3.connect(path)) as conn:
+            class NoDbstat:
+                """Connection without the dbstat virtual table"""
+
+                def execute(self, sql, *args):
+                    if 'dbstat' in sql:
+                        raise sqlite3.OperationalError('no such table: dbstat')
+                    return conn.execute(sql, *args)
+            (pages_estimate, method) = Cookie._estimate_size_reduction(
+                NoDbstat(), 'cookies', 1600, 2000)
+        self.assertEqual(method, 'pages')
+        self.assertGreaterEqual(pages_estimate, preview['file_size_reduction'])
+
+        result = Cookie.delete_cookies(path, keep_list, really_delete=True)
+        self.assertEqual(result['total_kept'], 400)
+        self.assertAlmostEqual(preview['file_size_reduction'],
+                               result['file_size_reduction'], delta=8192)
+
     def test_keeplist_domain_matching_matrix(self):
         """Table-driven coverage for keep list domain semantics"""
         for selection, host_value, expect_keep, reason in DOMAIN_MATCHING_CASES:
@@ -450,6 +483,19 @@ class CookieTestCase(common.BleachbitTestCase):
                     self.assertEqual(result['total_kept'], 0, reason)
                     self.assertEqual(result['total_deleted'], 1)
 
+    def test_make_keep_host(self):
+        """Unit test for the keep list function registered with SQLite"""
+        keep_host = Cookie._make_keep_host({'example.com', 'b.c.org'})
+        for (host, expected) in (('example.com', 1),
+                                 ('.EXAMPLE.com', 1),
+                                 ('a.b.example.com', 1),
+                                 ('notexample.com', 0),
+                                 ('c.org', 0),
+                                 ('a.b.c.org', 1),
+                                 ('', 0),
+                                 (None, 0)):
+            self.assertEqual(keep_host(host), expected, host)
+
     def test_preview_cookies_deletion_no_keeplist(self):
         """Test previewing cookie deletion with no keep list"""
         # Create test cookies
@@ -485,6 +531,27 @@ class CookieTestCase(common.BleachbitTestCase):
         self.assertEqual(Cookie.detect_browser(
             firefox_path), ('moz_cookies', 'host'))
 
+    def test_list_unique_cookies(self):
+        """list_unique_cookies() with a cleaner loaded from CleanerML"""
+        path = self._create_chrome_cookies_db(
+            [('b.example.com', 'x'), ('a.example.com', 'y'), ('b.example.com', 'z')])
+        xml_path = os.path.join(self.tempdir, 'cookie_test.xml')
+        self.write_file(xml_path, text=(
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<cleaner id="cookie_test">\n'
+            '  <label>Test</label>\n'
+            '  <description>Test</description>\n'
+            '  <option id="cookies">\n'
+            '    <label>Cookies</label>\n'
+            '    <description>Cookies</description>\n'
+            f'    <action command="cookie" search="file" path="{path}"/>\n'
+            '  </option>\n'
+            '</cleaner>\n'))
+        cleaner = CleanerML(xml_path).get_cleaner()
+        with mock.patch.dict(backends, {'cookie_test': cleaner}, clear=True):
+            self.assertEqual(Cookie.list_unique_cookies(),
+                             ['a.example.com', 'b.example.com'])
+
     def test_empty_database(self):
         """Test handling of empty cookie databases"""
         # Create empty Chrome database
@@ -11,6 +11,7 @@ Test case for module DeepScan
 
 # standard imports
 import os
+import re
 import shutil
 import unittest
 from unittest import mock
@@ -23,7 +24,8 @@ from tests import TestCleaner
 from tests.common import SPECIAL_TEST_STRINGS
 from bleachbit import IS_MAC, IS_WINDOWS, FS_CASE_SENSITIVE
 from bleachbit.Options import options
-from bleachbit.DeepScan import DeepScan, Search, normalized_walk
+from bleachbit.DeepScan import (
+    CompiledSearch, DeepScan, MultiSearch, Search, normalized_walk, scandir_walk)
 
 if IS_WINDOWS:
     from tests.TestWindows import WindowsLinksMixIn
@@ -310,6 +312,141 @@ class DeepScanTestCase(common.BleachbitTestCase, WindowsLinksMixIn):
     def test_shred(self):
         self._test_delete('shred')
 
+    def test_MultiSearch(self):
+        """Unit test for class MultiSearch"""
+        searches = [
+            Search(command='delete', regex=r'\.bak$', nregex=r'^keep'),
+            Search(command='shred', regex=r'\.tmp$'),
+            Search(command='delete', regex=r'\.bak$',
+                   wholeregex=r'[\\/]cache[\\/]'),
+            Search(command='delete', wholeregex=r'[\\/]node_modules$',
+                   nwholeregex=r'[\\/]\.[^\\/]+[\\/]node_modules$'),
+        ]
+        ms = MultiSearch(searches)
+        self.assertIsNotNone(ms.regex)
+        self.assertIsNotNone(ms.wholeregex)
+        self.assertFalse(ms.match_any)
+        tests = (
+            ('x', 'a.bak', ('delete', os.path.join('x', 'a.bak'))),
+            ('x', 'a.tmp', ('shred', os.path.join('x', 'a.tmp'))),
+            ('x', 'a.txt', None),
+            # The first search excludes the file, but the third matches.
+            (os.path.join('x', 'cache'), 'keep.bak',
+             ('delete', os.path.join('x', 'cache', 'keep.bak'))),
+            ('x', 'keep.bak', None),
+            ('x', 'node_modules', ('delete', os.path.join('x', 'node_modules'))),
+            (os.path.join('x', '.y'), 'node_modules', None),
+        )
+        for dirpath, filename, expected in tests:
+            self.assertEqual(ms.match(dirpath, filename), expected,
+                             (dirpath, filename))
+
+        # A backreference cannot be combined, so every search is tried.
+        ms = MultiSearch([Search(command='delete', regex=r'^(a)\1$'),
+                          Search(command='delete', regex=r'^b$')])
+        self.assertIsNone(ms.regex)
+        self.assertTrue(ms.match_any)
+        self.assertEqual(ms.match('x', 'aa'), ('delete', os.path.join('x', 'aa')))
+        self.assertEqual(ms.match('x', 'b'), ('delete', os.path.join('x', 'b')))
+        self.assertIsNone(ms.match('x', 'ab'))
+
+        # Overlapping searches: the leftmost match in the combined regex
+        # is the delete search, but the shred search wins.
+        for searches in ([Search(command='shred', regex=r'\.tmp$'),
+                          Search(command='delete', regex=r'^a')],
+                         [Search(command='delete', regex=r'^a'),
+                          Search(command='shred', regex=r'\.tmp$')]):
+            ms = MultiSearch(searches)
+            self.assertIsNotNone(ms.regex)
+            self.assertEqual(ms.match('x', 'a.tmp'),
+                             ('shred', os.path.join('x', 'a.tmp')))
+            self.assertEqual(ms.match('x', 'a.txt'),
+                             ('delete', os.path.join('x', 'a.txt')))
+
+    def test_DeepScan_one_command_per_file(self):
+        """A file matched by several searches is yielded once"""
+        path = self.write_file(os.path.join(self.tempdir, 'x.bbtestbak'))
+        searches = {self.tempdir: [
+            Search(command='delete', regex=r'\.bbtestbak$'),
+            Search(command='delete', regex=r'^x\.'),
+        ]}
+        paths = [cmd.path for cmd in DeepScan(
+            searches).scan() if cmd is not True]
+        self.assertEqual(paths, [path])
+
+    def test_scandir_walk(self):
+        """Unit test for scandir_walk()"""
+        top = self.mkdir('top')
+        sub = self.mkdir(os.path.join('top', 'sub'))
+        skip = self.mkdir(os.path.join('top', 'skip'))
+        self.write_file(os.path.join(top, 'a'))
+        self.write_file(os.path.join(sub, 'b'))
+        self.write_file(os.path.join(skip, 'c'))
+        if not IS_WINDOWS:
+            os.symlink(sub, os.path.join(top, 'link'))
+
+        def skip_dir(path):
+            return os.path.basename(path) == 'skip'
+
+        walked = {dirpath: filenames for (
+            dirpath, filenames) in scandir_walk(top, skip_dir)}
+        # The link to a directory is neither entered nor listed as a file.
+        self.assertEqual(walked, {top: ['a'], sub: ['b']})
+        self.assertEqual(len(list(scandir_walk(top))), 3)
+        self.assertEqual(list(scandir_walk(os.path.join(top, 'missing'))), [])
+        walked_parallel = {dirpath: filenames for (
+            dirpath, filenames) in scandir_walk(top, skip_dir, threads=3)}
+        self.assertEqual(walked_parallel, walked)
+
+    def test_can_match_below(self):
+        """Unit test for pruning subtrees that no search can match"""
+        sep = os.sep
+        tests = (
+            # wholeregex with a literal prefix
+            (Search(command='delete', wholeregex='^' + re.escape(f'{sep}home{sep}')),
+             ((f'{sep}home', True), (f'{sep}home{sep}u', True), (sep, True),
+              (f'{sep}usr', False))),
+            # nwholeregex that excludes everything below a directory
+            (Search(command='delete', regex='x', nwholeregex=r'[\\/]\.cache[\\/]'),
+             ((f'{sep}u{sep}.cache', False), (f'{sep}u{sep}.cache{sep}x', False),
+              (f'{sep}u{sep}.cachex', True))),
+            # A $ could stop matching below the directory, so no pruning.
+            (Search(command='delete', regex='x', nwholeregex=r'\.cache[\\/]$'),
+             ((f'{sep}u{sep}.cache', True),)),
+            (Search(command='delete', regex='x'), ((f'{sep}u', True),)),
+        )
+        for search, cases in tests:
+            compiled = CompiledSearch(search)
+            for dirpath, expected in cases:
+                self.assertEqual(compiled.can_match_below(dirpath), expected,
+                                 (search, dirpath))
+        ms = MultiSearch([
+            Search(command='delete', regex='x', nwholeregex=r'[\\/]a[\\/]'),
+            Search(command='delete', regex='x', nwholeregex=r'[\\/]b[\\/]')])
+        self.assertTrue(ms.can_match_below(os.path.join(sep, 'a')))
+        self.assertFalse(ms.can_match_below(os.path.join(sep, 'a', 'b')))
+
+    def test_DeepScan_prunes_subtree(self):
+        """DeepScan does not list a subtree excluded by nwholeregex"""
+        excluded = self.mkdir('excluded')
+        self.write_file(os.path.join(excluded, 'x.bbtestbak'))
+        found = self.write_file(os.path.join(self.tempdir, 'x.bbtestbak'))
+        searches = {self.tempdir: [
+            Search(command='delete', regex=r'\.bbtestbak$',
+                   nwholeregex=r'[\\/]excluded[\\/]')]}
+        real_scandir = os.scandir
+        listed = []
+
+        def spy_scandir(path):
+            listed.append(path)
+            return real_scandir(path)
+
+        with mock.patch('os.scandir', side_effect=spy_scandir):
+            paths = [cmd.path for cmd in DeepScan(
+                searches).scan() if cmd is not True]
+        self.assertEqual(paths, [found])
+        self.assertNotIn(excluded, listed)
+
     @unittest.skipUnless(IS_MAC, 'Not on Darwin')
     def test_normalized_walk_darwin(self):
 
@@ -37,6 +37,7 @@ from bleachbit.FileUtilities import (
     _truncate_locked_file,
     bytes_to_human,
     children_in_directory,
+    children_in_directory_entries,
     clean_ini,
     clean_json,
     delete_file,
@@ -60,10 +61,14 @@ from bleachbit.FileUtilities import (
     is_normal_directory,
     listdir,
     open_files_lsof,
+    parallel_walk,
     OpenFiles,
+    _proc_start_time,
+    ScanEntry,
     same_partition,
     truncate_file,
     uris_to_paths,
+    sqlite_vacuum_size,
     vacuum_sqlite3,
     whitelisted
 )
@@ -340,6 +345,67 @@ class FileUtilitiesTestCase(common.BleachbitTestCase, WindowsLinksMixIn):
 
         os.rmdir(dirname)
 
+    def test_children_in_directory_entries(self):
+        """Unit test for children_in_directory_entries() and ScanEntry"""
+        root = self.mkdir('children-entries-root')
+        subdir = self.mkdir(os.path.join(root, 'sub'))
+        filename = self.write_file(os.path.join(subdir, 'file'), b'123')
+        entries = list(children_in_directory_entries(root, True))
+        self.assertEqual([os.fspath(e) for e in entries],
+                         list(children_in_directory(root, True)))
+        self.assertEqual([e.path for e in entries], [filename, subdir])
+        (file_entry, dir_entry) = entries
+        self.assertIsInstance(file_entry, ScanEntry)
+        self.assertEqual(file_entry.type, 'f')
+        self.assertTrue(file_entry.is_file())
+        self.assertFalse(file_entry.is_dir())
+        self.assertEqual(dir_entry.type, 'd')
+        self.assertEqual(file_entry.size, getsize(filename))
+        self.assertEqual(file_entry.mtime, os.lstat(filename).st_mtime)
+        if hasattr(os, 'getuid'):
+            self.assertEqual(file_entry.uid, os.getuid())
+        # The stat is cached, so a vanished file keeps its metadata.
+        os.remove(filename)
+        self.assertEqual(file_entry.lstat().st_size, 3)
+        if not IS_WINDOWS:
+            # On POSIX the listing has no stat, so a path that vanished
+            # before its first stat reports None instead of raising.
+            filename = self.write_file(os.path.join(subdir, 'file2'), b'')
+            (entry,) = children_in_directory_entries(root, False)
+            os.remove(filename)
+            self.assertIsNone(entry.lstat())
+            self.assertIsNone(entry.size)
+
+    def test_children_in_directory_threads(self):
+        """Parallel listing finds the same paths, directories after children"""
+        root = self.mkdir('children-threads-root')
+        for i in range(4):
+            for j in range(3):
+                subdir = self.mkdir(os.path.join(root, str(i), str(j)))
+                self.write_file(os.path.join(subdir, 'file'))
+        serial = list(children_in_directory_entries(root, True, threads=1))
+        parallel = list(children_in_directory_entries(root, True, threads=4))
+        self.assertEqual(sorted(e.path for e in parallel),
+                         sorted(e.path for e in serial))
+        seen = set()
+        for entry in parallel:
+            self.assertNotIn(os.path.dirname(entry.path), seen,
+                             'directory listed before its child')
+            if entry.is_dir():
+                seen.add(entry.path)
+
+    def test_parallel_walk_error(self):
+        """An exception in a walker thread reaches the caller"""
+        def list_dir(path):
+            if path == 'bad':
+                raise ValueError(path)
+            return (path, ['bad'] if path == 'top' else [])
+
+        with self.assertRaises(ValueError):
+            list(parallel_walk('top', list_dir, 3))
+        self.assertEqual(
+            list(parallel_walk('good', list_dir, 3)), ['good'])
+
     def test_children_in_directory_ordering(self):
         """Verify children_in_directory yields files before their parent directories.
 
@@ -1283,6 +1349,29 @@ State=AAAA/wA...
         os.unlink(db_path)
         self.assertNotExists(db_path)
 
+    def test_execute_sqlite3_batch(self):
+        """Unit test for execute_sqlite3() with a batch of statements"""
+        db_path = os.path.join(self.tempdir, 'batch.sqlite')
+        execute_sqlite3(db_path, 'create table test (name text)')
+
+        # A semicolon in a string literal does not end the statement.
+        rowcounts = execute_sqlite3(
+            db_path, "insert into test values ('a;b'), ('c');"
+            "update test set name = 'd' where name = 'c'")
+        self.assertEqual(rowcounts, [2, 1])
+        batch = [('insert into test values (?)', ('e',)),
+                 ('delete from test where name in (?, ?)', ('a;b', 'e'))]
+        self.assertEqual(execute_sqlite3(db_path, batch), [1, 2])
+
+        # One failing statement rolls back the whole batch.
+        batch = [('delete from test', ()),
+                 ('insert into no_such_table values (1)', ())]
+        with self.assertRaises(sqlite3.OperationalError):
+            execute_sqlite3(db_path, batch)
+        with contextlib.closing(sqlite3.connect(db_path)) as conn:
+            rows = conn.execute('select name from test').fetchall()
+        self.assertEqual(rows, [('d',)])
+
     def test_execute_sqlite3_open_error_translation(self):
         """Unit test for execute_sqlite3() open-error translation
 
@@ -1729,6 +1818,53 @@ State=AAAA/wA...
         openfiles.scan()
         self.assertFalse(openfiles.is_open(filename))
 
+    @common.skipUnlessLinux
+    def test_open_files_refresh(self):
+        """A refresh of OpenFiles reads only new processes"""
+        filename = os.path.join(self.tempdir, 'bleachbit-test-open-files')
+        self.write_file(filename)
+        openfiles = OpenFiles()
+        openfiles.scan()
+        key = (str(os.getpid()), _proc_start_time(os.getpid()))
+        self.assertIn(key, openfiles.pids)
+        with open(filename, 'rb'):
+            # This process was already read.
+            openfiles.refresh()
+            self.assertFalse(openfiles.is_open(filename))
+            # As if it started since the last scan
+            del openfiles.pids[key]
+            openfiles.refresh()
+            self.assertTrue(openfiles.is_open(filename))
+            self.assertTrue(openfiles.is_open('/nonexistent', os.stat(filename)))
+            self.assertFalse(openfiles.is_open(self.tempdir + '/nonexistent'))
+
+        # A process ID reused by a new process is read again.
+        openfiles.pids[(key[0], key[1] - 1)] = openfiles.pids.pop(key)
+        openfiles.refresh()
+        self.assertFalse(openfiles.is_open(filename))
+
+    @common.skipUnlessLinux
+    def test_open_files_scan(self):
+        """scan() finds files opened by a process that was already read"""
+        filename = os.path.join(self.tempdir, 'bleachbit-test-open-files')
+        self.write_file(filename)
+        openfiles = OpenFiles()
+        self.assertFalse(openfiles.is_open(filename))
+        with open(filename, 'rb'):
+            openfiles.scan()
+            self.assertTrue(openfiles.is_open(filename))
+
+    @common.skipUnlessLinux
+    def test_open_files_tmp(self):
+        """Each run of the tmp cleaner scans the open files"""
+        from bleachbit.Cleaner import System  # pylint: disable=import-outside-toplevel
+        with unittest.mock.patch('bleachbit.FileUtilities.openfiles') as openfiles, \
+                unittest.mock.patch('bleachbit.Cleaner.children_in_directory_entries',
+                           return_value=()):
+            for _run in range(2):
+                list(System().get_commands('tmp'))
+        self.assertEqual(openfiles.scan.call_count, 2)
+
     def test_same_partition(self):
         """Unit test for same_partition()"""
         home = os.path.expanduser('~')
@@ -1802,6 +1938,44 @@ State=AAAA/wA...
         delete(path)
         self.assertNotExists(path)
 
+    def test_vacuum_sqlite3_free_pages(self):
+        """Unit test for vacuum_sqlite3() skipping and incremental vacuum"""
+        for auto_vacuum in ('none', 'incremental'):
+            path = os.path.join(self.tempdir, f'vacuum_{auto_vacuum}.sqlite3')
+            with contextlib.closing(sqlite3.connect(path)) as conn:
+                # The mode must be set before the first table.
+                conn.execute(f'PRAGMA auto_vacuum={auto_vacuum}')
+                conn.execute('create table t (n, s)')
+                conn.commit()
+            rows = [(x, 'x' * 100) for x in range(1000)]
+            execute_sqlite3(path, [('insert into t values (?, ?)', row)
+                                   for row in rows])
+            # Delete one tenth of the rows.
+            execute_sqlite3(path, 'delete from t where n < 100')
+            size = getsize(path)
+            reclaimable = sqlite_vacuum_size(path)
+            self.assertGreater(reclaimable, 0)
+
+            # Below the threshold, the database is not touched.
+            with unittest.mock.patch.dict(
+                    options.overrides, {('bleachbit', 'vacuum_min_free_percent'): 50}):
+                self.assertEqual(sqlite_vacuum_size(path), 0)
+                with unittest.mock.patch('bleachbit.FileUtilities.execute_sqlite3') as mock_execute:
+                    vacuum_sqlite3(path)
+                mock_execute.assert_not_called()
+
+            with unittest.mock.patch.dict(
+                    options.overrides, {('bleachbit', 'vacuum_min_free_percent'): 1}):
+                with unittest.mock.patch('bleachbit.FileUtilities.execute_sqlite3',
+                                         wraps=execute_sqlite3) as mock_execute:
+                    vacuum_sqlite3(path)
+                expected_sql = 'PRAGMA incremental_vacuum' \
+                    if auto_vacuum == 'incremental' else 'vacuum'
+                mock_execute.assert_called_once_with(path, expected_sql)
+                self.assertEqual(sqlite_vacuum_size(path), 0)
+            self.assertLessEqual(getsize(path), size - reclaimable)
+            gc_collect()
+
     def test_sqlite_loop(self):
         """Repeat SQLite tests
 
@@ -401,7 +401,7 @@ class GUITestCase(common.BleachbitTestCase):
             self.assertTrue(gui._confirm_delete(False, False))
             gui.shred_paths(test_files_dirs)
 
-        self.refresh_gui()
+        self.assertTrue(self.wait_until(lambda: gui.worker.done))
 
         for obj in test_files_dirs:
             self.assertNotExists(obj)
@@ -467,7 +467,7 @@ class GUITestCase(common.BleachbitTestCase):
             with mock.patch.object(gui, '_confirm_delete', return_value=True):
                 gui.shred_paths([test_file], should_clear_clipboard=True)
 
-        self.refresh_gui()
+        self.assertTrue(self.wait_until(lambda: gui.worker.done))
 
         mock_clear_clipboard.assert_called_once()
         self.assertNotExists(test_file)
@@ -554,7 +554,7 @@ class GUITestCase(common.BleachbitTestCase):
             # same as b = self.click_button(gui, _("Clean"))
             gui.run_operations(None)
 
-        self.refresh_gui()
+        self.assertTrue(self.wait_until(lambda: gui.worker.done))
         self.assertNotExists(file_to_clean)
 
     def test_cb_run_option(self):
@@ -568,7 +568,7 @@ class GUITestCase(common.BleachbitTestCase):
                     None, really_delete, self._NEW_CLEANER_ID, self._NEW_OPTION_ID
                 )  # activated from context menu
 
-            self.refresh_gui()
+            self.assertTrue(self.wait_until(lambda: gui.worker.done))
             assert_method(file_to_clean)
 
     def test_context_menu_cookie_manager(self):
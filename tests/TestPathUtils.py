@@ -7,6 +7,7 @@
 """Unit tests for bleachbit.PathUtils."""
 
 import os
+import tempfile
 import unittest
 from unittest import mock
 
@@ -15,6 +16,7 @@ from bleachbit.FileUtilities import whitelisted_windows
 from bleachbit.PathUtils import (
     expand_path,
     expand_path_entries,
+    KeepIndex,
     normalize_path,
     path_equal,
     path_has_relative_suffix,
@@ -116,13 +118,66 @@ class PathUtilsTestCase(unittest.TestCase):
     def test_whitelisted_windows_drive_root_matches_descendants(self):
         """Verify a whitelisted drive root protects its descendants."""
         with mock.patch(
-                'bleachbit.Options.options.get_whitelist_paths',
-                return_value=[('folder', 'D:\\')]):
+                'bleachbit.Options.options.get_whitelist_index',
+                return_value=KeepIndex([('folder', 'D:\\')], windows=True)):
             self.assertTrue(whitelisted_windows('d:\\'))
             self.assertTrue(whitelisted_windows(r'D:\folder\file'))
             self.assertFalse(whitelisted_windows(r'D:folder\file'))
             self.assertFalse(whitelisted_windows(r'E:\folder\file'))
 
+    def test_KeepIndex(self):
+        """Verify KeepIndex matches like path_equal and path_startswith."""
+        keep_list = [('file', '/home/foo'), ('folder', '/home/folder'),
+                     ('folder', '/home/folder/sub'), ('file', '/srv/a/b')]
+        index = KeepIndex(keep_list, windows=False, case_sensitive=True)
+        self.assertEqual(len(index), 4)
+        tests = (('/home/foo', True),
+                 ('/home/foo/bar', False),
+                 ('/home/foo2', False),
+                 ('/home/folder', True),
+                 ('/home/folder/', True),
+                 ('/home/folder/file', True),
+                 ('/home/folder/sub/file', True),
+                 ('/home/folde', False),
+                 ('/home/folder2', False),
+                 ('/home/Folder/file', False),
+                 ('/home', False),
+                 ('/srv/a', False),
+                 ('/', False),
+                 ('', False))
+        for (path, expected) in tests:
+            with self.subTest(path=path):
+                self.assertEqual(index.match(path), expected)
+                # The same answer as the linear search
+                self.assertEqual(
+                    any(path_equal(path, keep_path, True)
+                        or ('folder' == keep_type
+                            and path_startswith(path, keep_path, True))
+                        for (keep_type, keep_path) in keep_list), expected)
+        self.assertTrue(KeepIndex(keep_list, windows=False,
+                                  case_sensitive=False).match('/HOME/folder/x'))
+        self.assertFalse(KeepIndex([], windows=False).match('/home/foo'))
+        self.assertFalse(KeepIndex([]))
+
+        index = KeepIndex([('folder', 'C:\\Users'), ('folder', 'D:\\')],
+                          windows=True)
+        self.assertTrue(index.match('c:/users/x'))
+        self.assertTrue(index.match('d:\\x\\y'))
+        self.assertFalse(index.match('c:\\users2'))
+
+    @common.skipIfWindows
+    def test_KeepIndex_resolved(self):
+        """Verify KeepIndex compares link targets with real paths."""
+        with tempfile.TemporaryDirectory(prefix="bleachbit-keep") as tempdir:
+            real = os.path.join(tempdir, 'real')
+            os.mkdir(real)
+            link = os.path.join(tempdir, 'link')
+            os.symlink(real, link)
+            index = KeepIndex([('folder', link)], windows=False)
+            target = os.path.join(os.path.realpath(real), 'file')
+            self.assertFalse(index.match(target))
+            self.assertTrue(index.match(target, resolved=True))
+
     @unittest.skipUnless(IS_MAC, 'macOS-specific protected-path behavior')
     def test_protected_path_matching_is_case_insensitive_on_macos(self):
         """Verify protected-path matching is case-insensitive on macOS."""
@@ -0,0 +1,85 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright (c) 2008-2026 Andrew Ziem.
+#
+# This work is licensed under the terms of the GNU GPL, version 3 or
+# later.  See the COPYING file in the top-level directory.
+
+"""Unit tests for bleachbit.Plan."""
+
+import os
+from unittest import mock
+
+from bleachbit import Command
+from bleachbit.Cleaner import backends
+from bleachbit.Plan import Plan
+from bleachbit.Worker import Worker
+from tests import common, TestCleaner
+
+
+class PlanTestCase(common.BleachbitTestCase):
+    """Tests for recording a preview and replaying it in a clean"""
+
+    def _run(self, really_delete, operations, plan):
+        ui = mock.Mock()
+        worker = Worker(ui, really_delete, operations, plan=plan)
+        run = worker.run()
+        while next(run):
+            pass
+        self.assertEqual(worker.total_errors, 0)
+        return worker
+
+    def test_preview_then_clean(self):
+        """The clean deletes only what the preview listed and did not change"""
+        dirname = self.mkdtemp(prefix='bleachbit-plan')
+        unchanged = self.write_file(os.path.join(dirname, 'unchanged'), b'1')
+        changed = self.write_file(os.path.join(dirname, 'changed'), b'1')
+        astr = f'<action command="delete" search="walk.files" path="{dirname}"/>'
+        backends['test_plan'] = TestCleaner.action_to_cleaner(astr)
+        self.addCleanup(backends.pop, 'test_plan')
+        operations = {'test_plan': ['option1']}
+
+        plan = Plan(operations)
+        self._run(False, operations, plan)
+        self.assertTrue(plan.has('test_plan.option1'))
+        self.assertEqual(sorted(item[1] for item in plan.items['test_plan.option1']),
+                         sorted([unchanged, changed]))
+        for (_kind, _path, size, _fingerprint) in plan.items['test_plan.option1']:
+            self.assertIsInstance(size, int)
+
+        # Round trip through a file
+        plan_path = os.path.join(self.mkdtemp(prefix='bleachbit-plan-file'), 'plan.json')
+        plan.save(plan_path)
+        plan = Plan.load(plan_path)
+        self.assertTrue(plan.matches(operations, False))
+        self.assertFalse(plan.matches(operations, True))
+        self.assertFalse(plan.matches({'test_plan': []}, False))
+
+        with open(changed, 'ab') as f:
+            f.write(b'more')
+        created = self.write_file(os.path.join(dirname, 'created'), b'1')
+        with mock.patch.object(backends['test_plan'], 'get_commands',
+                               side_effect=AssertionError('searched again')):
+            worker = self._run(True, operations, plan)
+        self.assertEqual(worker.total_deleted, 1)
+        self.assertEqual(plan.n_changed, 1)
+        self.assertNotExists(unchanged)
+        self.assertExists(changed)
+        self.assertExists(created)
+
+    def test_not_replayable(self):
+        """Options with commands other than file commands run as usual"""
+        plan = Plan({'test': ['option1']})
+        plan.begin('test.option1')
+        plan.record('test.option1', Command.Delete('/nonexistent'))
+        self.assertTrue(plan.has('test.option1'))
+        plan.record('test.option1', Command.Ini('/nonexistent', 'a', 'b'))
+        self.assertFalse(plan.has('test.option1'))
+        plan.record('test.option1', Command.Delete('/nonexistent'))
+        self.assertFalse(plan.has('test.option1'))
+        self.assertFalse(plan.has('test.option2'))
+
+    def test_load_invalid(self):
+        """Loading something other than a plan raises ValueError"""
+        path = self.write_file('not-a-plan.json', b'{"version": 999}')
+        with self.assertRaises(ValueError):
+            Plan.load(path)
@@ -21,6 +21,7 @@ from bleachbit.ProtectedPath import (
     _get_protected_path_xml,
     calculate_impact,
     check_protected_path,
+    check_protected_paths,
     clear_cache,
     get_warning_message,
     load_protected_paths)
@@ -30,7 +31,9 @@ from bleachbit import IS_MAC, IS_WINDOWS, IS_POSIX
 from bleachbit.PathUtils import (
     expand_path,
     normalize_path,
+    path_equal,
     path_has_relative_suffix,
+    path_startswith,
 )
 from bleachbit.Cleaner import backends
 from tests.TestCleaner import register_all_cleaners
@@ -324,6 +327,68 @@ class ProtectedPathTestCase(common.BleachbitTestCase):
                     self.assertIsNotNone(result)
                 break
 
+    def _linear_check(self, protected_paths, user_path):
+        """Check one path by comparing it with each protected path"""
+        for ppath in protected_paths:
+            case_sensitive = ppath['case_sensitive']
+            user_cmp = normalize_path(user_path, case_sensitive)
+            protected_cmp = normalize_path(ppath['path'], case_sensitive)
+            if not os.path.isabs(ppath['path']):
+                if path_has_relative_suffix(user_cmp, protected_cmp,
+                                            case_sensitive):
+                    return ppath
+                continue
+            if path_equal(user_cmp, protected_cmp, case_sensitive) or \
+                    path_startswith(protected_cmp, user_cmp, case_sensitive):
+                return ppath
+            if path_startswith(user_cmp, protected_cmp, case_sensitive):
+                levels = user_cmp[len(protected_cmp) + 1:].count(os.sep) + 1
+                if ppath['depth'] is None or levels <= ppath['depth']:
+                    return ppath
+        return None
+
+    def test_check_protected_paths_matches_linear(self):
+        """The index finds the same protected path as a linear search"""
+        root = os.path.abspath(os.sep)
+        base = os.path.join(root, 'PPTest')
+        definitions = [
+            {'path': os.path.join(base, 'Exact'), 'depth': 0,
+             'case_sensitive': True},
+            {'path': os.path.join(base, 'Deep'), 'depth': 2,
+             'case_sensitive': False},
+            {'path': os.path.join(base, 'Deep', 'Any'), 'depth': None,
+             'case_sensitive': True},
+            {'path': '.git', 'depth': 0, 'case_sensitive': False},
+            {'path': os.path.join('nested', 'Rel'), 'depth': 0,
+             'case_sensitive': True},
+            {'path': base, 'depth': 0, 'case_sensitive': True},
+        ]
+        candidates = [root, base, os.path.dirname(base)]
+        for name in ('Exact', 'exact', 'Deep', 'DEEP', 'other', '.git',
+                     '.GIT', 'nested', '.gitignore'):
+            for sub in ('', 'a', os.path.join('a', 'b'),
+                        os.path.join('a', 'b', 'c'), 'Any',
+                        os.path.join('Any', 'x', 'y', 'z'), 'Rel',
+                        os.path.join('nested', 'Rel'), '.git'):
+                candidates.append(os.path.join(base, name, sub))
+                candidates.append(os.path.join(base, 'Deep', name, sub))
+        candidates += ['.git', 'Rel', os.path.join('nested', 'Rel'),
+                       os.path.join(base, 'Deep') + os.sep]
+        with mock.patch('bleachbit.ProtectedPath.load_protected_paths',
+                        return_value=definitions), \
+                mock.patch('bleachbit.ProtectedPath._EXEMPT_PATHS', ()):
+            results = check_protected_paths(candidates)
+            self.assertEqual(len(results), len(candidates))
+            for (path, result) in zip(candidates, results):
+                with self.subTest(path=path):
+                    self.assertIs(result,
+                                  self._linear_check(definitions, path))
+                    self.assertIs(check_protected_path(path), result)
+            self.assertIsNotNone(check_protected_path(
+                os.path.join(base, 'Deep', 'a', 'b')))
+            self.assertIsNone(check_protected_path(
+                os.path.join(base, 'Deep', 'a', 'b', 'c')))
+
     @requirePPXML
     def test_check_protected_path_git_variations(self):
         """Test that .git entries are detected at various nesting levels"""
@@ -0,0 +1,155 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright (c) 2008-2026 Andrew Ziem.
+#
+# This work is licensed under the terms of the GNU GPL, version 3 or
+# later.  See the COPYING file in the top-level directory.
+
+"""Unit tests for bleachbit.ScanCache."""
+
+import json
+import os
+import stat
+import time
+from unittest import mock
+
+from bleachbit import Command, ScanCache
+from bleachbit.FileUtilities import children_in_directory_entries
+from bleachbit.Options import options
+from tests import common
+
+
+@common.skipIfWindows
+class ScanCacheTestCase(common.BleachbitTestCase):
+    """Tests for the persistent scan cache"""
+
+    def setUp(self):
+        super().setUp()
+        base = self.mkdtemp(prefix='scancache')
+        self.cache_path = os.path.join(base, 'scan_cache.json')
+        self.root = self.mkdir(os.path.join(base, 'root'))
+        self.sub = self.mkdir(os.path.join(self.root, 'sub'))
+        self.file1 = self.write_file(os.path.join(self.root, 'file1'), b'123')
+        self.file2 = self.write_file(os.path.join(self.sub, 'file2'), b'')
+        self._age(self.root, self.sub)
+
+    def _age(self, *dirnames):
+        """Move directory modification times out of the racy window"""
+        past = time.time() - 60
+        for dirname in dirnames:
+            os.utime(dirname, (past, past))
+
+    def test_store_lookup(self):
+        """Unit test for store() and lookup()"""
+        cache = ScanCache.ScanCache(self.cache_path)
+        dir_stat = os.stat(self.root)
+        self.assertIsNone(cache.lookup(self.root, dir_stat))
+        with os.scandir(self.root) as it:
+            self.assertTrue(cache.store(self.root, dir_stat, list(it)))
+        entries = {e.name: e for e in cache.lookup(self.root, dir_stat)}
+        self.assertEqual(sorted(entries), ['file1', 'sub'])
+        self.assertTrue(entries['file1'].is_file())
+        self.assertTrue(entries['sub'].is_dir())
+        self.assertFalse(entries['sub'].is_symlink())
+        lstat_result = entries['file1'].stat(follow_symlinks=False)
+        self.assertEqual(lstat_result.st_size, 3)
+        self.assertEqual(lstat_result.st_blocks,
+                         os.lstat(self.file1).st_blocks)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # A new child changes the directory, so the record is stale.
+        self.write_file(os.path.join(self.root, 'file3'))
+        self.assertIsNone(cache.lookup(self.root, os.stat(self.root)))
+
+        # A directory modified just now is not cached.
+        with os.scandir(self.root) as it:
+            self.assertFalse(cache.store(
+                self.root, os.stat(self.root), list(it)))
+
+    def test_save_load(self):
+        """The cache survives a restart and ignores a corrupt file"""
+        cache = ScanCache.ScanCache(self.cache_path)
+        dir_stat = os.stat(self.sub)
+        with os.scandir(self.sub) as it:
+            cache.store(self.sub, dir_stat, list(it))
+        # A stale temporary file does not keep its mode.
+        self.write_file(self.cache_path + '.tmp')
+        os.chmod(self.cache_path + '.tmp', 0o644)
+        cache.save()
+        self.assertExists(self.cache_path)
+        self.assertEqual(stat.S_IMODE(os.stat(self.cache_path).st_mode), 0o600)
+        cache = ScanCache.ScanCache(self.cache_path)
+        (entry,) = cache.lookup(self.sub, dir_stat)
+        self.assertEqual(entry.path, self.file2)
+
+        with mock.patch('time.time', return_value=time.time() + ScanCache.MAX_AGE_SECS + 1):
+            self.assertIsNone(cache.lookup(self.sub, dir_stat))
+
+        self.write_file(self.cache_path, b'{not json')
+        cache = ScanCache.ScanCache(self.cache_path)
+        self.assertIsNone(cache.lookup(self.sub, dir_stat))
+
+        # Valid JSON of the wrong shape is ignored as a whole.
+        key = ScanCache.ScanCache._key(dir_stat)
+        record = {'key': key, 'time': time.time(), 'children': []}
+        for dirs in ([], {self.sub: {'key': key}},
+                     {self.root: record, self.sub: dict(record, children=[[1]])}):
+            with self.subTest(dirs=dirs):
+                with open(self.cache_path, 'w', encoding='utf-8') as f:
+                    json.dump({'version': ScanCache.CACHE_VERSION, 'dirs': dirs}, f)
+                cache = ScanCache.ScanCache(self.cache_path)
+                self.assertIsNone(cache.lookup(self.root, os.stat(self.root)))
+                self.assertIsNone(cache.lookup(self.sub, dir_stat))
+
+    def test_utime(self):
+        """Setting back the modification time does not hide a change"""
+        cache = ScanCache.ScanCache(self.cache_path)
+        dir_stat = os.stat(self.sub)
+        with os.scandir(self.sub) as it:
+            cache.store(self.sub, dir_stat, list(it))
+        # Let the change time move past the resolution of the clock.
+        time.sleep(0.05)
+        self.write_file(os.path.join(self.sub, 'file3'))
+        os.utime(self.sub, ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+        new_stat = os.stat(self.sub)
+        self.assertEqual(new_stat.st_mtime_ns, dir_stat.st_mtime_ns)
+        self.assertIsNone(cache.lookup(self.sub, new_stat))
+
+    def test_privacy(self):
+        """A clean drops the listings it used, and delete() removes the file"""
+        cache = ScanCache.ScanCache(self.cache_path)
+        for dirname in (self.root, self.sub):
+            with os.scandir(dirname) as it:
+                cache.store(dirname, os.stat(dirname), list(it))
+        cache.save()
+        # A clean that used only one directory
+        cache = ScanCache.ScanCache(self.cache_path)
+        self.assertIsNotNone(cache.lookup(self.sub, os.stat(self.sub)))
+        cache.save(cleaned=True)
+        cache = ScanCache.ScanCache(self.cache_path)
+        self.assertIsNone(cache.lookup(self.sub, os.stat(self.sub)))
+        self.assertIsNotNone(cache.lookup(self.root, os.stat(self.root)))
+
+        cache.delete()
+        self.assertNotExists(self.cache_path)
+        self.assertIsNone(cache.lookup(self.root, os.stat(self.root)))
+
+    def test_walk_and_delete(self):
+        """A second walk reads no directory, and deleting invalidates"""
+        cache = ScanCache.ScanCache(self.cache_path)
+        options.set_override('scan_cache', True)
+        self.addCleanup(options.set_override, 'scan_cache', False)
+        with mock.patch.object(ScanCache, 'scan_cache', cache):
+            expected = [e.path for e in children_in_directory_entries(
+                self.root, True)]
+            self.assertEqual(sorted(expected), sorted(
+                [self.file1, self.file2, self.sub]))
+            with mock.patch('os.scandir', side_effect=AssertionError):
+                entries = list(children_in_directory_entries(self.root, True))
+            self.assertEqual([e.path for e in entries], expected)
+            file_entry = [e for e in entries if e.path == self.file1][0]
+            self.assertEqual(file_entry.lstat().st_size, 3)
+
+            with mock.patch.object(Command, 'invalidation_hooks', [cache.invalidate]):
+                list(Command.Delete(self.file2).execute(really_delete=True))
+            self.assertNotExists(self.file2)
+            self.assertIsNone(cache.lookup(self.sub, os.stat(self.sub)))
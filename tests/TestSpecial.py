@@ -381,10 +381,12 @@ class SpecialTestCase(common.BleachbitTestCase, SpecialAssertions):
         # options.set('shred', False, commit=False)
         options.set_override('shred', False)
         self.assertFalse(options.get('shred'))
-        clean_func(filename)
+        n_rows = clean_func(filename)
+        self.assertIsInstance(n_rows, int)
         options.set_override('shred', True)
         self.assertTrue(options.get('shred'))
-        clean_func(filename)
+        # The first clean deleted everything.
+        self.assertEqual(clean_func(filename), 0)
         options.set_override('shred', old_shred)
         self.assertExists(filename)
 
@@ -0,0 +1,70 @@
+# SPDX-License-Identifier: GPL-3.0-or-later
+# Copyright (c) 2008-2026 Andrew Ziem.
+#
+# This work is licensed under the terms of the GNU GPL, version 3 or
+# later.  See the COPYING file in the top-level directory.
+
+"""Unit tests for bleachbit.SqliteSession."""
+
+import os
+import sqlite3
+from unittest import mock
+
+from bleachbit import Special
+from bleachbit.FileUtilities import execute_sqlite3
+from bleachbit.SqliteSession import current_session, sqlite_session
+from tests import common
+
+
+class SqliteSessionTestCase(common.BleachbitTestCase):
+    """Tests for sharing SQLite connections"""
+
+    def setUp(self):
+        super().setUp()
+        dirname = self.mkdtemp(prefix='bleachbit-sqlite-session')
+        self.db_path = os.path.join(dirname, 'test.sqlite')
+        self.other_path = os.path.join(dirname, 'other.sqlite')
+        execute_sqlite3(self.db_path, 'create table t1 (c text);'
+                        "insert into t1 values ('a');insert into t1 values ('b')")
+        execute_sqlite3(self.other_path, 'create table t2 (c text)')
+
+    def test_session(self):
+        """Helpers share one connection per database and the table list"""
+        self.assertIsNone(current_session())
+        with sqlite_session() as session:
+            self.assertIs(current_session(), session)
+            with sqlite_session() as inner:
+                self.assertIs(inner, session)
+            self.assertTrue(Special.sqlite_table_exists(self.db_path, 't1'))
+            self.assertFalse(Special.sqlite_table_exists(self.db_path, 't2'))
+            self.assertTrue(Special.sqlite_table_exists(self.other_path, 't2'))
+            self.assertEqual(sorted(Special._get_sqlite_values(
+                self.db_path, 'select c from t1')), [('a',), ('b',)])
+            self.assertEqual(session.n_opened, 2)
+
+            # Writing replaces the read-only connection once.
+            with mock.patch('bleachbit.FileUtilities.bleachbit.General.gc_collect') as gc:
+                execute_sqlite3(
+                    self.db_path,
+                    f"attach database '{self.other_path}' as other;"
+                    'delete from t1 where c in (select c from other.t2);'
+                    "delete from t1 where c = 'a'")
+                execute_sqlite3(self.db_path, 'create table t3 (c text)')
+            gc.assert_not_called()
+            self.assertEqual(session.n_opened, 3)
+            self.assertTrue(Special.sqlite_table_exists(self.db_path, 't3'))
+            databases = [row[1] for row in session.connection(
+                self.db_path).execute('PRAGMA database_list')]
+            self.assertNotIn('other', databases)
+        self.assertIsNone(current_session())
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(conn.execute('select c from t1').fetchall(),
+                             [('b',)])
+
+    def test_missing_database(self):
+        """A read-only connection does not create a missing database"""
+        missing = os.path.join(os.path.dirname(self.db_path), 'missing.sqlite')
+        with sqlite_session():
+            self.assertFalse(Special.sqlite_table_exists(missing, 't1'))
+            self.assertFalse(Special._sqlite_is_valid_database(missing))
+        self.assertNotExists(missing)
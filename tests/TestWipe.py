@@ -23,6 +23,7 @@ from bleachbit.Wipe import (
     sync,
     wipe_contents,
     wipe_path,
+    wipe_paths,
     wipe_name,
     wipe_write
 )
@@ -424,7 +425,7 @@ class WipeTestCase(common.BleachbitTestCase):
         def side_effect(data):
             nonlocal call_count
             call_count += 1
-            if call_count == 1 and len(data) == 65536:
+            if call_count == 1 and len(data) == Wipe.WIPE_BLOCK_SIZE:
                 raise IOError(errno.ENOSPC, 'No space left on device')
             if call_count == 2:
                 return len(data)
@@ -436,8 +437,37 @@ class WipeTestCase(common.BleachbitTestCase):
         self.assertGreaterEqual(mock_file.write.call_count, 2)
         first_call_len = len(mock_file.write.call_args_list[0][0][0])
         second_call_len = len(mock_file.write.call_args_list[1][0][0])
-        self.assertEqual(first_call_len, 65536)
-        self.assertEqual(second_call_len, 32768)
+        self.assertEqual(first_call_len, Wipe.WIPE_BLOCK_SIZE)
+        self.assertEqual(second_call_len, Wipe.WIPE_BLOCK_SIZE // 2)
+
+    def test_wipe_path_vfat_max_file_size(self):
+        """On vfat, the last block stops at the maximum file size"""
+        mock_file = self._make_mock_file()
+        mock_file.write.side_effect = len
+        max_size = 3 * Wipe.WIPE_BLOCK_SIZE + 100
+        with self._wipe_path_common_mocks(fs_type='vfat'), \
+                mock.patch('bleachbit.Wipe.VFAT_MAX_FILE_SIZE', max_size), \
+                mock.patch('bleachbit.Wipe.tempfile.NamedTemporaryFile', return_value=mock_file):
+            list(wipe_path(self.tempdir))
+        sizes = [len(call.args[0]) for call in mock_file.write.call_args_list]
+        self.assertEqual(sizes, [Wipe.WIPE_BLOCK_SIZE] * 3 + [100])
+
+    @common.skipIfWindows
+    def test_set_direct_io(self):
+        """Unit test for _set_direct_io()"""
+        # pylint: disable=protected-access
+        filename = self.write_file('direct_io', b'')
+        with open(filename, 'wb', buffering=0) as f:
+            if not hasattr(os, 'O_DIRECT'):
+                self.assertFalse(Wipe._set_direct_io(f, True))
+                return
+            import fcntl
+            if Wipe._set_direct_io(f, True):
+                self.assertTrue(fcntl.fcntl(f.fileno(), fcntl.F_GETFL) & os.O_DIRECT)
+            self.assertFalse(Wipe._set_direct_io(f, False))
+            self.assertFalse(fcntl.fcntl(f.fileno(), fcntl.F_GETFL) & os.O_DIRECT)
+        mock_file = self._make_mock_file()
+        self.assertFalse(Wipe._set_direct_io(mock_file, True))
 
     def test_wipe_path_write_persistent_edquot(self):
         """Persistent EDQUOT (even at 1-byte blocks) stops the outer loop.
@@ -573,3 +603,55 @@ class WipeTestCase(common.BleachbitTestCase):
         mock_file.close.assert_called_once()
         stack.delete_mock.assert_called_once_with(
             mock_file.name, ignore_missing=True)
+
+    def test_wipe_paths(self):
+        """Paths on different devices are wiped at the same time"""
+        dirs = [self.mkdtemp(prefix='bleachbit-wipe-paths') for _i in range(3)]
+        devices = {dirs[0]: 1, dirs[1]: 2, dirs[2]: 2}
+        calls = []
+
+        def fake_stat(path):
+            return mock.Mock(st_dev=devices[path])
+
+        def fake_wipe_path(pathname, idle=False):
+            calls.append(pathname)
+            yield (1, 0.5, 10 * len(calls))
+            yield (1, 1.0, 0)
+
+        with mock.patch('bleachbit.Wipe.os.stat', side_effect=fake_stat), \
+                mock.patch('bleachbit.Wipe.wipe_path', side_effect=fake_wipe_path):
+            results = [ret for ret in wipe_paths(dirs, idle=True)
+                       if ret is not True]
+        self.assertEqual(sorted(calls), sorted(dirs))
+        # Paths on one device are wiped in order.
+        self.assertLess(calls.index(dirs[1]), calls.index(dirs[2]))
+        self.assertGreater(len(results), 0)
+        for (phase, percent, _eta) in results:
+            self.assertEqual(phase, 1)
+            self.assertGreaterEqual(percent, 0)
+            self.assertLessEqual(percent, 1)
+        self.assertEqual(results[-1], (1, 1.0, 0))
+
+        # An error in one device is raised after the others stop.
+        def failing_wipe_path(pathname, idle=False):
+            if devices[pathname] == 2:
+                raise OSError(errno.EIO, 'Input/output error')
+            yield (1, 1.0, 0)
+
+        with mock.patch('bleachbit.Wipe.os.stat', side_effect=fake_stat), \
+                mock.patch('bleachbit.Wipe.wipe_path', side_effect=failing_wipe_path):
+            with self.assertRaises(OSError):
+                list(wipe_paths(dirs, idle=True))
+
+    def test_wipe_paths_one_device(self):
+        """Paths on one device are wiped in the calling thread"""
+        dirs = [self.mkdtemp(prefix='bleachbit-wipe-paths') for _i in range(2)]
+        with mock.patch('bleachbit.Wipe.os.stat', return_value=mock.Mock(st_dev=1)), \
+                mock.patch('bleachbit.Wipe.threading.Thread') as mock_thread, \
+                mock.patch('bleachbit.Wipe.wipe_path',
+                           side_effect=lambda path, idle: iter([(1, 1.0, 0)])) as mock_wipe:
+            self.assertEqual(list(wipe_paths(dirs, idle=True)),
+                             [(1, 1.0, 0), (1, 1.0, 0)])
+        mock_thread.assert_not_called()
+        self.assertEqual(mock_wipe.call_args_list,
+                         [mock.call(dirs[0], True), mock.call(dirs[1], True)])
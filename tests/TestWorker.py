@@ -13,15 +13,17 @@ import errno
 import os
 import sqlite3
 import tempfile
+import threading
 from unittest import mock
 
 from tests import TestCleaner, common
 from tests.TestFileUtilities import _open_blocking_handle
 import bleachbit
-from bleachbit import CLI, Command, FileUtilities
+from bleachbit import CLI, Command, FileUtilities, General
 from bleachbit.Action import ActionProvider
 from bleachbit.Cleaner import backends
-from bleachbit.Worker import Worker
+from bleachbit.Worker import BackgroundWorker, Worker, _coalesce, \
+    independent_groups, vacuum_lanes
 
 if bleachbit.IS_WINDOWS:
     import win32con
@@ -282,12 +284,12 @@ class WorkerTestCase(common.BleachbitTestCase):
         real_getsize = FileUtilities.getsize
         call_count = [0]
 
-        def vanishing_getsize(path):
+        def vanishing_getsize(path, lstat_result=None):
             call_count[0] += 1
             if call_count[0] == 1:
                 raise FileNotFoundError(
                     errno.ENOENT, 'No such file or directory', path)
-            return real_getsize(path)
+            return real_getsize(path, lstat_result)
 
         try:
             with mock.patch('bleachbit.FileUtilities.getsize',
@@ -429,3 +431,186 @@ class WorkerTestCase(common.BleachbitTestCase):
         self.assertEqual(worker.total_special, 0)
         self.assertEqual(worker.total_errors, 0)
         self.assertEqual(worker.total_deleted, 2)
+
+    def test_independent_groups(self):
+        """Unit test for independent_groups()"""
+        dir1 = self.mkdtemp(prefix='bleachbit-test-worker')
+        dir2 = self.mkdtemp(prefix='bleachbit-test-worker')
+        astr1 = '<action command="delete" search="walk.files" path="%s"/>' % dir1
+        astr2 = '<action command="delete" search="glob" path="%s/*"/>' % dir1
+        astr3 = '<action command="delete" search="walk.files" path="%s"/>' % dir2
+        backends['test1'] = TestCleaner.action_to_cleaner(astr1)
+        backends['test2'] = TestCleaner.action_to_cleaner(astr2)
+        backends['test3'] = TestCleaner.action_to_cleaner(astr3)
+        # A function has no known paths, so it cannot run in parallel.
+        backends['test4'] = TestCleaner.action_to_cleaner(
+            '<action command="function.plain" path="%s"/>' % dir2)
+        try:
+            operations = {'test1': ['option1'], 'test2': ['option1'],
+                          'test3': ['option1'], 'test4': ['option1']}
+            (groups, serial) = independent_groups(operations)
+        finally:
+            for key in ('test1', 'test2', 'test3', 'test4'):
+                del backends[key]
+        self.assertEqual(sorted(sorted(g) for g in groups),
+                         [['test1', 'test2'], ['test3']])
+        self.assertEqual(serial, ['test4'])
+
+    def test_independent_groups_cleanerml(self):
+        """independent_groups() with cleaners loaded from CleanerML"""
+        import bleachbit.CleanerML
+        list(bleachbit.CleanerML.load_cleaners())
+        # These options only delete files, so their paths are known.
+        operations = {cleaner_id: ['cache']
+                      for cleaner_id in ('chromium', 'firefox', 'thunderbird')
+                      if cleaner_id in backends}
+        if len(operations) < 2:
+            self.skipTest('browser cleaners are not available')
+        (groups, serial) = independent_groups(operations)
+        self.assertEqual(serial, [])
+        self.assertEqual(sorted(sum(groups, [])), sorted(operations))
+        self.assertGreater(len(groups), 1)
+
+    def test_parallel(self):
+        """Test Worker cleaning independent cleaners in threads"""
+        filenames = []
+        for i in range(4):
+            dirname = self.mkdtemp(prefix='bleachbit-test-worker')
+            filename = self.write_file(os.path.join(dirname, 'file'), b'123')
+            filenames.append(filename)
+            astr = '<action command="delete" search="walk.files" path="%s"/>' % dirname
+            backends['test%d' % i] = TestCleaner.action_to_cleaner(astr)
+        operations = {'test%d' % i: ['option1'] for i in range(4)}
+        try:
+            for really_delete in (False, True):
+                ui = mock.Mock()
+                worker = Worker(ui, really_delete,
+                                dict(operations), max_workers=3)
+                run = worker.run()
+                while next(run):
+                    pass
+                self.assertEqual(worker.total_errors, 0)
+                self.assertEqual(worker.total_deleted, 4)
+                self.assertGreater(worker.total_bytes, 0)
+                item_sizes = [c.args for c in ui.update_item_size.call_args_list
+                              if c.args[1] == 'option1']
+                self.assertEqual(len(item_sizes), 4)
+                ui.worker_done.assert_called_once_with(worker, really_delete)
+        finally:
+            for i in range(4):
+                del backends['test%d' % i]
+        for filename in filenames:
+            self.assertNotExists(filename)
+
+    def test_vacuum(self):
+        """Test Worker vacuuming several databases at once"""
+        dirname = self.mkdtemp(prefix='bleachbit-test-worker')
+        paths = []
+        for i in range(3):
+            path = os.path.join(dirname, 'test%d.sqlite' % i)
+            FileUtilities.execute_sqlite3(
+                path, [('create table t (s)', ())] +
+                [('insert into t values (?)', ('x' * 1000,))] * 100)
+            FileUtilities.execute_sqlite3(path, 'delete from t')
+            paths.append(path)
+        old_size = sum(os.path.getsize(path) for path in paths)
+        astr = '<action command="sqlite.vacuum" search="glob" path="%s/*.sqlite"/>' % dirname
+        backends['test'] = TestCleaner.action_to_cleaner(astr)
+        try:
+            ui = mock.Mock()
+            worker = Worker(ui, True, {'test': ['option1']})
+            run = worker.run()
+            while next(run):
+                pass
+        finally:
+            del backends['test']
+        self.assertEqual(worker.total_errors, 0)
+        self.assertEqual(worker.total_special, 3)
+        new_size = sum(os.path.getsize(path) for path in paths)
+        self.assertEqual(worker.total_bytes, old_size - new_size)
+        self.assertGreater(worker.total_bytes, 0)
+        # The recovered space is added to the size of the option.
+        ui.update_item_size.assert_any_call('test', 'option1', worker.total_bytes)
+        ui.update_item_size.assert_any_call('test', -1, worker.total_bytes)
+
+    def test_vacuum_lanes(self):
+        """Unit test for vacuum_lanes()"""
+        dirname = self.mkdtemp(prefix='bleachbit-test-worker')
+        vacuums = []
+        for i in range(5):
+            path = self.write_file(os.path.join(dirname, str(i)), b'')
+            vacuums.append((Command.Function(
+                path, FileUtilities.vacuum_sqlite3, 'Vacuum'), 'test.option1'))
+        # The files are on one device, so they share two lanes.
+        lanes = vacuum_lanes(vacuums, per_device=2)
+        self.assertEqual(lanes, [vacuums[0::2], vacuums[1::2]])
+        self.assertEqual(vacuum_lanes(vacuums[:1], per_device=2), [vacuums[:1]])
+
+    def test_BackgroundWorker(self):
+        """Test running a Worker in a thread and draining its events"""
+        dirname = self.mkdtemp(prefix='bleachbit-test-worker')
+        filename = self.write_file(os.path.join(dirname, 'file'), b'123')
+        astr = '<action command="delete" search="walk.files" path="%s"/>' % dirname
+        backends['test'] = TestCleaner.action_to_cleaner(astr)
+        self.addCleanup(backends.pop, 'test')
+        for really_delete in (False, True):
+            ui = mock.Mock()
+            worker = BackgroundWorker(ui, really_delete, {'test': ['option1']})
+            worker.run_to_end()
+            self.assertEqual(worker.worker.total_deleted, 1)
+            self.assertEqual(worker.worker.total_errors, 0)
+            self.assertIn(filename, ''.join(
+                c.args[0] for c in ui.append_text.call_args_list))
+            ui.update_item_size.assert_any_call('test', 'option1', mock.ANY)
+            # The UI gets the object it knows.
+            ui.worker_done.assert_called_once_with(worker, really_delete)
+            self.assertFalse(worker.drain())
+        self.assertNotExists(filename)
+
+    def test_BackgroundWorker_main_thread(self):
+        """Functions for the main thread run there, and errors propagate"""
+        calls = []
+
+        def in_main_thread():
+            calls.append(threading.current_thread())
+            return 0
+
+        def function_cleaner():
+            return General.call_in_main_thread(in_main_thread)
+
+        cleaner = TestCleaner.action_to_cleaner(
+            '<action command="delete" search="file" path="/nonexistent"/>')
+        with mock.patch.object(cleaner, 'get_commands', return_value=[
+                Command.Function(None, function_cleaner, 'Test')]):
+            backends['test'] = cleaner
+            self.addCleanup(backends.pop, 'test')
+            worker = BackgroundWorker(mock.Mock(), True, {'test': ['option1']})
+            worker.run_to_end()
+        self.assertEqual(calls, [threading.main_thread()])
+        self.assertEqual(worker.worker.total_special, 1)
+
+        with mock.patch.object(Worker, 'run', side_effect=RuntimeError('test')):
+            worker = BackgroundWorker(mock.Mock(), False, {'test': ['option1']})
+            with self.assertRaises(RuntimeError):
+                worker.run_to_end()
+        # Without a background worker, the call is direct.
+        self.assertEqual(General.call_in_main_thread(len, 'abc'), 3)
+
+    def test_coalesce(self):
+        """Test merging queued UI events"""
+        events = [('append_text', ('a',)),
+                  ('append_text', ('b',)),
+                  ('append_text', ('c', 'error')),
+                  ('append_text', ('d', 'error')),
+                  ('update_progress_bar', (0.1,)),
+                  ('update_progress_bar', (0.2,)),
+                  ('update_item_size', ('test', 'option1', 1)),
+                  ('update_item_size', ('test', 'option2', 2)),
+                  ('append_text', ('e',))]
+        self.assertEqual(_coalesce(events),
+                         [('append_text', ('ab',)),
+                          ('append_text', ('cd', 'error')),
+                          ('update_progress_bar', (0.2,)),
+                          ('update_item_size', ('test', 'option1', 1)),
+                          ('update_item_size', ('test', 'option2', 2)),
+                          ('append_text', ('e',))])